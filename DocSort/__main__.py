@@ -0,0 +1,48 @@
+"""
+Command line entry point: python -m DocSort
+
+Django is set up inside main() rather than at import time. The extractor
+processes are spawned, and a spawned child skips re-importing a package's
+__main__ module, so they never load settings, apps or a database connection.
+"""
+import argparse
+import os
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m DocSort", description="Upload and catalog bulk PDF dumps from the media folders.")
+    parser.add_argument("--extract-workers", type=int, default=None, help="Processes parsing PDFs (default: one per CPU)")
+    parser.add_argument("--upload-workers", type=int, default=8, help="Concurrent Cloudinary uploads")
+    parser.add_argument("--queue-size", type=int, default=32, help="Jobs buffered between pipeline stages")
+    parser.add_argument("--convert-workers", type=int, default=2, help="LibreOffice instances converting Office files at once")
+    parser.add_argument("--convert-batch-size", type=int, default=25, help="Office files handed to one soffice run")
+    parser.add_argument("--convert-timeout", type=int, default=120, help="Seconds allowed per Office file before it is quarantined")
+    parser.add_argument("--nursing", action="store_true", help="Sort the Nursing folder instead of the unsorted dumps")
+    parser.add_argument("--program-folder", type=Path, help="Sort a folder of per-unit subfolders, matched against the catalogued unit titles")
+    parser.add_argument("--min-score", type=float, default=85, help="Lowest fuzzy score (0-100) accepted when matching folders to unit titles")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "KuStudyhub.settings")
+    import django
+    django.setup()
+    from DocSort.office_convert import OfficeConverter
+    from DocSort.sort_pdfs import (
+        QUARANTINE_FOLDER, Sort_Nursing_Files, Sort_Program_Files, catalog_unit_titles, clean_database, sort_pdfs,
+    )
+
+    pipeline_options = dict(extract_workers=args.extract_workers, upload_workers=args.upload_workers, queue_size=args.queue_size)
+    converter = OfficeConverter(QUARANTINE_FOLDER, workers=args.convert_workers, batch_size=args.convert_batch_size, timeout=args.convert_timeout)
+    if args.nursing:
+        Sort_Nursing_Files(converter, min_score=args.min_score, **pipeline_options)
+    elif args.program_folder:
+        Sort_Program_Files(args.program_folder, catalog_unit_titles(), converter, min_score=args.min_score, **pipeline_options)
+    else:
+        sort_pdfs(converter, **pipeline_options)
+        clean_database()
+    # correct_available_units()
+    # clean_units_column()
+
+
+if __name__ == "__main__":
+    main()
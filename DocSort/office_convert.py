@@ -0,0 +1,125 @@
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+OFFICE_SUFFIXES = {".doc", ".docx", ".ppt", ".pptx"}
+
+
+def is_office_file(path):
+    return path.suffix.lower() in OFFICE_SUFFIXES
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class OfficeConverter:
+    """
+    Converts Office documents to PDF with as few soffice start-ups as possible.
+
+    Files are sent to soffice in batches (one process converts up to batch_size
+    files from the same folder), and up to `workers` batches run at once. Each
+    worker owns a private LibreOffice profile directory so concurrent instances
+    never fight over the shared user profile. A batch that times out or leaves
+    files unconverted is retried one file at a time; files that still fail are
+    moved to the quarantine folder so they do not stall the next run.
+    `timeout` is in seconds per file, so a batch of n files gets n * timeout.
+    """
+
+    def __init__(self, quarantine_folder, workers=2, batch_size=25, timeout=120, soffice="soffice"):
+        self.quarantine_folder = Path(quarantine_folder)
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.soffice = soffice
+        self._free_profiles = []
+        self._lock = threading.Lock()
+
+    def convert(self, files):
+        """Convert files to PDFs next to them; returns {input path: output path}, omitting failures"""
+        files = [Path(f) for f in files]
+        if not files:
+            return {}
+        if shutil.which(self.soffice) is None:
+            raise RuntimeError(f"LibreOffice ({self.soffice}) is not installed; cannot convert {len(files)} Office file(s)")
+        batches = []
+        by_folder = defaultdict(list)
+        for f in files:
+            by_folder[f.parent].append(f)
+        for folder_files in by_folder.values():
+            for start in range(0, len(folder_files), self.batch_size):
+                batches.append(folder_files[start:start + self.batch_size])
+
+        profiles = [Path(tempfile.mkdtemp(prefix="soffice-profile-")) for _ in range(min(self.workers, len(batches)))]
+        self._free_profiles = list(profiles)
+        converted = {}
+        try:
+            with ThreadPoolExecutor(max_workers=len(profiles)) as pool:
+                for batch_result in pool.map(self._convert_batch, batches):
+                    converted.update(batch_result)
+        finally:
+            for profile in profiles:
+                shutil.rmtree(profile, ignore_errors=True)
+        print(f"Converted {len(converted)} of {len(files)} Office files to PDF")
+        return converted
+
+    def _convert_batch(self, batch):
+        with self._lock:
+            profile = self._free_profiles.pop()
+        try:
+            before = {f: _mtime(f.with_suffix(".pdf")) for f in batch}
+            self._run_soffice(profile, batch)
+            converted = {f: f.with_suffix(".pdf") for f in batch if _mtime(f.with_suffix(".pdf")) != before[f]}
+            leftovers = [f for f in batch if f not in converted]
+            if leftovers and len(batch) > 1:
+                # One bad file can stall or crash a whole batch; give the rest their own run.
+                for f in leftovers:
+                    if self._run_soffice(profile, [f]) and _mtime(f.with_suffix(".pdf")) != before[f]:
+                        converted[f] = f.with_suffix(".pdf")
+            for f in batch:
+                if f not in converted:
+                    self.quarantine(f)
+            return converted
+        finally:
+            with self._lock:
+                self._free_profiles.append(profile)
+
+    def _run_soffice(self, profile, batch):
+        command = [
+            self.soffice,
+            f"-env:UserInstallation={profile.as_uri()}",
+            "--headless", "--norestore",
+            "--convert-to", "pdf",
+            "--outdir", str(batch[0].parent),
+            *[str(f) for f in batch],
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+        try:
+            _, stderr = process.communicate(timeout=self.timeout * len(batch))
+        except subprocess.TimeoutExpired:
+            # soffice forks helpers; kill the whole session so none outlive the timeout
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            print(f"soffice timed out converting {len(batch)} file(s) in {batch[0].parent}")
+            return False
+        if process.returncode != 0:
+            print(f"soffice failed ({process.returncode}) in {batch[0].parent}: {stderr.decode(errors='replace').strip()}")
+            return False
+        return True
+
+    def quarantine(self, f):
+        self.quarantine_folder.mkdir(parents=True, exist_ok=True)
+        destination = self.quarantine_folder / f.name
+        if destination.exists():
+            destination = self.quarantine_folder / f"{f.stem}_{os.getpid()}_{id(f)}{f.suffix}"
+        shutil.move(str(f), destination)
+        print(f"Quarantined {f.name}: could not convert to PDF")
@@ -0,0 +1,136 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from core.pdf_inspector import direct_code_extraction, inspect_pdf
+
+# Keep this module free of Django imports: extractor processes import it to
+# unpickle _extract and should stay cheap to start.
+
+_DONE = object()
+
+
+@dataclass
+class SortJob:
+    pdf_file: Path
+    unit_code: str = None  # fixed code for folder-sorted files; detected from the file otherwise
+    unit_title: str = None
+
+
+@dataclass
+class SortResult:
+    job: SortJob
+    inspection: object = None
+    unit_code: str = None
+    url: str = None
+    already_listed: bool = False
+    error: str = None
+
+
+def _extract(pdf_file, known_codes, detect_code, rewrite):
+    return inspect_pdf(pdf_file, known_codes=known_codes, detect_code=detect_code, thumbnail=True, rewrite=rewrite)
+
+
+def _finished(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class SortPipeline:
+    """
+    Runs sort jobs through three stages connected by bounded queues:
+
+        extract (process pool) -> resolve + upload (thread pool) -> record (caller's thread)
+
+    fitz parsing happens in extract_workers processes while up to upload_workers
+    uploads are in flight, and each queue holds at most queue_size jobs so a
+    slow stage holds back the ones before it instead of buffering the whole run.
+    Content that is already stored, or already being uploaded in this run, is
+    not uploaded again.
+    """
+
+    def __init__(self, writer, upload, extract_workers=None, upload_workers=8, queue_size=32, known_codes=None, rewrite=None):
+        self.writer = writer
+        self.known_codes = known_codes
+        self.rewrite = rewrite
+        self.upload = upload
+        self.extract_workers = extract_workers
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+
+    def run(self, jobs, on_result):
+        """Process jobs, calling on_result(SortResult) from this thread as each one finishes"""
+        extracted = queue.Queue(maxsize=self.queue_size)
+        uploading = queue.Queue(maxsize=self.queue_size)
+        # spawn rather than fork: forked children would inherit, and on exit close, our DB connection
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.extract_workers, mp_context=context) as extract_pool, \
+                ThreadPoolExecutor(self.upload_workers) as upload_pool:
+            feeder = threading.Thread(target=self._feed, args=(jobs, extract_pool, extracted), daemon=True)
+            resolver = threading.Thread(target=self._resolve, args=(extracted, upload_pool, uploading), daemon=True)
+            feeder.start()
+            resolver.start()
+            while True:
+                item = uploading.get()
+                if item is _DONE:
+                    break
+                result, upload_future = item
+                try:
+                    result.url = upload_future.result()
+                    if not result.url:
+                        result.error = "Upload failed"
+                except Exception as e:
+                    result.error = f"Upload failed: {e}"
+                on_result(result)
+            feeder.join()
+            resolver.join()
+
+    def _feed(self, jobs, extract_pool, extracted):
+        try:
+            for job in jobs:
+                # Only read page text for a code when neither the folder nor the filename gives one
+                detect_code = not (job.unit_code or direct_code_extraction(job.pdf_file.name))
+                extracted.put((job, extract_pool.submit(_extract, job.pdf_file, self.known_codes, detect_code, self.rewrite)))
+        finally:
+            extracted.put(_DONE)
+
+    def _resolve(self, extracted, upload_pool, uploading):
+        in_flight = {}
+        try:
+            while True:
+                item = extracted.get()
+                if item is _DONE:
+                    break
+                job, extract_future = item
+                result = SortResult(job=job)
+                try:
+                    result.inspection = extract_future.result()
+                except Exception as e:
+                    result.error = f"Could not read PDF: {e}"
+                    uploading.put((result, _finished(None)))
+                    continue
+
+                result.unit_code = job.unit_code or direct_code_extraction(job.pdf_file.name) or result.inspection.unit_code
+                if not result.unit_code:
+                    result.error = "Could not determine unit code"
+                    uploading.put((result, _finished(None)))
+                    continue
+
+                content_hash = result.inspection.content_hash
+                url, result.already_listed = self.writer.stored_link(content_hash, result.unit_code)
+                if url:
+                    upload_future = _finished(url)
+                elif content_hash in in_flight:
+                    upload_future, units = in_flight[content_hash]
+                    result.already_listed = result.unit_code in units
+                    units.add(result.unit_code)
+                else:
+                    upload_future = upload_pool.submit(self.upload, result.inspection.upload_source(str(job.pdf_file)), result.unit_code)
+                    in_flight[content_hash] = (upload_future, {result.unit_code})
+                uploading.put((result, upload_future))
+        finally:
+            uploading.put(_DONE)
@@ -1,50 +1,26 @@
-import os
 import re
-import fitz
 from pathlib import Path
 from django.conf import settings
-import django
 from datetime import date
 import cloudinary.uploader
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "KuStudyhub.settings")  # Update with your project name
-django.setup()
 from core.models import UnitProfile, UnitPdf
-import subprocess
+from DocSort.pipeline import SortJob, SortPipeline
+from DocSort.office_convert import OfficeConverter, is_office_file
+from DocSort.unit_matcher import UnitMatcher, clean_text
+from core.ingest import bulk_create_unit_pdfs, pdf_rewrite_options, units_by_code
+from core.search import index_documents, unit_pdf_document
+from core.previews import store_thumbnails
+from core.unit_codes import known_unit_codes
+from django.db import transaction
 import sys
-from thefuzz import process
 
 UNSORTED_FOLDER=Path(settings.BASE_DIR)/"media"/'unsorted_pdfs'
 SORTED_FOLDER=Path(settings.BASE_DIR)/"media"/'sorted_pdfs'
 INDIVIDUAL_FOLDER=Path(settings.BASE_DIR)/"media"/'individual_uploads'
 NURSING_FOLDER=Path(settings.BASE_DIR)/"media"/'Nursing'
+QUARANTINE_FOLDER=Path(settings.BASE_DIR)/"media"/'quarantine'
 
 SORTED_FOLDER.mkdir(exist_ok=True,parents=True)
-UNIT_CODE_PATTERN = r'([A-Za-z]{3,4})\s*[_-]?\s*(\d{3})'
-
-def direct_code_extraction(fileName):
-    match = re.search(r'([A-Za-z]{3,4})[\s_-]?(\d{3})', fileName)
-    if match:
-        return f"{match.group(1).upper()}{match.group(2)}"
-    return None
-
-def extract_text_inside_pdf(pdfPath):
-    try:
-        pdfDoc = fitz.open(pdfPath)
-        text = ""
-        for page_num in range(min(3, pdfDoc.page_count)):
-            page = pdfDoc[page_num]
-            text += page.get_text()
-        pdfDoc.close()
-        return text
-    except Exception as e:
-        return None
-def extract_unit_code_from_pdf(pdfPath):
-    try:
-        text = extract_text_inside_pdf(pdfPath)
-        return direct_code_extraction(text)
-    except Exception as e:
-        return None
-    
 def upload_pdf_to_cloudinary(pdfPath,folder_name):
     try:
         response=cloudinary.uploader.upload(
@@ -56,23 +32,85 @@ def upload_pdf_to_cloudinary(pdfPath,folder_name):
     except Exception as e:
         print(f"Cloudinary upload failed: {e}")
         return None
-def extract_pdf_page_count(pdfPath):
-    try:
-        pdfDoc = fitz.open(pdfPath)
-        page_count = pdfDoc.page_count
-        pdfDoc.close()
-        return page_count
-    except Exception as e:
-        return None
-    
-def convert_to_pdf(input_file):
-    output_file=str(input_file.with_suffix(".pdf"))
+class UnitPdfWriter:
+    """
+    Buffers new UnitPdf rows and writes them with bulk_create in batches, so a
+    run costs a handful of queries instead of several per file. Content hashes
+    already in the catalog are loaded once up front for deduplication.
+    """
+    def __init__(self,batch_size=200):
+        self.batch_size=batch_size
+        self.pending=[]
+        self.stored={}
+        self.bytes_saved=0
+        stored=UnitPdf.objects.exclude(contentHash=None).exclude(pdfDownloadLink=None).values_list("contentHash","unit__unitCode","pdfDownloadLink")
+        for content_hash,unit_code,link in stored:
+            self.stored.setdefault(content_hash,{})[unit_code]=link
+
+    def stored_link(self,content_hash,unit_code):
+        """Returns (download link or None, already listed in this unit)"""
+        stored=self.stored.get(content_hash)
+        if not stored:
+            return None,False
+        return stored.get(unit_code) or next(iter(stored.values())),unit_code in stored
+
+    def add(self,unit_code,unit_title,pdf_file,inspection,download_link):
+        self.stored.setdefault(inspection.content_hash,{})[unit_code]=download_link
+        self.bytes_saved+=inspection.bytes_saved
+        self.pending.append((unit_code,unit_title,inspection,UnitPdf(
+            pdfTitle=pdf_file.stem,
+            pdfDownloadLink=download_link,
+            pdfSize=inspection.stored_size_kb,
+            pdfBytesSaved=inspection.bytes_saved,
+            pdfPageCount=inspection.page_count,
+            pdfDate=date.today(),
+            contentHash=inspection.content_hash
+        )))
+        if len(self.pending)>=self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with transaction.atomic():
+            units=units_by_code((code for code,_,_,_ in self.pending),{code:title for code,title,_,_ in self.pending})
+            rows=[]
+            for unit_code,_,_,unit_pdf in self.pending:
+                unit_pdf.unit=units[unit_code]
+                rows.append(unit_pdf)
+            created=bulk_create_unit_pdfs(rows,batch_size=self.batch_size)
+            index_documents([unit_pdf_document(unit_pdf,inspection.full_text) for unit_pdf,(_,_,inspection,_) in zip(created,self.pending)])
+            store_thumbnails(inspection for _,_,inspection,_ in self.pending)
+        print(f"Saved {len(rows)} PDF records")
+        self.pending=[]
+
+def record_sort_result(writer,result):
+    """Queue the record for a finished pipeline job and move its file into SORTED_FOLDER"""
+    pdf_file=result.job.pdf_file
+    if result.error:
+        print(f"Skipping {pdf_file.name}: {result.error}")
+        return
+    if not result.already_listed:
+        writer.add(result.unit_code,result.job.unit_title or result.unit_code,pdf_file,result.inspection,result.url)
+    unit_folder=SORTED_FOLDER/result.unit_code
+    unit_folder.mkdir(exist_ok=True,parents=True)
+    pdf_file.rename(unit_folder/pdf_file.name)
+    print(f"Uploaded and stored {pdf_file.name} to {result.unit_code}")
+
+def run_sort_pipeline(jobs,extract_workers=None,upload_workers=8,queue_size=32):
+    writer=UnitPdfWriter()
+    pipeline=SortPipeline(writer,upload_pdf_to_cloudinary,extract_workers,upload_workers,queue_size,known_unit_codes(),pdf_rewrite_options())
     try:
-        subprocess.run(["soffice", "--headless", "--convert-to", "pdf", str(input_file), "--outdir", str(input_file.parent)], check=True)
-        return output_file 
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to convert {input_file}: {e}")
-        return None
+        pipeline.run(jobs,lambda result: record_sort_result(writer,result))
+    finally:
+        writer.flush()
+        print(f"Optimization saved {writer.bytes_saved/1024/1024:.1f} MB of storage")
+
+def convert_office_files(files,converter=None):
+    """Convert Office documents to PDFs in place, deleting each original once its PDF exists"""
+    converter=converter or OfficeConverter(QUARANTINE_FOLDER)
+    for office_file in converter.convert(files):
+        office_file.unlink()
 
 #Remove all units with more than 6 letters
 def clean_database():
@@ -83,59 +121,13 @@ def clean_database():
         UnitPdf.objects.filter(unit=unit).delete()
         unit.delete()
         print(f"Deleted {unit.unitCode}")
-def sort_pdfs():
-    for file in UNSORTED_FOLDER.glob("*"):
-        if file.suffix.lower() in [".doc", ".docx", ".ppt", ".pptx"]:
-            new_pdf = convert_to_pdf(file)
-            if new_pdf:
-                file.unlink() 
-    for pdf_file in UNSORTED_FOLDER.glob("*.[Pp][Dd][Ff]"):
-        unit_Code=direct_code_extraction(pdf_file.name)
-        print(pdf_file.name)
-
-        if not unit_Code:
-            unit_Code=extract_unit_code_from_pdf(pdf_file)
-        
-        if unit_Code:
-            unit_folder=SORTED_FOLDER/unit_Code
-            unit_folder.mkdir(exist_ok=True,parents=True)
-            cloudinary_url=upload_pdf_to_cloudinary(str(pdf_file),unit_Code)
-
-            if cloudinary_url:
-                unit,created=UnitProfile.objects.get_or_create(unitCode=unit_Code,defaults={"unitTitle":unit_Code})
-                UnitPdf.objects.create(
-                    unit=unit,
-                    pdfTitle=pdf_file.stem,
-                    pdfDownloadLink=cloudinary_url,
-                    pdfSize=os.path.getsize(pdf_file)//1024,
-                    pdfPageCount=extract_pdf_page_count(pdf_file),
-                    pdfDate=date.today()
-                )
-
-            sorted_pdf_path=unit_folder/pdf_file.name
-            pdf_file.rename(sorted_pdf_path)
-            print(f"Uploaded and stored {pdf_file.name} to {unit_Code}")
-
+def sort_pdfs(converter=None,**pipeline_options):
+    convert_office_files([file for file in UNSORTED_FOLDER.glob("*") if is_office_file(file)],converter)
+    jobs=[SortJob(pdf_file) for pdf_file in UNSORTED_FOLDER.glob("*.[Pp][Dd][Ff]")]
     for folder in INDIVIDUAL_FOLDER.iterdir():
-        for pdf_file in folder.glob("*.pdf"):
-            unit_Code=folder.name
-            if unit_Code:
-                unit_folder=SORTED_FOLDER/unit_Code
-                unit_folder.mkdir(exist_ok=True,parents=True)
-                cloudinary_url=upload_pdf_to_cloudinary(str(pdf_file),unit_Code)
-                if cloudinary_url:
-                    unit,created=UnitProfile.objects.get_or_create(unitCode=unit_Code,defaults={"unitTitle":unit_Code})
-                    UnitPdf.objects.create(
-                        unit=unit,
-                        pdfTitle=pdf_file.stem,
-                        pdfDownloadLink=cloudinary_url,
-                        pdfSize=os.path.getsize(pdf_file)//1024,
-                        pdfPageCount=extract_pdf_page_count(pdf_file),
-                        pdfDate=date.today()
-                    )
-                sorted_pdf_path=unit_folder/pdf_file.name
-                pdf_file.rename(sorted_pdf_path)
-                print(f"Uploaded and stored {pdf_file.name} to {unit_Code}")
+        jobs.extend(SortJob(pdf_file,unit_code=folder.name) for pdf_file in folder.glob("*.pdf"))
+    print(f"Sorting {len(jobs)} PDFs")
+    run_sort_pipeline(jobs,**pipeline_options)
 
 
 
@@ -192,14 +184,6 @@ unit_mapping = {
     "Principles of Human Psychology": "RMS 230"
 }
 
-def clean_text(text):
-    """
-    Cleans folder name by removing doctor names, underscores, special characters, and extra spaces.
-    """
-    text = re.sub(r'_.*$', '', text)  # Remove everything after first underscore
-    text = re.sub(r'[^\w\s]', '', text)  # Remove special characters
-    text = re.sub(r'\s+', ' ', text).strip().lower()  # Normalize spaces & lowercase
-    return text
 def clean_folderName(text):
     """
     Cleans folder name by removing doctor names, underscores, and extra characters.
@@ -208,54 +192,36 @@ def clean_folderName(text):
     text = re.sub(r'[^\w\s]', '', text)  # Remove special characters
     return text
 
-def Sort_Nursing_Files():
-    reverse_unit_mapping = {v: k for k, v in unit_mapping.items()}
-    
-    for folder in NURSING_FOLDER.iterdir():
-        if folder.is_dir():
-            # Try to match folder name with unit titles in unit_mapping
-            folder_name = folder.name
-            best_match = None
-            
-            # Look for direct matches in unit_mapping keys
-            for unit_title, unit_code in unit_mapping.items():
-                if unit_title.lower() in folder_name.lower() or folder_name.lower() in unit_title.lower():
-                    best_match = unit_code
-                    break
-            
-            if not best_match:
-                print(f"Could not find unit code for folder {folder.name}")
-                continue
-                
-            unit_code = best_match
-            unit_title = reverse_unit_mapping.get(unit_code, folder.name)
-            print(f"Processing folder: {folder.name} -> {unit_code} ({unit_title})")
-            
-            for file in folder.iterdir():
-                if file.suffix.lower() in [".doc", ".docx", ".ppt", ".pptx"]:
-                    new_pdf = convert_to_pdf(file)
-                    if new_pdf:
-                        file.unlink()
-
-            
-            for pdf_file in folder.glob("*.[Pp][Dd][Ff]"):
-                unit_folder = SORTED_FOLDER / unit_code
-                unit_folder.mkdir(exist_ok=True, parents=True)
-                folder_name=clean_folderName(folder.name)
-                cloudinary_url = upload_pdf_to_cloudinary(str(pdf_file), unit_code)
-                if cloudinary_url:
-                    unit, created = UnitProfile.objects.get_or_create(unitCode=unit_code,defaults={"unitTitle": unit_title})
-                    UnitPdf.objects.create(
-                        unit=unit,
-                        pdfTitle=pdf_file.stem,
-                        pdfDownloadLink=cloudinary_url,
-                        pdfSize=os.path.getsize(pdf_file) // 1024,
-                        pdfPageCount=extract_pdf_page_count(pdf_file),
-                        pdfDate=date.today()
-                    )
-                sorted_pdf_path = unit_folder / pdf_file.name
-                pdf_file.rename(sorted_pdf_path)
-                print(f"Uploaded and stored {pdf_file.name} to {unit_code}")
+def catalog_unit_titles():
+    """{unit title: unit code} for every catalogued unit that has a real title"""
+    return {title: code for code, title in UnitProfile.objects.values_list("unitCode", "unitTitle") if title and title != code}
+
+def Sort_Program_Files(program_folder, titles_to_codes, converter=None, min_score=85, **pipeline_options):
+    """Sort a program's per-unit folders, matching each folder name to a unit title"""
+    matcher = UnitMatcher(titles_to_codes, score_cutoff=min_score)
+    folders = [folder for folder in Path(program_folder).iterdir() if folder.is_dir()]
+    matched_folders = []
+    for folder, match in zip(folders, matcher.match_many(folder.name for folder in folders)):
+        if match.ambiguous:
+            rivals = ", ".join(f"{code} {title!r} ({score:.0f})" for title, code, score in match.rivals)
+            print(f"Skipping folder {folder.name}: {match.unit_code} {match.unit_title!r} ({match.score:.0f}) is too close to {rivals}")
+            continue
+        if not match.ok:
+            print(f"Could not find unit code for folder {folder.name} (best score {match.score:.0f})")
+            continue
+        print(f"Processing folder: {folder.name} -> {match.unit_code} ({match.unit_title}, score {match.score:.0f})")
+        matched_folders.append((folder, match.unit_code, match.unit_title))
+
+    # One conversion pass for every folder, so soffice runs in a few large batches
+    convert_office_files([file for folder, _, _ in matched_folders for file in folder.iterdir() if is_office_file(file)], converter)
+
+    jobs = []
+    for folder, unit_code, unit_title in matched_folders:
+        jobs.extend(SortJob(pdf_file, unit_code=unit_code, unit_title=unit_title) for pdf_file in folder.glob("*.[Pp][Dd][Ff]"))
+    run_sort_pipeline(jobs, **pipeline_options)
+
+def Sort_Nursing_Files(converter=None, **options):
+    Sort_Program_Files(NURSING_FOLDER, unit_mapping, converter, **options)
             
 
 def clean_units_column():
@@ -274,9 +240,3 @@ def correct_available_units():
             unit.unitTitle = reverse_unit_mapping[unit.unitCode]
             unit.save()
     print("Available units corrected successfully.")
-if __name__ == "__main__":
-    sort_pdfs()
-    clean_database()
-    # Sort_Nursing_Files()
-    # correct_available_units()
-    # clean_units_column()
@@ -1,3 +1,51 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .unit_matcher import UnitMatcher, clean_text
+
+TITLES = {
+    "Anatomy": "ANA 100",
+    "Anatomy II": "ANA 200",
+    "Organic Chemistry": "SCH 210",
+    "Inorganic Chemistry": "SCH 211",
+    "Calculus I": "SMA 101",
+}
+
+
+class UnitMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = UnitMatcher(TITLES)
+
+    def test_clean_text_drops_lecturer_suffix(self):
+        self.assertEqual(clean_text("Organic Chemistry_Dr. Otieno"), "organic chemistry")
+
+    def test_subset_titles_are_not_ambiguous(self):
+        anatomy, anatomy_ii = self.matcher.match_many(["Anatomy_DrX", "anatomy ii"])
+        self.assertTrue(anatomy.ok)
+        self.assertEqual(anatomy.unit_code, "ANA 100")
+        self.assertTrue(anatomy_ii.ok)
+        self.assertEqual(anatomy_ii.unit_code, "ANA 200")
+
+    def test_word_order_is_ignored(self):
+        match = self.matcher.match("Chemistry Organic")
+        self.assertEqual((match.unit_code, match.score), ("SCH 210", 100))
+
+    def test_close_rivals_make_a_match_ambiguous(self):
+        matcher = UnitMatcher(TITLES, score_cutoff=80, ambiguity_margin=10)
+        match = matcher.match("organic chemistr")
+        self.assertTrue(match.ambiguous)
+        self.assertFalse(match.ok)
+        self.assertEqual([code for _, code, _ in match.rivals], ["SCH 211"])
+
+    def test_rivals_for_the_same_unit_are_ignored(self):
+        matcher = UnitMatcher({"Calculus I": "SMA 101", "Calculus 1": "SMA 101"}, score_cutoff=80)
+        match = matcher.match("Calculus I")
+        self.assertTrue(match.ok)
+
+    def test_unmatched_names_report_their_best_score(self):
+        match = self.matcher.match("Calc")
+        self.assertIsNone(match.unit_code)
+        self.assertGreater(match.score, 0)
+        self.assertLess(match.score, self.matcher.score_cutoff)
+
+    def test_no_titles(self):
+        self.assertEqual(UnitMatcher({}).match("Anatomy").unit_code, None)
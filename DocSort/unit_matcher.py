@@ -0,0 +1,86 @@
+import re
+from dataclasses import dataclass
+
+from rapidfuzz import fuzz, process
+
+
+def clean_text(text):
+    """
+    Cleans folder name by removing doctor names, underscores, special characters, and extra spaces.
+    """
+    text = re.sub(r'_.*$', '', text)  # Remove everything after first underscore
+    text = re.sub(r'[^\w\s]', '', text)  # Remove special characters
+    text = re.sub(r'\s+', ' ', text).strip().lower()  # Normalize spaces & lowercase
+    return text
+
+
+@dataclass
+class UnitMatch:
+    """Best unit for one folder or file name"""
+    name: str
+    unit_code: str = None
+    unit_title: str = None
+    score: float = 0.0
+    # Other units that scored within the ambiguity margin of the best one, as (title, code, score)
+    rivals: tuple = ()
+
+    @property
+    def ambiguous(self):
+        return bool(self.rivals)
+
+    @property
+    def ok(self):
+        return self.unit_code is not None and not self.ambiguous
+
+
+class UnitMatcher:
+    """
+    Fuzzy-matches names against a {unit title: unit code} mapping.
+
+    Titles are cleaned once up front; match_many scores every name against
+    every title in a single RapidFuzz cdist call. A name matches when its best
+    score reaches score_cutoff, and is ambiguous when a different unit scores
+    within ambiguity_margin of it, in which case no unit should be assumed.
+
+    The default scorer ignores word order but, unlike token_set_ratio, does not
+    give 100 to a title whose words are a subset of the name's, so "Anatomy"
+    and "Anatomy II" stay apart.
+    """
+
+    def __init__(self, titles_to_codes, score_cutoff=85, ambiguity_margin=5, scorer=fuzz.token_sort_ratio):
+        self.titles = list(titles_to_codes)
+        self.codes = [titles_to_codes[title] for title in self.titles]
+        self.choices = [clean_text(title) for title in self.titles]
+        self.score_cutoff = score_cutoff
+        self.ambiguity_margin = ambiguity_margin
+        self.scorer = scorer
+
+    def match(self, name):
+        return self.match_many([name])[0]
+
+    def match_many(self, names):
+        """UnitMatch for each name, in order"""
+        names = list(names)
+        if not names or not self.choices:
+            return [UnitMatch(name) for name in names]
+        # No score_cutoff: it would zero the scores below it, and unmatched names
+        # should still report how close they came
+        scores = process.cdist(
+            [clean_text(name) for name in names],
+            self.choices,
+            scorer=self.scorer,
+            workers=-1,
+        )
+        return [self._best(name, row) for name, row in zip(names, scores)]
+
+    def _best(self, name, row):
+        best = int(row.argmax())
+        score = float(row[best])
+        if score < self.score_cutoff:
+            return UnitMatch(name, score=score)
+        rivals = tuple(
+            (self.titles[i], self.codes[i], float(row[i]))
+            for i in (row >= score - self.ambiguity_margin).nonzero()[0]
+            if i != best and self.codes[i] != self.codes[best]
+        )
+        return UnitMatch(name, self.codes[best], self.titles[best], score, rivals)
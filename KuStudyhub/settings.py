@@ -84,6 +84,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'KuStudyhub.wsgi.application'
+# The Procfile serves this with uvicorn workers; the WSGI app still works for sync deployments
+ASGI_APPLICATION = 'KuStudyhub.asgi.application'
 
 
 # Database
@@ -96,7 +98,9 @@ if DATABASE_URL:
     DATABASES = {
         'default': dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
+            # Async views run their queries in per-request threads, so persistent
+            # connections are not reused under ASGI; keep this at 0 there
+            conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', '0')),
             ssl_require=True
         )
     }
@@ -149,6 +153,86 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache
+# Use Redis when available so catalog invalidations reach every dyno; the
+# per-process fallback only sees invalidations made in the same process and
+# relies on CATALOG_CACHE_TIMEOUT to pick up changes from elsewhere.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a built /api/units/ or unit PDF list stays in the server cache
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', '300'))
+# Seconds browsers may reuse a catalog response before revalidating with its ETag
+CATALOG_BROWSER_MAX_AGE = int(os.environ.get('CATALOG_BROWSER_MAX_AGE', '0'))
+
+# Page size for ?cursor=/?limit= pagination on the catalog APIs, and its upper bound
+CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', '50'))
+CATALOG_PAGE_SIZE_MAX = int(os.environ.get('CATALOG_PAGE_SIZE_MAX', '200'))
+
+# Seconds a unit code detected in a PDF's text is remembered, by content hash
+UNIT_CODE_CACHE_TIMEOUT = int(os.environ.get('UNIT_CODE_CACHE_TIMEOUT', str(30 * 24 * 3600)))
+
+# Most units /api/units/search/ returns for one typeahead query
+UNIT_SEARCH_LIMIT = int(os.environ.get('UNIT_SEARCH_LIMIT', '20'))
+
+# Rewrite uploaded PDFs as linearized ("fast web view") files so the reader can show page 1 from a range request
+PDF_LINEARIZE = os.environ.get('PDF_LINEARIZE', 'True').lower() == 'true'
+# Optimize uploads: drop unused objects, recompress streams, and resample images scanned above the DPI threshold
+PDF_OPTIMIZE = os.environ.get('PDF_OPTIMIZE', 'True').lower() == 'true'
+PDF_IMAGE_DPI_THRESHOLD = int(os.environ.get('PDF_IMAGE_DPI_THRESHOLD', '200'))
+PDF_IMAGE_DPI_TARGET = int(os.environ.get('PDF_IMAGE_DPI_TARGET', '150'))
+PDF_IMAGE_QUALITY = int(os.environ.get('PDF_IMAGE_QUALITY', '75'))
+
+# Disk cache for PDF previews and rendered pages; least recently used entries are evicted past the limit
+PREVIEW_CACHE_DIR = os.environ.get('PREVIEW_CACHE_DIR') or str(BASE_DIR / 'cache' / 'previews')
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Seconds browsers may keep a preview image
+PREVIEW_MAX_AGE = int(os.environ.get('PREVIEW_MAX_AGE', str(365 * 24 * 3600)))
+# Server-rendered reader pages: requested DPIs are clamped to MIN..MAX and rounded to STEP
+PAGE_RENDER_DPI = int(os.environ.get('PAGE_RENDER_DPI', '110'))
+PAGE_RENDER_DPI_MIN = int(os.environ.get('PAGE_RENDER_DPI_MIN', '50'))
+PAGE_RENDER_DPI_MAX = int(os.environ.get('PAGE_RENDER_DPI_MAX', '200'))
+PAGE_RENDER_DPI_STEP = int(os.environ.get('PAGE_RENDER_DPI_STEP', '25'))
+PAGE_RENDER_QUALITY = int(os.environ.get('PAGE_RENDER_QUALITY', '70'))
+
+# Seconds between writes of the in-memory PDF view/download counts to the database
+PDF_COUNTER_FLUSH_INTERVAL = int(os.environ.get('PDF_COUNTER_FLUSH_INTERVAL', '60'))
+
+# Disk cache of stored PDFs behind /files/<id>, also used as the page renderer's source copy
+FILE_CACHE_DIR = os.environ.get('FILE_CACHE_DIR') or str(BASE_DIR / 'cache' / 'files')
+FILE_CACHE_MAX_BYTES = int(os.environ.get('FILE_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# Disk cache for per-unit ZIP bundles (/api/unit/<id>/bundle.zip)
+BUNDLE_CACHE_DIR = os.environ.get('BUNDLE_CACHE_DIR') or str(BASE_DIR / 'cache' / 'bundles')
+BUNDLE_CACHE_MAX_BYTES = int(os.environ.get('BUNDLE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+# Source PDFs downloaded at once while a bundle is built, and 256 KB chunks each may buffer ahead
+BUNDLE_FETCH_CONCURRENCY = int(os.environ.get('BUNDLE_FETCH_CONCURRENCY', '4'))
+BUNDLE_PREFETCH_CHUNKS = int(os.environ.get('BUNDLE_PREFETCH_CHUNKS', '8'))
+
+# Service worker: the cache version defaults to a digest of the static files and templates
+SW_CACHE_VERSION = os.environ.get('SW_CACHE_VERSION', '')
+SW_PDF_CACHE_MAX_BYTES = int(os.environ.get('SW_PDF_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+# Seconds a cached catalog response is served before the worker refreshes it in the background
+SW_API_REVALIDATE_AFTER = int(os.environ.get('SW_API_REVALIDATE_AFTER', '300'))
+
+# Results per /api/search/ request, and the most a client may ask for with ?limit=
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', '20'))
+SEARCH_PAGE_SIZE_MAX = int(os.environ.get('SEARCH_PAGE_SIZE_MAX', '50'))
+# Exam papers are indexed from their first pages only; question papers rarely need more
+EXAM_TEXT_MAX_PAGES = int(os.environ.get('EXAM_TEXT_MAX_PAGES', '20'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -164,8 +248,38 @@ cloudinary.config(
     api_key=CLOUDINARY_STORAGE['API_KEY'],
     api_secret=CLOUDINARY_STORAGE['API_SECRET']
 )
-django_heroku.settings(locals())
+# Point the Cloudinary client at another API host, e.g. `manage.py fake_storage_server` during development
+if os.environ.get('CLOUDINARY_UPLOAD_PREFIX'):
+    cloudinary.config(upload_prefix=os.environ['CLOUDINARY_UPLOAD_PREFIX'])
+# DATABASES is built from DATABASE_URL above; letting django_heroku redo it would reset conn_max_age to 600
+django_heroku.settings(locals(), databases=False)
 B2_APPLICATION_KEY_ID = os.environ.get('BACKBLAZE_APPLICATION_KEY_ID', '')
 B2_APPLICATION_KEY = os.environ.get('BACKBLAZE_APPLICATION_KEY', '')
 B2_BUCKET_NAME = os.environ.get('BACKBLAZE_BUCKET_NAME', '')
-B2_UPLOAD_FOLDER = os.environ.get('BACKBLAZE_BUCKET_FOLDER', 'uploads/')
\ No newline at end of file
+B2_UPLOAD_FOLDER = os.environ.get('BACKBLAZE_BUCKET_FOLDER', 'uploads/')
+# B2 realm to authorize against: 'production' or the URL of another B2-compatible API such as the fake storage server
+B2_REALM = os.environ.get('BACKBLAZE_REALM', 'production')
+# Maximum number of Cloudinary uploads kept in flight by the batch upload endpoint
+CLOUDINARY_UPLOAD_CONCURRENCY = int(os.environ.get('CLOUDINARY_UPLOAD_CONCURRENCY', '8'))
+
+# Queue uploads for `manage.py process_upload_jobs` instead of processing them inside the request.
+# Only turn this on with a running worker and REDIS_URL set: the worker's catalog invalidations must
+# reach the web processes (check core.W001)
+UPLOAD_JOBS_ENABLED = os.environ.get('UPLOAD_JOBS_ENABLED', 'False').lower() == 'true'
+# Where queued uploads wait for the worker: 'b2' (under UPLOAD_STAGING_FOLDER in the exam bucket) or
+# 'disk' (UPLOAD_STAGING_DIR; only when the web and worker processes share a filesystem)
+UPLOAD_STAGING = os.environ.get('UPLOAD_STAGING', 'b2')
+UPLOAD_STAGING_FOLDER = os.environ.get('UPLOAD_STAGING_FOLDER', 'staging/')
+UPLOAD_STAGING_DIR = os.environ.get('UPLOAD_STAGING_DIR') or str(BASE_DIR / 'cache' / 'uploads')
+# Size of the pooled HTTP connection pool used by the shared B2 client
+B2_HTTP_POOL_SIZE = int(os.environ.get('BACKBLAZE_HTTP_POOL_SIZE', '10'))
+# Exam papers at or above this size use B2's large-file API with parts uploaded in parallel
+B2_LARGE_FILE_THRESHOLD = int(os.environ.get('BACKBLAZE_LARGE_FILE_THRESHOLD', str(20 * 1024 * 1024)))
+B2_UPLOAD_PART_SIZE = int(os.environ.get('BACKBLAZE_UPLOAD_PART_SIZE', str(10 * 1024 * 1024)))
+B2_UPLOAD_WORKERS = int(os.environ.get('BACKBLAZE_UPLOAD_WORKERS', '4'))
+
+# Browsers upload files straight to Cloudinary/B2 with signed parameters and then finalize them
+DIRECT_UPLOADS_ENABLED = os.environ.get('DIRECT_UPLOADS_ENABLED', 'True').lower() == 'true'
+# Seconds an upload ticket stays valid between signing and finalizing
+DIRECT_UPLOAD_TTL = int(os.environ.get('DIRECT_UPLOAD_TTL', '900'))
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get('DIRECT_UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
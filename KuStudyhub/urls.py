@@ -18,12 +18,12 @@ from django.contrib import admin
 from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.generic import TemplateView
 from django.urls import re_path
 from django.views.static import serve
+from core import views as core_views
 
 urlpatterns = [
-    path('sw.js', TemplateView.as_view(template_name="sw.js", content_type="application/javascript")),
+    path('sw.js', core_views.service_worker, name='service_worker'),
     path('', include('core.urls')),
     path('api/',include('core.urls'))
 ]
@@ -0,0 +1,141 @@
+import logging
+import threading
+import uuid
+
+import requests
+from b2sdk.v2 import B2Api, B2HttpApiConfig, InMemoryAccountInfo, UploadSourceBytes, UploadSourceLocalFile, WriteIntent
+from b2sdk.v2.exception import B2Error
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# B2 rejects large-file parts smaller than this, except for the last one
+B2_MIN_PART_SIZE = 5 * 1000 * 1000
+
+
+class B2Client:
+    """
+    A B2 API handle shared by every request in the process. It authorizes on
+    first use and caches bucket handles; b2sdk re-authorizes with the stored
+    application key whenever the account token expires, so the handle never
+    has to be rebuilt.
+    """
+
+    def __init__(self, key_id, key, pool_size=10, upload_workers=4, realm="production"):
+        self.key_id = key_id
+        self.key = key
+        self.pool_size = pool_size
+        self.upload_workers = upload_workers
+        self.realm = realm
+        self._api = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _http_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def api(self):
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    logger.info("Authorizing B2 account.")
+                    # decode_content=True keeps our pooled adapter; otherwise b2sdk swaps in its own.
+                    api = B2Api(
+                        InMemoryAccountInfo(),
+                        max_upload_workers=self.upload_workers,
+                        api_config=B2HttpApiConfig(http_session_factory=self._http_session, decode_content=True),
+                    )
+                    api.authorize_account(self.realm, self.key_id, self.key)
+                    self._api = api
+        return self._api
+
+    def get_bucket(self, bucket_name):
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self.api.get_bucket_by_name(bucket_name)
+            self._buckets[bucket_name] = bucket
+        return bucket
+
+    def single_file_upload_url(self, bucket, file_name, valid_seconds):
+        """
+        An upload URL and token that can only write file_name (or names starting with
+        it), from a throwaway application key restricted to that name and expiring
+        after valid_seconds. Returns (upload target, key id); delete the key with
+        delete_key once the upload is finished. Needs the writeKeys capability.
+        """
+        key = self.api.create_key(
+            ['writeFiles'], f"upload-{uuid.uuid4().hex}",
+            valid_duration_seconds=valid_seconds, bucket_id=bucket.id_, name_prefix=file_name,
+        )
+        try:
+            scoped = B2Api(InMemoryAccountInfo(), api_config=B2HttpApiConfig(http_session_factory=self._http_session, decode_content=True))
+            scoped.authorize_account(self.realm, key.id_, key.application_key)
+            return scoped.session.get_upload_url(bucket.id_), key.id_
+        except Exception:
+            self.delete_key(key.id_)
+            raise
+
+    def delete_key(self, key_id):
+        """Delete an application key made by single_file_upload_url; a key that is already gone is ignored"""
+        try:
+            self.api.delete_key_by_id(key_id)
+        except B2Error as e:
+            logger.warning(f"Could not delete B2 upload key {key_id}: {e}")
+
+    def reset(self):
+        """Drop the authorization and cached buckets so the next call starts fresh"""
+        with self._lock:
+            self._api = None
+            self._buckets = {}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_b2_client():
+    """Return the process-wide B2Client built from settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = B2Client(
+                    settings.B2_APPLICATION_KEY_ID,
+                    settings.B2_APPLICATION_KEY,
+                    pool_size=settings.B2_HTTP_POOL_SIZE,
+                    upload_workers=settings.B2_UPLOAD_WORKERS,
+                    realm=settings.B2_REALM,
+                )
+    return _client
+
+
+def upload_file_to_b2(bucket, f, file_name, content_type):
+    """
+    Upload a Django UploadedFile without reading it into memory. Files Django
+    spooled to disk are streamed from their temporary path; those at or above
+    B2_LARGE_FILE_THRESHOLD go through the large-file API, with parts of
+    B2_UPLOAD_PART_SIZE uploaded in parallel by the client's upload workers.
+    """
+    if hasattr(f, 'temporary_file_path'):
+        source = UploadSourceLocalFile(f.temporary_file_path())
+    else:
+        # Below FILE_UPLOAD_MAX_MEMORY_SIZE the upload is already held in memory.
+        f.seek(0)
+        source = UploadSourceBytes(f.read())
+
+    if source.get_content_length() >= settings.B2_LARGE_FILE_THRESHOLD:
+        logger.info(f"Uploading {file_name} as a B2 large file ({source.get_content_length()} bytes)")
+        return bucket.create_file(
+            [WriteIntent(source)],
+            file_name,
+            content_type=content_type,
+            recommended_upload_part_size=settings.B2_UPLOAD_PART_SIZE,
+            min_part_size=min(settings.B2_UPLOAD_PART_SIZE, B2_MIN_PART_SIZE),
+        )
+    return bucket.upload(source, file_name, content_type=content_type)
@@ -0,0 +1,155 @@
+import logging
+import queue
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .disk_cache import DiskLRUCache
+from .storage import iter_unit_pdf_bytes
+
+logger = logging.getLogger(__name__)
+
+_bundle_cache = None
+_DONE = object()
+
+
+def bundle_cache():
+    """The process-wide disk cache that finished unit bundles are served from"""
+    global _bundle_cache
+    if _bundle_cache is None:
+        _bundle_cache = DiskLRUCache(settings.BUNDLE_CACHE_DIR, settings.BUNDLE_CACHE_MAX_BYTES)
+    return _bundle_cache
+
+
+def bundle_key(unit_id, unit_pdfs):
+    """
+    Changes whenever the unit's PDF list does: keyed by the latest pdfDate, plus
+    the count and newest id since several PDFs can be added on the same day.
+    """
+    latest = max(unit_pdf.pdfDate for unit_pdf in unit_pdfs)
+    return f"bundle:{unit_id}:{latest.isoformat()}:{len(unit_pdfs)}:{max(unit_pdf.id for unit_pdf in unit_pdfs)}"
+
+
+def _entry_names(unit_pdfs):
+    """A unique, filesystem-safe .pdf name for every PDF, in order"""
+    seen = {}
+    for unit_pdf in unit_pdfs:
+        stem = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', unit_pdf.pdfTitle or '').strip(' .') or f"pdf-{unit_pdf.id}"
+        if stem.lower().endswith('.pdf'):
+            stem = stem[:-4]
+        count = seen.get(stem.lower(), 0) + 1
+        seen[stem.lower()] = count
+        yield f"{stem}.pdf" if count == 1 else f"{stem} ({count}).pdf"
+
+
+class _Prefetch:
+    """
+    Downloads one PDF on a pool thread into a bounded queue, so a few files can be
+    fetched ahead of the one being written without buffering any of them whole.
+    """
+
+    def __init__(self, unit_pdf, stop):
+        self.unit_pdf = unit_pdf
+        self.stop = stop
+        self.queue = queue.Queue(maxsize=settings.BUNDLE_PREFETCH_CHUNKS)
+
+    def run(self):
+        try:
+            for chunk in iter_unit_pdf_bytes(self.unit_pdf):
+                if not self._put(chunk):
+                    return
+            self._put(_DONE)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while (item := self.queue.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class _ChunkBuffer:
+    """Write target for ZipFile that collects output until it is drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_bundle(unit_pdfs, key):
+    """
+    Yield a ZIP of unit_pdfs as it is built, fetching up to BUNDLE_FETCH_CONCURRENCY
+    sources at once. Entries are stored uncompressed (PDFs barely deflate) and
+    written as their bytes arrive. The archive is also written to the bundle cache
+    under key, and kept only if it completes with every file.
+    """
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=settings.BUNDLE_FETCH_CONCURRENCY, thread_name_prefix="bundle")
+    fetches = [_Prefetch(unit_pdf, stop) for unit_pdf in unit_pdfs]
+    for fetch in fetches:
+        pool.submit(fetch.run)
+
+    cached = bundle_cache().writer(key)
+    buffer = _ChunkBuffer()
+
+    def drain():
+        chunks = buffer.drain()
+        for chunk in chunks:
+            cached.write(chunk)
+        return chunks
+
+    missing = []
+    try:
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for name, fetch in zip(_entry_names(unit_pdfs), fetches):
+                source = iter(fetch)
+                try:
+                    first = next(source, b"")
+                except Exception as e:
+                    # Nothing of this file is in the archive yet, so leave it out and carry on
+                    logger.warning(f"Could not fetch PDF {fetch.unit_pdf.id} for a bundle: {e}")
+                    missing.append(name)
+                    continue
+                with archive.open(name, "w") as entry:
+                    entry.write(first)
+                    for chunk in source:
+                        entry.write(chunk)
+                        yield from drain()
+                yield from drain()
+            if missing:
+                archive.writestr("MISSING.txt", "These files could not be downloaded:\n" + "\n".join(missing) + "\n")
+        yield from drain()
+    except BaseException:
+        cached.abort()
+        raise
+    else:
+        if missing:
+            cached.abort()
+        else:
+            cached.commit()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+VERSION_KEY = "catalog:version:{scope}"
+ENTRY_KEY = "catalog:{scope}:{version}:{variant}"
+
+
+def units_scope():
+    return "units"
+
+
+def unit_scope(unit_id):
+    return f"unit:{unit_id}"
+
+
+def scope_version(scope):
+    """Timestamp of the last change to scope; also used as its Last-Modified"""
+    key = VERSION_KEY.format(scope=scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), None)
+        version = cache.get(key)
+    return version
+
+
+async def ascope_version(scope):
+    """scope_version for async views"""
+    key = VERSION_KEY.format(scope=scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def invalidate(*scopes):
+    """
+    Start a new version for each scope once the current transaction commits,
+    so cached responses built from older data are never served again.
+    """
+    def bump():
+        now = time.time()
+        cache.set_many({VERSION_KEY.format(scope=scope): now for scope in scopes}, None)
+    transaction.on_commit(bump)
+
+
+def json_body(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+async def acached_json_response(request, scope, build, variant=""):
+    """
+    Serve a JSON body from the cache, building it with the coroutine build() on
+    a miss. Responses carry an ETag (hash of the body) and Last-Modified (scope
+    version) so clients can revalidate with a conditional GET and get a 304.
+    """
+    version = await ascope_version(scope)
+    key = ENTRY_KEY.format(scope=scope, version=version, variant=variant)
+    entry = await cache.aget(key)
+    if entry is None:
+        body = await build()
+        entry = {"body": body, "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
+        await cache.aset(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+
+    last_modified = int(version)
+    response = get_conditional_response(request, etag=entry["etag"], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry["body"], content_type="application/json")
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_BROWSER_MAX_AGE, must_revalidate=True)
+    return response
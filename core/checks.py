@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Cache backends whose contents only the current process can see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache_for_upload_jobs(app_configs, **kwargs):
+    """
+    Queued uploads are saved by the worker process, so the catalog invalidations
+    they trigger only reach the web processes through a shared cache. With a
+    per-process cache, new uploads stay invisible for up to CATALOG_CACHE_TIMEOUT.
+    """
+    if not settings.UPLOAD_JOBS_ENABLED or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        "UPLOAD_JOBS_ENABLED needs a cache shared by the web and worker processes",
+        hint="Set REDIS_URL, or set UPLOAD_JOBS_ENABLED=False to process uploads inside the request.",
+        id='core.W001',
+    )]
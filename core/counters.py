@@ -0,0 +1,81 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, Value, When
+
+from .models import UnitPdf
+
+logger = logging.getLogger(__name__)
+
+VIEW = "viewCount"
+DOWNLOAD = "downloadCount"
+FLUSH_BATCH_SIZE = 500
+
+_pending = Counter()
+_lock = threading.Lock()
+_flusher = None
+
+
+def count(pdf_id, field, amount=1):
+    """
+    Record views or downloads of a UnitPdf in process memory. This is only a dict
+    update under a lock; a background thread writes the totals to the database
+    every PDF_COUNTER_FLUSH_INTERVAL seconds.
+    """
+    global _flusher
+    with _lock:
+        _pending[(pdf_id, field)] += amount
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_periodically, name="pdf-counters", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.PDF_COUNTER_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Could not flush PDF view/download counts: {e}")
+        finally:
+            # This thread's connection would otherwise stay open between flushes
+            connections.close_all()
+
+
+def flush():
+    """
+    Add the buffered counts to UnitPdf rows, one UPDATE per batch of PDFs.
+    Counts from batches that fail are kept for the next flush. Returns the
+    number of PDFs updated.
+    """
+    with _lock:
+        pending = _pending.copy()
+        _pending.clear()
+    by_pdf = {}
+    for (pdf_id, field), amount in pending.items():
+        by_pdf.setdefault(pdf_id, {})[field] = amount
+
+    ids = sorted(by_pdf)
+    updated = 0
+    for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+        batch = ids[start:start + FLUSH_BATCH_SIZE]
+        increments = {}
+        for field in (VIEW, DOWNLOAD):
+            cases = [When(id=pdf_id, then=Value(by_pdf[pdf_id][field])) for pdf_id in batch if field in by_pdf[pdf_id]]
+            if cases:
+                increments[field] = F(field) + Case(*cases, default=Value(0))
+        try:
+            updated += UnitPdf.objects.filter(id__in=batch).update(**increments)
+        except Exception:
+            with _lock:
+                for pdf_id in ids[start:]:
+                    for field, amount in by_pdf[pdf_id].items():
+                        _pending[(pdf_id, field)] += amount
+            raise
+    return updated
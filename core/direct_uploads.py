@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import timedelta
+
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+import requests
+from b2sdk.v2.exception import B2Error
+from django.conf import settings
+from django.core import signing
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .b2 import get_b2_client
+from .ingest import (
+    ExamStorageError, PdfUploadResult, exam_object_name, exam_paper_detail, exam_paper_fields,
+    exam_paper_text, exam_upload_response, open_exam_bucket, pdf_rewrite_options, save_uploaded_pdfs, stored_exam_paper,
+    stored_pdf_copies, upload_pdf_to_cloudinary,
+)
+from .models import ExamPaper, UsedUploadTicket
+from .pdf_inspector import direct_code_extraction, inspect_pdf
+from .search import exam_paper_document, index_documents
+from .storage import iter_url_bytes, read_b2_file_into
+from .unit_codes import UnitCodeCache, known_unit_codes
+
+logger = logging.getLogger(__name__)
+
+KIND_PDF = 'pdf'
+KIND_EXAM = 'exam'
+TICKET_SALT = 'core.direct_uploads'
+PDF_FOLDER = 'kuStudyHub'
+# What the exam upload form accepts; B2 stores the type signed here, so finalize can check it
+EXAM_CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+}
+
+
+class DirectUploadError(Exception):
+    """Raised for a sign or finalize request that cannot be honoured; carries the client-facing message"""
+
+
+def _sanitize_unit_code(code):
+    # Same rule as uploader.js applies before building its form keys
+    return re.sub(r'[^a-zA-Z0-9_-]+', '_', (code or '').strip())
+
+
+def sign_upload(kind, filename, size, unit_code=None, metadata=None):
+    """
+    Short-lived parameters that let the browser upload one file straight to storage:
+    a signed Cloudinary request for a fixed public_id, or a B2 upload URL and token
+    that can only write one object name. The returned ticket must be passed back to
+    finalize_upload with the storage response.
+    """
+    if not settings.DIRECT_UPLOADS_ENABLED:
+        raise DirectUploadError("Direct uploads are disabled")
+    if kind not in (KIND_PDF, KIND_EXAM):
+        raise DirectUploadError("kind must be 'pdf' or 'exam'")
+    if not filename:
+        raise DirectUploadError("filename is required")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise DirectUploadError("size must be an integer")
+    if not 0 < size <= settings.DIRECT_UPLOAD_MAX_BYTES:
+        raise DirectUploadError(f"Files must be between 1 byte and {settings.DIRECT_UPLOAD_MAX_BYTES} bytes")
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in (('.pdf',) if kind == KIND_PDF else EXAM_CONTENT_TYPES):
+        raise DirectUploadError(f"{extension or 'Files without an extension'} cannot be uploaded here")
+
+    ticket = {'id': uuid.uuid4().hex, 'kind': kind, 'filename': filename, 'size': size}
+    if kind == KIND_PDF:
+        folder = f"{PDF_FOLDER}/{_sanitize_unit_code(unit_code) or 'direct'}"
+        # Signing the name and format means the signature is good for this one PDF only
+        params = {
+            'public_id': f"{folder}/{uuid.uuid4().hex}",
+            'allowed_formats': 'pdf',
+            'timestamp': int(time.time()),
+        }
+        config = cloudinary.config()
+        ticket.update(unitCode=unit_code or None, publicId=params['public_id'])
+        return {
+            'provider': 'cloudinary',
+            'uploadUrl': cloudinary.utils.cloudinary_api_url('upload', resource_type='auto'),
+            'fields': dict(params, api_key=config.api_key, signature=cloudinary.utils.api_sign_request(params, config.api_secret)),
+            'ticket': signing.dumps(ticket, salt=TICKET_SALT),
+        }
+
+    sanitized_unit_code = _sanitize_unit_code(unit_code)
+    if not sanitized_unit_code:
+        raise DirectUploadError("unitCode is required for exam papers")
+    file_name = exam_object_name(sanitized_unit_code, filename)
+    try:
+        bucket = open_exam_bucket()
+        target, key_id = get_b2_client().single_file_upload_url(bucket, file_name, settings.DIRECT_UPLOAD_TTL)
+    except ExamStorageError as e:
+        raise DirectUploadError(str(e))
+    except B2Error as e:
+        logger.error(f"Could not get a B2 upload URL: {e}", exc_info=True)
+        raise DirectUploadError("Error connecting to storage service.")
+    ticket.update(
+        fileName=file_name,
+        keyId=key_id,
+        contentType=EXAM_CONTENT_TYPES[extension],
+        sanitizedCode=sanitized_unit_code,
+        originalCode=(metadata or {}).get('originalCode') or unit_code,
+        metadata=metadata or {},
+    )
+    return {
+        'provider': 'b2',
+        'uploadUrl': target['uploadUrl'],
+        'authorizationToken': target['authorizationToken'],
+        'fileName': file_name,
+        'contentType': ticket['contentType'],
+        'ticket': signing.dumps(ticket, salt=TICKET_SALT),
+    }
+
+
+def finalize_upload(ticket, upload):
+    """
+    Check a finished direct upload against its ticket and storage, returning the
+    payload complete_upload needs. A ticket can be finalized once; that is the
+    only database write here.
+    """
+    try:
+        ticket = signing.loads(ticket or '', salt=TICKET_SALT, max_age=settings.DIRECT_UPLOAD_TTL)
+    except signing.SignatureExpired:
+        raise DirectUploadError("Upload ticket has expired; request a new one")
+    except signing.BadSignature:
+        raise DirectUploadError("Invalid upload ticket")
+    if not isinstance(upload, dict):
+        raise DirectUploadError("upload must be the storage service's JSON response")
+
+    if ticket['kind'] == KIND_PDF:
+        public_id = upload.get('public_id') or ''
+        # Cloudinary signs public_id and version with our API secret, so the response cannot be forged
+        if not cloudinary.utils.verify_api_response_signature(public_id, upload.get('version'), upload.get('signature')):
+            raise DirectUploadError("Upload response signature does not match")
+        if public_id != ticket['publicId']:
+            raise DirectUploadError("Uploaded file is not the one the ticket was issued for")
+        payload = dict(ticket, url=upload['secure_url'], resourceType=upload.get('resource_type', 'image'))
+        # Cloudinary has no signed size limit, so check what was actually stored
+        size = _stored_size(payload['url'])
+        if size is not None and size > settings.DIRECT_UPLOAD_MAX_BYTES:
+            _discard_pdf(payload)
+            raise DirectUploadError(f"Files must be at most {settings.DIRECT_UPLOAD_MAX_BYTES} bytes")
+        _use_ticket(ticket)
+        return payload
+
+    try:
+        bucket = open_exam_bucket()
+    except ExamStorageError as e:
+        raise DirectUploadError(str(e))
+    try:
+        file_version = bucket.get_file_info_by_id(upload.get('fileId') or '')
+    except B2Error:
+        raise DirectUploadError("Uploaded file was not found in storage")
+    if file_version.file_name != ticket['fileName']:
+        raise DirectUploadError("Uploaded file is not the one the ticket was issued for")
+    problem = None
+    if file_version.size > settings.DIRECT_UPLOAD_MAX_BYTES:
+        problem = f"Files must be at most {settings.DIRECT_UPLOAD_MAX_BYTES} bytes"
+    elif file_version.content_type != ticket['contentType']:
+        problem = f"Uploaded file must be stored as {ticket['contentType']}"
+    if problem:
+        get_b2_client().delete_key(ticket['keyId'])
+        try:
+            bucket.delete_file_version(file_version.id_, file_version.file_name)
+        except B2Error as e:
+            logger.warning(f"Could not delete rejected upload {file_version.file_name}: {e}")
+        raise DirectUploadError(problem)
+    _use_ticket(ticket)
+    # The upload is done, so the key behind its token can go; unused keys expire with the ticket
+    get_b2_client().delete_key(ticket['keyId'])
+    return dict(ticket, fileId=file_version.id_, size=file_version.size)
+
+
+def _stored_size(url):
+    """Content-Length of a stored object, or None when its server does not send one"""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException:
+        raise DirectUploadError("Uploaded file was not found in storage")
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def _download_capped(url):
+    """An uploaded file's bytes, or None once it turns out to be over DIRECT_UPLOAD_MAX_BYTES"""
+    chunks, size = [], 0
+    for chunk in iter_url_bytes(url):
+        size += len(chunk)
+        if size > settings.DIRECT_UPLOAD_MAX_BYTES:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _use_ticket(ticket):
+    """Record a ticket as finalized, refusing one that already was"""
+    UsedUploadTicket.objects.filter(used_at__lt=timezone.now() - timedelta(seconds=settings.DIRECT_UPLOAD_TTL)).delete()
+    try:
+        # Savepoint, so a replay does not break a transaction the caller is in
+        with transaction.atomic():
+            UsedUploadTicket.objects.create(ticket_id=ticket['id'])
+    except IntegrityError:
+        raise DirectUploadError("This upload has already been finalized")
+
+
+def _discard_pdf(payload):
+    """Remove a directly uploaded Cloudinary asset that will not be listed"""
+    try:
+        cloudinary.uploader.destroy(payload['publicId'], resource_type=payload['resourceType'], invalidate=True)
+    except Exception as e:
+        logger.warning(f"Could not delete unused upload {payload['publicId']}: {e}")
+
+
+def _complete_pdf(payload, rewrite):
+    data = _download_capped(payload['url'])
+    filename = payload['filename']
+    result = PdfUploadResult(name=filename)
+    if data is None:
+        result.error = f"Files must be at most {settings.DIRECT_UPLOAD_MAX_BYTES} bytes"
+        _discard_pdf(payload)
+        return {'message': result.error, **result.as_dict()}, 413
+    filename_code = payload.get('unitCode') or direct_code_extraction(filename)
+    result.inspection = inspect_pdf(
+        None, data=data, known_codes=known_unit_codes(), code_cache=UnitCodeCache(),
+        detect_code=not filename_code, thumbnail=True, rewrite=pdf_rewrite_options() if rewrite else None,
+    )
+    result.unit_code = filename_code or result.inspection.unit_code
+    if not result.unit_code:
+        result.error = "Could not determine unit code"
+        _discard_pdf(payload)
+        return {'message': result.error, **result.as_dict()}, 422
+
+    content_hash = result.inspection.content_hash
+    stored = stored_pdf_copies([content_hash]).get(content_hash)
+    if stored:
+        result.url = stored.get(result.unit_code) or next(iter(stored.values()))
+        result.reused = True
+        result.already_listed = result.unit_code in stored
+        # Only when the stored copy is another asset; a row may already point at this one
+        if payload['url'] not in stored.values():
+            _discard_pdf(payload)
+    elif result.inspection.storage_data is not None:
+        # Store the rewritten (linearized, optimized) file in place of the one the browser sent
+        result.url = upload_pdf_to_cloudinary(result.inspection.upload_source(filename), result.unit_code)
+        if result.url:
+            _discard_pdf(payload)
+        else:
+            logger.warning(f"Could not store the rewritten copy of {payload['publicId']}; keeping the upload as sent")
+            result.inspection.storage_data = None
+            result.url = payload['url']
+    else:
+        result.url = payload['url']
+    save_uploaded_pdfs([result])
+    return {'message': 'PDF uploaded successfully', **result.as_dict()}, 201
+
+
+def _download_exam(payload):
+    """The uploaded exam paper in a local temporary file, and its SHA-256, without holding it in memory"""
+    upload = TemporaryUploadedFile(payload['filename'], payload['contentType'], payload['size'], None)
+    digest = hashlib.sha256()
+
+    def write(chunk):
+        digest.update(chunk)
+        upload.write(chunk)
+    try:
+        read_b2_file_into(payload['fileName'], write)
+        upload.flush()
+    except BaseException:
+        upload.close()
+        raise
+    return upload, digest.hexdigest()
+
+
+def _complete_exam(payload, uploader):
+    bucket = open_exam_bucket()
+    upload, content_hash = _download_exam(payload)
+    with upload:
+        return _record_exam(payload, uploader, bucket, upload, content_hash)
+
+
+def _record_exam(payload, uploader, bucket, upload, content_hash):
+    sanitized_unit_code = payload['sanitizedCode']
+    metadata = payload['metadata']
+
+    paper_fields, warnings = exam_paper_fields(metadata, payload['originalCode'], payload['filename'])
+    existing_paper = stored_exam_paper(content_hash, paper_fields)
+    if existing_paper:
+        if existing_paper.b2_file_id != payload['fileId']:
+            logger.info(f"Direct upload {payload['fileName']} duplicates {existing_paper.b2_file_path}; deleting it")
+            try:
+                bucket.delete_file_version(payload['fileId'], payload['fileName'])
+            except B2Error as e:
+                logger.warning(f"Could not delete duplicate upload {payload['fileName']}: {e}")
+        detail = exam_paper_detail(existing_paper, sanitized_unit_code, metadata, duplicate=True)
+        return exam_upload_response([detail], [])
+
+    paper = ExamPaper.objects.create(
+        **paper_fields,
+        original_filename=payload['filename'],
+        content_type=payload['contentType'],
+        size=payload['size'],
+        b2_file_path=payload['fileName'],
+        b2_file_id=payload['fileId'],
+        uploader=uploader,
+        content_hash=content_hash,
+    )
+    index_documents([exam_paper_document(paper, exam_paper_text(upload, payload['contentType']))])
+    return exam_upload_response([exam_paper_detail(paper, sanitized_unit_code, metadata)], warnings)
+
+
+def complete_upload(payload, uploader=None, rewrite=False):
+    """
+    Inspect a finalized direct upload and record it, the same way a file sent
+    through the upload endpoints would be. Returns (response payload, status).
+    Only the upload worker passes rewrite=True: storing a linearized/optimized
+    copy means uploading the file again, which a web dyno should not do. PDFs
+    recorded as sent can be converted later with rewrite_stored_pdfs.
+    """
+    if payload['kind'] == KIND_PDF:
+        return _complete_pdf(payload, rewrite)
+    return _complete_exam(payload, uploader)
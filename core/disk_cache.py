@@ -0,0 +1,163 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from filelock import FileLock, Timeout
+
+
+class DiskLRUCache:
+    """
+    Size-bounded cache of byte blobs on local disk, shared by every process
+    that points at the same directory.
+
+    Entries are files named after a hash of their key. Reads bump the file's
+    mtime, and when the directory grows past max_bytes the least recently used
+    files are deleted until it is back under 90% of the limit. Writes go to a
+    temporary file that is renamed into place, so readers never see a partial
+    entry. filling() lets one process build a missing entry while others wait
+    for it instead of building it too.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path_for(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def get_path(self, key):
+        """Path of the cached entry for key, or None; counts as a use for LRU purposes"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # Evicted by another process between the touch and the read
+            return None
+
+    def set(self, key, data):
+        return self.set_from_chunks(key, [data])
+
+    def set_from_chunks(self, key, chunks):
+        """Store an entry from an iterable of byte chunks without holding it all in memory"""
+        writer = self.writer(key)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def writer(self, key):
+        """An _EntryWriter for filling in key's entry a piece at a time"""
+        return _EntryWriter(self, key)
+
+    @contextmanager
+    def filling(self, key, timeout=120):
+        """
+        Hold key's fill lock, across threads and processes, while building its
+        entry; callers should check get_path() again once inside. If the lock
+        is not free within timeout seconds the caller proceeds without it.
+        """
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock = FileLock(path.with_name(f".lock-{path.name}"), thread_local=False)
+        try:
+            lock.acquire(timeout=timeout)
+        except Timeout:
+            yield
+            return
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def usage(self):
+        """(number of entries, total bytes) currently on disk"""
+        sizes = [size for _, size, _ in self._entries()]
+        return len(sizes), sum(sizes)
+
+    def delete(self, key):
+        self.path_for(key).unlink(missing_ok=True)
+
+    def _entries(self):
+        for path in self.directory.glob("*/*"):
+            if path.name.startswith("."):
+                continue  # .tmp- files being written and .lock- files
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rescan rather than trust the running total: other processes share the directory
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            # At worst a fill in progress loses its lock and the entry is built twice
+            path.with_name(f".lock-{path.name}").unlink(missing_ok=True)
+            total -= size
+        self._size = total
+
+
+class _EntryWriter:
+    """
+    Temporary file that becomes a cache entry on commit(). abort() discards it,
+    so an entry built while streaming is only stored if the stream completes.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.path = cache.path_for(key)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-")
+        self.file = os.fdopen(fd, "wb")
+        self.written = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.written += len(data)
+
+    def commit(self):
+        self.file.close()
+        try:
+            os.replace(self.tmp_name, self.path)
+        except BaseException:
+            Path(self.tmp_name).unlink(missing_ok=True)
+            raise
+        self.cache._added(self.written)
+        return self.path
+
+    def abort(self):
+        self.file.close()
+        Path(self.tmp_name).unlink(missing_ok=True)
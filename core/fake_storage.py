@@ -0,0 +1,328 @@
+import base64
+import hashlib
+import json
+import secrets
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import cloudinary.utils
+import fitz
+
+
+class FakeStorage:
+    """
+    In-memory stand-in for the parts of Cloudinary's upload API and B2's native
+    API this project uses, so direct uploads can be exercised end to end without
+    real accounts. File bodies are written under root; the index is lost on restart.
+    """
+
+    def __init__(self, root, base_url, cloud_name, api_key, api_secret, key_id, key, bucket_name):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+        self.cloud_name = cloud_name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.key_id = key_id
+        self.key = key
+        self.bucket_name = bucket_name
+        self.bucket_id = hashlib.sha1(bucket_name.encode()).hexdigest()[:24]
+        # Tokens map to the application key they were issued for, None for the account's own key
+        self.account_tokens = {}
+        self.upload_tokens = {}
+        self.app_keys = {}
+        self.b2_files = {}
+        self.b2_ids_by_name = {}
+        self._lock = threading.Lock()
+
+    # --- Cloudinary ---
+
+    def cloudinary_upload(self, fields, file_name, data):
+        signed = {k: v for k, v in fields.items() if k not in ('file', 'api_key', 'signature', 'resource_type', 'cloud_name')}
+        if fields.get('api_key') != self.api_key or fields.get('signature') != cloudinary.utils.api_sign_request(signed, self.api_secret):
+            return 401, {'error': {'message': 'Invalid Signature'}}
+        stem, _, ext = file_name.rpartition('.')
+        allowed_formats = [f.strip().lower() for f in fields.get('allowed_formats', '').split(',') if f.strip()]
+        if allowed_formats and ext.lower() not in allowed_formats:
+            return 400, {'error': {'message': f"{ext or 'This'} format is not allowed"}}
+        public_id = fields.get('public_id') or f"{fields.get('folder', '').strip('/')}/{stem or ext}_{secrets.token_hex(3)}".lstrip('/')
+        path = self.root / 'cloudinary' / f"{public_id}.{ext or 'bin'}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        version = int(time.time())
+        resource_type = 'image' if ext.lower() == 'pdf' else 'raw'
+        response = {
+            'public_id': public_id,
+            'version': version,
+            'signature': cloudinary.utils.api_sign_request({'public_id': public_id, 'version': version}, self.api_secret),
+            'resource_type': resource_type,
+            'format': ext.lower(),
+            'bytes': len(data),
+            # Laid out like Cloudinary's delivery URLs: <resource type>/upload/v<version>/<public_id>.<ext>
+            'secure_url': f"{self.base_url}/cloudinary/{resource_type}/upload/v{version}/{quote(public_id)}.{ext or 'bin'}",
+        }
+        if ext.lower() == 'pdf':
+            with fitz.open(stream=data, filetype='pdf') as pdfDoc:
+                response['pages'] = pdfDoc.page_count
+        return 200, response
+
+    def cloudinary_destroy(self, fields):
+        # Raw assets are destroyed by their public_id with the extension, others without it
+        public_id = fields.get('public_id', '')
+        matches = [path for path in (self.root / 'cloudinary').glob(f"{public_id}*") if path.name == Path(public_id).name or path.stem == Path(public_id).name]
+        for path in matches:
+            path.unlink()
+        return 200, {'result': 'ok' if matches else 'not found'}
+
+    # --- B2 ---
+
+    def b2_authorize(self, authorization):
+        try:
+            key_id, _, key = base64.b64decode((authorization or '').removeprefix('Basic ')).decode().partition(':')
+        except ValueError:
+            key_id, key = None, None
+        app_key = self.app_keys.get(key_id)
+        if (key_id, key) != (self.key_id, self.key) and not (app_key and app_key['applicationKey'] == key and not _expired(app_key)):
+            return 401, _b2_error(401, 'unauthorized', 'Invalid application key')
+        token = secrets.token_hex(16)
+        self.account_tokens[token] = app_key
+        return 200, {
+            'accountId': 'fakeaccount',
+            'authorizationToken': token,
+            'apiInfo': {'storageApi': {
+                'apiUrl': self.base_url,
+                'downloadUrl': self.base_url,
+                's3ApiUrl': self.base_url,
+                'recommendedPartSize': 100 * 1000 * 1000,
+                'absoluteMinimumPartSize': 5 * 1000 * 1000,
+                'bucketId': app_key and app_key['bucketId'],
+                'bucketName': app_key and self.bucket_name,
+                'capabilities': app_key['capabilities'] if app_key else ['listBuckets', 'readFiles', 'writeFiles', 'deleteFiles', 'writeKeys', 'deleteKeys'],
+                'namePrefix': app_key and app_key['namePrefix'],
+            }},
+        }
+
+    def b2_bucket(self):
+        return {
+            'accountId': 'fakeaccount',
+            'bucketId': self.bucket_id,
+            'bucketName': self.bucket_name,
+            'bucketType': 'allPrivate',
+            'bucketInfo': {},
+            'corsRules': [],
+            'lifecycleRules': [],
+            'options': [],
+            'revision': 1,
+            'defaultServerSideEncryption': {'isClientAuthorizedToRead': True, 'value': {'mode': 'none'}},
+            'fileLockConfiguration': {
+                'isClientAuthorizedToRead': True,
+                'value': {'defaultRetention': {'mode': None, 'period': None}, 'isFileLockEnabled': False},
+            },
+        }
+
+    def b2_call(self, operation, params, authorization):
+        if authorization not in self.account_tokens:
+            return 401, _b2_error(401, 'bad_auth_token', 'Invalid authorization token')
+        app_key = self.account_tokens[authorization]
+        if app_key and operation != 'b2_get_upload_url':
+            return 401, _b2_error(401, 'unauthorized', f"{operation} is not allowed for restricted keys on the fake server")
+        if operation == 'b2_list_buckets':
+            wanted = params.get('bucketName')
+            return 200, {'buckets': [self.b2_bucket()] if wanted in (None, self.bucket_name) else []}
+        if operation == 'b2_get_upload_url':
+            token = secrets.token_hex(16)
+            self.upload_tokens[token] = app_key
+            return 200, {'bucketId': self.bucket_id, 'uploadUrl': f"{self.base_url}/b2_upload/{self.bucket_id}", 'authorizationToken': token}
+        if operation == 'b2_get_file_info':
+            info = self.b2_files.get(params.get('fileId'))
+            return (200, info) if info else (404, _b2_error(404, 'not_found', 'File not present'))
+        if operation == 'b2_delete_file_version':
+            with self._lock:
+                info = self.b2_files.pop(params.get('fileId'), None)
+                if info:
+                    self.b2_ids_by_name.pop(info['fileName'], None)
+                    (self.root / 'b2' / info['fileName']).unlink(missing_ok=True)
+            return (200, {'fileId': params.get('fileId'), 'fileName': params.get('fileName')}) if info else (400, _b2_error(400, 'file_not_present', 'File not present'))
+        if operation == 'b2_create_key':
+            app_key = {
+                'accountId': 'fakeaccount',
+                'applicationKeyId': f"fake{secrets.token_hex(10)}",
+                'applicationKey': secrets.token_hex(16),
+                'keyName': params.get('keyName'),
+                'capabilities': params.get('capabilities', []),
+                'bucketId': params.get('bucketId'),
+                'namePrefix': params.get('namePrefix'),
+                'expirationTimestamp': int((time.time() + params['validDurationInSeconds']) * 1000) if params.get('validDurationInSeconds') else None,
+                'options': ['s3'],
+            }
+            self.app_keys[app_key['applicationKeyId']] = app_key
+            return 200, app_key
+        if operation == 'b2_delete_key':
+            with self._lock:
+                app_key = self.app_keys.pop(params.get('applicationKeyId'), None)
+                if app_key:
+                    # Tokens issued for a deleted key stop working with it
+                    for tokens in (self.account_tokens, self.upload_tokens):
+                        for token in [token for token, key in tokens.items() if key is app_key]:
+                            del tokens[token]
+            if app_key is None:
+                return 400, _b2_error(400, 'bad_request', 'Key not found')
+            return 200, {k: v for k, v in app_key.items() if k != 'applicationKey'}
+        return 400, _b2_error(400, 'bad_request', f"{operation} is not supported by the fake server")
+
+    def b2_upload(self, headers, data):
+        if headers.get('Authorization') not in self.upload_tokens:
+            return 401, _b2_error(401, 'bad_auth_token', 'Invalid upload token')
+        app_key = self.upload_tokens[headers['Authorization']]
+        file_name = unquote(headers.get('X-Bz-File-Name', ''))
+        if app_key and (_expired(app_key) or not file_name.startswith(app_key['namePrefix'] or '')):
+            return 401, _b2_error(401, 'unauthorized', 'Upload token is not allowed to write this file')
+        sha1 = headers.get('X-Bz-Content-Sha1', '')
+        if sha1 not in ('do_not_verify', hashlib.sha1(data).hexdigest()):
+            return 400, _b2_error(400, 'bad_request', 'Sha1 did not match data received')
+        path = self.root / 'b2' / file_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        info = {
+            'accountId': 'fakeaccount',
+            'action': 'upload',
+            'bucketId': self.bucket_id,
+            'contentLength': len(data),
+            'contentSha1': hashlib.sha1(data).hexdigest(),
+            'contentType': headers.get('Content-Type', 'application/octet-stream'),
+            'fileId': f"4_z{self.bucket_id}_{secrets.token_hex(12)}",
+            'fileInfo': {},
+            'fileName': file_name,
+            'fileRetention': {'isClientAuthorizedToRead': True, 'value': {'mode': None, 'retainUntilTimestamp': None}},
+            'legalHold': {'isClientAuthorizedToRead': True, 'value': None},
+            'serverSideEncryption': {'mode': 'none'},
+            'uploadTimestamp': int(time.time() * 1000),
+        }
+        with self._lock:
+            self.b2_files[info['fileId']] = info
+            self.b2_ids_by_name[file_name] = info['fileId']
+        return 200, info
+
+    def b2_download(self, file_name):
+        info = self.b2_files.get(self.b2_ids_by_name.get(file_name))
+        if info is None:
+            return None, None
+        return info, (self.root / 'b2' / file_name).read_bytes()
+
+
+def _expired(app_key):
+    return app_key['expirationTimestamp'] is not None and app_key['expirationTimestamp'] < time.time() * 1000
+
+
+def _b2_error(status, code, message):
+    return {'status': status, 'code': code, 'message': message}
+
+
+def _multipart(headers, body):
+    """Form fields and the uploaded (file name, bytes) of a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + body
+    )
+    fields, upload = {}, (None, b"")
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if part.get_filename():
+            upload = (part.get_filename(), part.get_payload(decode=True))
+        else:
+            fields[name] = part.get_payload(decode=True).decode()
+    return fields, upload
+
+
+class FakeStorageHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeStorage/1.0'
+
+    @property
+    def storage(self):
+        return self.server.storage
+
+    def _send(self, status, body, content_type='application/json', extra_headers=None):
+        data = json.dumps(body).encode() if content_type == 'application/json' else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', '*')
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _fields(self, body):
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            return _multipart(self.headers, body)
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or b'{}'), (None, b"")
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}, (None, b"")
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.end_headers()
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        body = self._body()
+        if len(parts) == 4 and parts[0] == 'v1_1' and parts[3] in ('upload', 'destroy'):
+            fields, (file_name, data) = self._fields(body)
+            if parts[3] == 'upload':
+                return self._send(*self.storage.cloudinary_upload(fields, file_name or 'upload.bin', data))
+            return self._send(*self.storage.cloudinary_destroy(fields))
+        if parts[0] == 'b2_upload':
+            return self._send(*self.storage.b2_upload(self.headers, body))
+        if len(parts) == 3 and parts[0] == 'b2api':
+            return self._b2_api(parts[2], json.loads(body or b'{}'))
+        self._send(404, {'error': f"No fake endpoint for POST {url.path}"})
+
+    def _b2_api(self, operation, params):
+        if operation == 'b2_authorize_account':
+            return self._send(*self.storage.b2_authorize(self.headers.get('Authorization')))
+        return self._send(*self.storage.b2_call(operation, params, self.headers.get('Authorization')))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'b2api':
+            return self._b2_api(parts[2], {k: v[0] for k, v in parse_qs(url.query).items()})
+        if parts[0] == 'cloudinary' and len(parts) > 4 and parts[2] == 'upload':
+            path = self.storage.root / 'cloudinary' / unquote('/'.join(parts[4:]))
+            if path.is_file():
+                return self._send(200, path.read_bytes(), 'application/pdf' if path.suffix == '.pdf' else 'application/octet-stream')
+        if parts[0] == 'file' and len(parts) > 2:
+            info, data = self.storage.b2_download(unquote('/'.join(parts[2:])))
+            if info:
+                return self._send(200, data, info['contentType'], {
+                    'x-bz-file-id': info['fileId'],
+                    'x-bz-file-name': quote(info['fileName']),
+                    'x-bz-content-sha1': info['contentSha1'],
+                    'x-bz-upload-timestamp': str(info['uploadTimestamp']),
+                    'Accept-Ranges': 'bytes',
+                })
+        self._send(404, {'error': f"No fake endpoint or file for GET {url.path}"})
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        self.server.log(f"{self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+
+def make_server(storage, host, port, log=print):
+    server = ThreadingHTTPServer((host, port), FakeStorageHandler)
+    server.storage = storage
+    server.log = log
+    return server
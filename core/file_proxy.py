@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .disk_cache import DiskLRUCache
+from .pdf_inspector import first_page_end
+from .storage import iter_response, iter_unit_pdf_bytes, open_url, read_url_range
+
+logger = logging.getLogger(__name__)
+
+HIT = "hit"
+MISS = "miss"
+STATS_KEY = "file_cache:{outcome}:{field}"
+LINEARIZATION_HEAD_BYTES = 1024
+FIRST_PAGE_MAX_BYTES = 4 * 1024 * 1024
+
+_file_cache = None
+_warmer = None
+_warming = set()
+_warming_lock = threading.Lock()
+
+
+def file_cache():
+    """The process-wide disk cache of stored PDFs, shared by /files/ and the page renderer"""
+    global _file_cache
+    if _file_cache is None:
+        _file_cache = DiskLRUCache(settings.FILE_CACHE_DIR, settings.FILE_CACHE_MAX_BYTES)
+    return _file_cache
+
+
+def document_key(unit_pdf):
+    """
+    Identity of a UnitPdf's stored file: its content hash and its link. A file
+    rewritten in place of the original (rewrite_stored_pdfs) has a new link, so it
+    gets new cache keys and ETags rather than reusing those of the old bytes.
+    """
+    return hashlib.sha256(f"{unit_pdf.contentHash or ''}:{unit_pdf.pdfDownloadLink}".encode()).hexdigest()
+
+
+def file_key(unit_pdf):
+    return f"pdf:{document_key(unit_pdf)}"
+
+
+def source_pdf_path(unit_pdf):
+    """
+    Local copy of a UnitPdf's stored file, downloaded into the file cache on first
+    use. Concurrent misses for the same file wait for a single download.
+    """
+    disk = file_cache()
+    key = file_key(unit_pdf)
+    path = disk.get_path(key)
+    if path is None:
+        with disk.filling(key):
+            path = disk.get_path(key) or disk.set_from_chunks(key, iter_unit_pdf_bytes(unit_pdf))
+    return path
+
+
+def first_page_bytes(unit_pdf):
+    """
+    The first-page section of a linearized stored PDF, fetched with range requests
+    so page 1 can be rendered without downloading the whole file. None when the
+    file is not linearized, the section is large, or the source ignores ranges.
+    """
+    url = unit_pdf.pdfDownloadLink
+    head = read_url_range(url, 0, LINEARIZATION_HEAD_BYTES - 1)
+    if head is None:
+        return None
+    end = first_page_end(head)
+    if end is None or end > FIRST_PAGE_MAX_BYTES:
+        return None
+    if end <= len(head):
+        return head[:end]
+    rest = read_url_range(url, len(head), end - 1)
+    return None if rest is None else head + rest
+
+
+def record_request(outcome, nbytes):
+    """Count a /files/ request served from the disk cache (hit) or from the source (miss)"""
+    for field, amount in (("requests", 1), ("bytes", nbytes)):
+        key = STATS_KEY.format(outcome=outcome, field=field)
+        cache.add(key, 0, None)
+        cache.incr(key, amount)
+
+
+def file_cache_stats():
+    """Hit/miss counters since the last reset, and what the disk cache holds now"""
+    stats = {
+        f"{outcome}_{field}": cache.get(STATS_KEY.format(outcome=outcome, field=field), 0)
+        for outcome in (HIT, MISS) for field in ("requests", "bytes")
+    }
+    total = stats["hit_requests"] + stats["miss_requests"]
+    stats["hit_ratio"] = stats["hit_requests"] / total if total else 0.0
+    stats["cached_files"], stats["cached_bytes"] = file_cache().usage()
+    return stats
+
+
+def reset_file_cache_stats():
+    cache.delete_many([STATS_KEY.format(outcome=outcome, field=field) for outcome in (HIT, MISS) for field in ("requests", "bytes")])
+
+
+def _fill_cache(unit_pdf, first, rest):
+    writer = file_cache().writer(file_key(unit_pdf))
+    sent = 0
+    try:
+        for chunk in chain([first], rest):
+            writer.write(chunk)
+            sent += len(chunk)
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    else:
+        writer.commit()
+    finally:
+        rest.close()
+        record_request(MISS, sent)
+
+
+@dataclass
+class SourceFetch:
+    """A PDF, or one byte range of it, being streamed from its source"""
+    status: int
+    chunks: object
+    # Bytes in chunks when the source said; None otherwise
+    length: int = None
+    # Content-Range of a 206 or 416 from the source
+    content_range: str = None
+
+
+def _content_length(response):
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def stream_into_cache(unit_pdf, range_header=None):
+    """
+    Fetch a PDF from its source. The whole file (also when the source ignores
+    range_header) streams through the file cache and is kept once all of it has
+    passed. A range the source honours is passed through as it is, and the
+    whole file is fetched into the cache in the background so the reader's next
+    ranges are hits. The source is contacted here, so a failure to reach it is
+    raised before any response has started.
+    """
+    response = open_url(unit_pdf.pdfDownloadLink, range_header)
+    if response.status_code == 416:
+        response.close()
+        return SourceFetch(416, iter(()), content_range=response.headers.get("Content-Range"))
+    if response.status_code == 206:
+        warm_file_cache(unit_pdf)
+        return SourceFetch(206, iter_response(response), _content_length(response), response.headers.get("Content-Range"))
+    chunks = iter_response(response)
+    first = next(chunks, b"")
+    return SourceFetch(200, _fill_cache(unit_pdf, first, chunks), _content_length(response))
+
+
+def warm_file_cache(unit_pdf):
+    """Download a PDF into the file cache on a background thread, unless that is already under way"""
+    global _warmer
+    key = file_key(unit_pdf)
+    with _warming_lock:
+        if key in _warming:
+            return
+        _warming.add(key)
+        if _warmer is None:
+            _warmer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="file-cache-warm")
+
+    def warm():
+        try:
+            source_pdf_path(unit_pdf)
+        except Exception as e:
+            logger.warning(f"Could not fetch PDF {unit_pdf.id} into the file cache: {e}")
+        finally:
+            with _warming_lock:
+                _warming.discard(key)
+
+    _warmer.submit(warm)
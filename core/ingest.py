@@ -0,0 +1,537 @@
+import json
+import logging
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from urllib.parse import unquote
+
+import cloudinary.uploader
+from b2sdk.v2.exception import NonExistentBucket, B2Error
+from django.conf import settings
+from django.db import transaction
+
+from .catalog_cache import invalidate, unit_scope, units_scope
+from .b2 import get_b2_client, upload_file_to_b2
+from .models import UnitProfile, UnitPdf, ExamPaper
+from .pdf_inspector import PdfInspection, PdfRewrite, direct_code_extraction, inspect_pdf, pdf_text
+from .previews import store_thumbnails
+from .search import exam_paper_document, index_documents, unit_pdf_document
+from .storage import hash_uploaded_file
+from .unit_codes import UnitCodeCache, known_unit_codes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PdfUploadResult:
+    """Outcome of pushing one file of a batch to Cloudinary"""
+    name: str
+    unit_code: str = None
+    url: str = None
+    error: str = None
+    inspection: PdfInspection = field(default=None, repr=False)
+    # The file was already stored, so its existing link was reused instead of uploading
+    reused: bool = False
+    # The unit already lists this file, so no new UnitPdf row is needed
+    already_listed: bool = False
+
+    @property
+    def ok(self):
+        return self.url is not None and self.error is None
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "unitCode": self.unit_code,
+            "url": self.url,
+            "pageCount": self.inspection.page_count if self.inspection else None,
+            "duplicate": self.reused,
+            "bytesSaved": self.inspection.bytes_saved if self.inspection else 0,
+            "error": self.error,
+        }
+
+
+def pdf_rewrite_options():
+    """How uploads are rewritten before storage, from the PDF_* settings"""
+    return PdfRewrite(
+        linearize=settings.PDF_LINEARIZE,
+        optimize=settings.PDF_OPTIMIZE,
+        image_dpi_threshold=settings.PDF_IMAGE_DPI_THRESHOLD,
+        image_dpi_target=settings.PDF_IMAGE_DPI_TARGET,
+        image_quality=settings.PDF_IMAGE_QUALITY,
+    )
+
+
+def upload_pdf_to_cloudinary(pdf, folder_name):
+    """Upload PDF directly to Cloudinary"""
+    try:
+        response = cloudinary.uploader.upload(
+            pdf,
+            folder=f"kuStudyHub/{folder_name}",
+            resource_type="auto",
+        )
+        return response["secure_url"]
+    except Exception as e:
+        logger.error(f"Cloudinary upload failed: {e}")
+        return None
+
+
+def cloudinary_asset(url):
+    """(public_id, resource_type) of a Cloudinary delivery URL, or None if it is not one"""
+    match = re.search(r"/(image|raw|video)/upload/(?:.+/)?v\d+/(.+)$", url or "")
+    if match is None:
+        return None
+    resource_type, public_id = match.groups()
+    if resource_type != "raw":
+        # Only raw assets keep their extension in the public_id
+        public_id = public_id.rsplit(".", 1)[0]
+    return unquote(public_id), resource_type
+
+
+def delete_from_cloudinary(url):
+    """Delete the stored asset behind a Cloudinary URL; failures are only logged"""
+    asset = cloudinary_asset(url)
+    if asset is None:
+        logger.warning(f"Not deleting {url}: not a Cloudinary delivery URL")
+        return False
+    public_id, resource_type = asset
+    try:
+        cloudinary.uploader.destroy(public_id, resource_type=resource_type, invalidate=True)
+    except Exception as e:
+        logger.warning(f"Could not delete {public_id} from Cloudinary: {e}")
+        return False
+    return True
+
+
+def stored_pdf_copies(content_hashes):
+    """Map each already-stored content hash to {unit code: download link}"""
+    copies = {}
+    stored = (
+        UnitPdf.objects.filter(contentHash__in=set(content_hashes))
+        .exclude(pdfDownloadLink=None)
+        .values_list("contentHash", "unit__unitCode", "pdfDownloadLink")
+    )
+    for content_hash, unit_code, link in stored:
+        copies.setdefault(content_hash, {})[unit_code] = link
+    return copies
+
+
+def _inspect_one(pdf, known_codes=None):
+    result = PdfUploadResult(name=pdf.name)
+    filename_code = direct_code_extraction(pdf.name)
+    result.inspection = inspect_pdf(pdf, known_codes=known_codes, code_cache=UnitCodeCache(), detect_code=not filename_code, thumbnail=True, rewrite=pdf_rewrite_options())
+    result.unit_code = filename_code or result.inspection.unit_code
+    if not result.unit_code:
+        result.error = "Could not determine unit code"
+    return result
+
+
+def _upload_one(pdf, result):
+    result.url = upload_pdf_to_cloudinary(result.inspection.upload_source(pdf), result.unit_code)
+    if not result.url:
+        result.error = "Cloudinary upload failed"
+    return result
+
+
+def upload_pdfs_concurrently(pdfs, max_workers=None):
+    """
+    Inspect and upload a batch of PDFs with at most max_workers uploads in flight,
+    keeping input order. Files whose content is already stored, or that appear
+    twice in the batch, are uploaded once and share the stored link.
+    """
+    if max_workers is None:
+        max_workers = settings.CLOUDINARY_UPLOAD_CONCURRENCY
+    if not pdfs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pdfs)))) as pool:
+        known_codes = known_unit_codes()
+        results = list(pool.map(lambda pdf: _inspect_one(pdf, known_codes), pdfs))
+        copies = stored_pdf_copies(result.inspection.content_hash for result in results if not result.error)
+
+        first_of_hash = {}
+        to_upload = []
+        for pdf, result in zip(pdfs, results):
+            if result.error:
+                continue
+            content_hash = result.inspection.content_hash
+            stored = copies.get(content_hash)
+            if stored:
+                result.url = stored.get(result.unit_code) or next(iter(stored.values()))
+                result.reused = True
+                result.already_listed = result.unit_code in stored
+            elif content_hash in first_of_hash:
+                result.reused = True
+            else:
+                first_of_hash[content_hash] = result
+                to_upload.append((pdf, result))
+
+        list(pool.map(lambda item: _upload_one(*item), to_upload))
+
+    listed = set()
+    for result in results:
+        if result.error or result.already_listed:
+            continue
+        if not result.url:
+            result.url = first_of_hash[result.inspection.content_hash].url
+            if not result.url:
+                result.error = "Cloudinary upload failed"
+                continue
+        key = (result.inspection.content_hash, result.unit_code)
+        result.already_listed = key in listed
+        listed.add(key)
+    return results
+
+
+def batch_upload_response(results):
+    """Response body for a finished batch upload"""
+    return {
+        'message': 'Files processed and uploaded!',
+        'files': [result.url for result in results if result.ok],
+        'results': [result.as_dict() for result in results],
+    }
+
+
+def units_by_code(unit_codes, titles=None):
+    """Fetch UnitProfiles for the given codes, creating any that are missing in one query"""
+    titles = titles or {}
+    unit_codes = set(unit_codes)
+    units = UnitProfile.objects.in_bulk(unit_codes, field_name="unitCode")
+    missing = unit_codes - units.keys()
+    if missing:
+        UnitProfile.objects.bulk_create(
+            [UnitProfile(unitCode=code, unitTitle=titles.get(code, code)) for code in missing],
+            ignore_conflicts=True,
+        )
+        units.update(UnitProfile.objects.in_bulk(missing, field_name="unitCode"))
+        # bulk_create skips the post_save signals that normally invalidate the catalog
+        invalidate(units_scope())
+    return units
+
+
+def save_uploaded_pdfs(results):
+    """Write UnitPdf rows for every successful upload in bulk"""
+    uploaded = [result for result in results if result.ok and not result.already_listed]
+    if not uploaded:
+        return []
+    with transaction.atomic():
+        units = units_by_code(result.unit_code for result in uploaded)
+        created = bulk_create_unit_pdfs([
+            UnitPdf(
+                unit=units[result.unit_code],
+                pdfTitle=result.name,
+                pdfDownloadLink=result.url,
+                pdfSize=result.inspection.stored_size_kb,
+                pdfBytesSaved=result.inspection.bytes_saved,
+                pdfPageCount=result.inspection.page_count,
+                pdfDate=date.today(),
+                contentHash=result.inspection.content_hash,
+            )
+            for result in uploaded
+        ])
+        index_documents([unit_pdf_document(unit_pdf, result.inspection.full_text) for unit_pdf, result in zip(created, uploaded)])
+        store_thumbnails(result.inspection for result in uploaded)
+        return created
+
+
+def bulk_create_unit_pdfs(unit_pdfs, batch_size=None):
+    """bulk_create UnitPdf rows and invalidate the cached lists of the units they belong to"""
+    created = UnitPdf.objects.bulk_create(unit_pdfs, batch_size=batch_size)
+    invalidate(*{unit_scope(unit_pdf.unit_id) for unit_pdf in created})
+    return created
+
+
+class PdfStorageError(Exception):
+    """Raised when a PDF could not be stored in Cloudinary"""
+
+
+def process_single_pdf(pdf, unit_code):
+    """
+    Inspect, upload and record one PDF under an explicit unit code, reusing any stored
+    copy. Raises PdfStorageError, recording nothing, if the upload fails.
+    """
+    inspection = inspect_pdf(pdf, detect_code=False, thumbnail=True, rewrite=pdf_rewrite_options())
+    unit, _ = UnitProfile.objects.get_or_create(unitCode=unit_code)
+    existing = UnitPdf.objects.filter(unit=unit, contentHash=inspection.content_hash, pdfDownloadLink__isnull=False).first()
+    if existing:
+        return existing
+    stored = stored_pdf_copies([inspection.content_hash]).get(inspection.content_hash)
+    download_link = next(iter(stored.values())) if stored else upload_pdf_to_cloudinary(inspection.upload_source(pdf), unit_code)
+    if not download_link:
+        raise PdfStorageError("Cloudinary upload failed")
+    with transaction.atomic():
+        unit_pdf = UnitPdf.objects.create(
+            unit=unit,
+            pdfTitle=pdf.name,
+            pdfDownloadLink=download_link,
+            pdfSize=inspection.stored_size_kb,
+            pdfBytesSaved=inspection.bytes_saved,
+            pdfPageCount=inspection.page_count,
+            pdfDate=date.today(),
+            contentHash=inspection.content_hash,
+        )
+        index_documents([unit_pdf_document(unit_pdf, inspection.full_text)])
+        store_thumbnails([inspection])
+    return unit_pdf
+
+
+class ExamStorageError(Exception):
+    """Raised when the exam-paper bucket cannot be reached; carries the client-facing message"""
+
+
+def open_exam_bucket():
+    """Return the exam-paper bucket from the shared, already-authorized B2 client"""
+    b2_key_id = getattr(settings, 'B2_APPLICATION_KEY_ID', None)
+    b2_key = getattr(settings, 'B2_APPLICATION_KEY', None)
+    b2_bucket_name = getattr(settings, 'B2_BUCKET_NAME', None)
+
+    if not all([b2_key_id, b2_key, b2_bucket_name]):
+        logger.error("B2 configuration missing in Django settings (B2_APPLICATION_KEY_ID, B2_APPLICATION_KEY, B2_BUCKET_NAME).")
+        raise ExamStorageError('Server configuration error: Storage not configured.')
+
+    try:
+        return get_b2_client().get_bucket(b2_bucket_name)
+    except NonExistentBucket:
+        logger.error(f"B2 Bucket '{b2_bucket_name}' not found.", exc_info=True)
+        raise ExamStorageError(f"Server configuration error: B2 Bucket '{b2_bucket_name}' not found.")
+    except B2Error as e:
+        logger.error(f"B2 API Error during initialization or bucket access: {e}", exc_info=True)
+        raise ExamStorageError('Error connecting to storage service.')
+    except Exception as e:
+        logger.error(f"Unexpected error during B2 initialization: {e}", exc_info=True)
+        raise ExamStorageError('An unexpected server error occurred during storage initialization.')
+
+
+def parse_exam_metadata(sanitized_unit_code, metadata_str):
+    """Decode the JSON metadata sent alongside a unit's files; returns (metadata, original_code, errors)"""
+    metadata = {}
+    original_code = sanitized_unit_code
+    errors = []
+    if metadata_str:
+        try:
+            metadata = json.loads(metadata_str)
+            original_code = metadata.get('originalCode', sanitized_unit_code)
+            logger.info(f"Parsed metadata for {sanitized_unit_code}: {metadata}")
+        except json.JSONDecodeError:
+            logger.warning(f"Could not decode JSON metadata for unit {sanitized_unit_code}. String was: '{metadata_str}'")
+            errors.append({'unit_code': sanitized_unit_code, 'error': 'Invalid metadata format received.'})
+        except Exception as e:
+            logger.error(f"Error processing metadata for unit {sanitized_unit_code}: {e}", exc_info=True)
+            errors.append({'unit_code': sanitized_unit_code, 'error': f'Error processing metadata: {e}'})
+    return metadata, original_code, errors
+
+
+def exam_paper_detail(paper, sanitized_unit_code, metadata, duplicate=False):
+    return {
+        'db_id': paper.id,
+        'unit_identifier': paper.unit_code,
+        'sanitized_code': sanitized_unit_code,
+        'original_filename': paper.original_filename,
+        'b2_object_name': paper.b2_file_path,
+        'b2_file_id': paper.b2_file_id,
+        'size': paper.size,
+        'content_type': paper.content_type,
+        'metadata': metadata,
+        'duplicate': duplicate
+    }
+
+
+def exam_paper_text(f, content_type):
+    """Extracted text of the first EXAM_TEXT_MAX_PAGES pages of an uploaded exam paper; scans and photos have none"""
+    if content_type != 'application/pdf' and not f.name.lower().endswith('.pdf'):
+        return ""
+    return pdf_text(f, settings.EXAM_TEXT_MAX_PAGES)
+
+
+def exam_object_name(sanitized_unit_code, original_filename):
+    """Unique B2 object name for an exam paper under the unit's upload folder"""
+    b2_base_folder = getattr(settings, 'B2_UPLOAD_FOLDER', 'uploads/')
+    unique_suffix = f"{uuid.uuid4()}_{original_filename}"
+    b2_object_name_parts = [b2_base_folder.strip('/'), sanitized_unit_code, unique_suffix]
+    return "/".join(part for part in b2_object_name_parts if part)
+
+
+def exam_paper_fields(metadata, original_code, filename):
+    """ExamPaper unit code, title, year and semester from upload metadata; returns (fields, warnings)"""
+    warnings = []
+    paper_year_str = metadata.get('year', None)
+    paper_year = None
+    if paper_year_str:
+        try:
+            paper_year = int(paper_year_str)
+        except (ValueError, TypeError):
+            logger.warning(f"Could not convert year '{paper_year_str}' to integer for unit {original_code}. Saving as NULL.")
+            warnings.append({'unit_code': original_code, 'filename': filename, 'warning': f'Invalid year value received: {paper_year_str}'})
+
+    paper_semester_str = metadata.get('semester', None)
+    paper_semester = None
+    if paper_semester_str:
+        try:
+            paper_semester = int(paper_semester_str)
+            if paper_semester not in [choice[0] for choice in ExamPaper.SEMESTER_CHOICES]:
+                logger.warning(f"Invalid semester value '{paper_semester}' received for unit {original_code}. Saving as NULL.")
+                warnings.append({'unit_code': original_code, 'filename': filename, 'warning': f'Invalid semester value received: {paper_semester_str}'})
+                paper_semester = None
+        except (ValueError, TypeError):
+            logger.warning(f"Could not convert semester '{paper_semester_str}' to integer for unit {original_code}. Saving as NULL.")
+            warnings.append({'unit_code': original_code, 'filename': filename, 'warning': f'Invalid semester value received: {paper_semester_str}'})
+
+    fields = {
+        'unit_code': original_code,
+        'title': metadata.get('title', None),
+        'year': paper_year,
+        'semester': paper_semester,
+    }
+    return fields, warnings
+
+
+def stored_exam_paper(content_hash, paper_fields):
+    """
+    The ExamPaper already recording this content for the same unit, year and
+    semester, or None. The same file sent for another unit or sitting is a new paper.
+    """
+    return ExamPaper.objects.filter(
+        content_hash=content_hash,
+        unit_code=paper_fields['unit_code'],
+        year=paper_fields['year'],
+        semester=paper_fields['semester'],
+    ).first()
+
+
+def upload_exam_paper(bucket, f, sanitized_unit_code, original_code, metadata, uploader=None):
+    """Upload one exam paper file to B2 and record it; returns (upload_detail or None, errors)"""
+    errors = []
+    try:
+        original_filename = f.name
+        content_type = f.content_type or 'application/octet-stream'
+
+        content_hash = hash_uploaded_file(f)
+        paper_fields, warnings = exam_paper_fields(metadata, original_code, original_filename)
+        existing_paper = stored_exam_paper(content_hash, paper_fields)
+        if existing_paper:
+            logger.info(f"File '{original_filename}' for unit '{original_code}' is already stored as {existing_paper.b2_file_path}; skipping upload")
+            return exam_paper_detail(existing_paper, sanitized_unit_code, metadata, duplicate=True), errors
+
+        b2_object_name = exam_object_name(sanitized_unit_code, original_filename)
+
+        logger.info(f"Uploading file '{original_filename}' for unit '{original_code}' to B2 path: {b2_object_name}")
+
+        uploaded_b2_file_info = upload_file_to_b2(bucket, f, b2_object_name, content_type)
+
+        try:
+            errors.extend(warnings)
+
+            paper_record = ExamPaper.objects.create(
+                **paper_fields,
+                original_filename=original_filename,
+                content_type=content_type,
+                size=f.size,
+                b2_file_path=b2_object_name,
+                b2_file_id=uploaded_b2_file_info.id_,
+                uploader=uploader,
+                content_hash=content_hash
+            )
+            logger.info(f"Successfully saved DB record for {b2_object_name} with ID {paper_record.id}")
+            index_documents([exam_paper_document(paper_record, exam_paper_text(f, content_type))])
+
+            return exam_paper_detail(paper_record, sanitized_unit_code, metadata), errors
+
+        except Exception as db_exc:
+            logger.error(f"Database Error saving record for B2 file {b2_object_name} (Unit: {original_code}, File: {original_filename}): {db_exc}", exc_info=True)
+            errors.append({
+                'unit_code': original_code,
+                'filename': original_filename,
+                'error': f'Database saving error: {db_exc}'
+            })
+
+    except B2Error as e:
+        logger.error(f"B2 Upload Error for {sanitized_unit_code}/{f.name}: {e}", exc_info=True)
+        errors.append({
+            'unit_code': original_code,
+            'filename': f.name,
+            'error': f'Storage upload error: {e}'
+        })
+    except Exception as e:
+        logger.error(f"General Error processing file {sanitized_unit_code}/{f.name}: {e}", exc_info=True)
+        errors.append({
+            'unit_code': original_code,
+            'filename': f.name,
+            'error': f'Server processing error: {e}'
+        })
+    return None, errors
+
+
+EXAM_FILE_KEY_PREFIX = "files_"
+EXAM_METADATA_KEY_PREFIX = "metadata_"
+
+
+def process_exam_uploads(bucket, files_by_key, metadata_by_key, uploader=None, on_file=None):
+    """
+    Upload every exam paper in files_by_key ({'files_UNITCODE': [files]}) using the
+    matching 'metadata_UNITCODE' JSON string. on_file(f, detail, errors) is called
+    after each file so callers can record progress. Returns (uploaded_details, errors).
+    """
+    uploaded_file_details = []
+    errors = []
+    processed_unit_codes = set()
+
+    for file_key, files_for_unit in files_by_key.items():
+        if not file_key.startswith(EXAM_FILE_KEY_PREFIX):
+            logger.warning(f"Skipping unexpected file key in request: {file_key}")
+            continue
+
+        sanitized_unit_code = file_key[len(EXAM_FILE_KEY_PREFIX):]
+
+        if not sanitized_unit_code:
+            logger.warning(f"Could not extract unit code from file key: {file_key}")
+            errors.append({'key': file_key, 'error': 'Invalid file key format.'})
+            continue
+
+        if sanitized_unit_code in processed_unit_codes:
+            continue
+        processed_unit_codes.add(sanitized_unit_code)
+
+        if not files_for_unit:
+            logger.warning(f"No files found for key {file_key}, though key exists.")
+            continue
+
+        metadata_str = metadata_by_key.get(f"{EXAM_METADATA_KEY_PREFIX}{sanitized_unit_code}")
+        metadata, original_code, metadata_errors = parse_exam_metadata(sanitized_unit_code, metadata_str)
+        errors.extend(metadata_errors)
+
+        for f in files_for_unit:
+            upload_detail, file_errors = upload_exam_paper(bucket, f, sanitized_unit_code, original_code, metadata, uploader)
+            if upload_detail:
+                uploaded_file_details.append(upload_detail)
+            errors.extend(file_errors)
+            if on_file:
+                on_file(f, upload_detail, file_errors)
+
+    return uploaded_file_details, errors
+
+
+def exam_upload_response(uploaded_file_details, errors):
+    """Summarise an exam-paper upload as (payload, status) the same way for requests and jobs"""
+    if errors and not uploaded_file_details:
+        logger.error(f"Upload request failed. Errors: {errors}")
+        return {
+            'status': 'error',
+            'message': 'File upload failed for all items.',
+            'errors': errors
+        }, 400
+    elif errors:
+        logger.warning(f"Upload partially succeeded. Uploaded: {len(uploaded_file_details)}, Errors: {errors}")
+        return {
+            'status': 'partial_success',
+            'message': f'Successfully uploaded {len(uploaded_file_details)} file(s), but some errors occurred.',
+            'uploaded': uploaded_file_details,
+            'errors': errors
+        }, 207
+    else:
+        logger.info(f"Successfully uploaded {len(uploaded_file_details)} file(s).")
+        return {
+            'status': 'success',
+            'message': f'Successfully uploaded {len(uploaded_file_details)} file(s).',
+            'uploaded': uploaded_file_details
+        }, 201
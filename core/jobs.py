@@ -0,0 +1,200 @@
+import logging
+import threading
+import uuid
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .direct_uploads import complete_upload
+from .ingest import (
+    ExamStorageError, batch_upload_response, exam_upload_response, open_exam_bucket,
+    process_exam_uploads, process_single_pdf, save_uploaded_pdfs, upload_pdfs_concurrently,
+)
+from .models import UploadJob, UploadJobFile
+from .upload_staging import discard_staged, open_staged, stage_upload
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats of a running job; requeue_stale_jobs' cutoff must be well above this
+HEARTBEAT_INTERVAL = 30
+
+
+def enqueue_upload_job(kind, files, payload=None, uploader=None):
+    """Stage every file of a request's MultiValueDict and queue the job for the worker"""
+    job = UploadJob(kind=kind, payload=payload or {}, uploader=uploader)
+    job_files = []
+    try:
+        for field_name, uploads in files.lists():
+            for f in uploads:
+                job_files.append(UploadJobFile(
+                    job=job,
+                    field_name=field_name,
+                    original_filename=f.name,
+                    content_type=f.content_type,
+                    size=f.size,
+                    staged_name=stage_upload(f, job.id, len(job_files)),
+                ))
+        with transaction.atomic():
+            job.save()
+            UploadJobFile.objects.bulk_create(job_files)
+    except BaseException:
+        for job_file in job_files:
+            discard_staged(job_file.staged_name)
+        raise
+    logger.info(f"Queued {kind} upload job {job.id} with {len(job_files)} file(s)")
+    return job
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return it, or None when the queue is empty"""
+    with transaction.atomic():
+        job = (
+            UploadJob.objects.select_for_update(skip_locked=True)
+            .filter(status=UploadJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = UploadJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.claim_id = uuid.uuid4()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at', 'claim_id'])
+    return job
+
+
+def requeue_stale_jobs(older_than, max_attempts):
+    """
+    Put running jobs whose worker died (no heartbeat for older_than) back on the
+    queue, failing those out of attempts
+    """
+    stale = UploadJob.objects.filter(status=UploadJob.STATUS_RUNNING, heartbeat_at__lt=timezone.now() - older_than)
+    exhausted = list(stale.filter(attempts__gte=max_attempts).values_list('id', flat=True))
+    UploadJob.objects.filter(id__in=exhausted).update(
+        status=UploadJob.STATUS_FAILED, error='Worker stopped while processing the job.', finished_at=timezone.now()
+    )
+    _discard_pending_files(UploadJobFile.objects.filter(job_id__in=exhausted), 'Worker stopped while processing the job.')
+    return stale.update(status=UploadJob.STATUS_QUEUED, claim_id=None)
+
+
+def _claimed(job):
+    """job's row while this worker still holds its claim"""
+    return UploadJob.objects.filter(id=job.id, claim_id=job.claim_id, status=UploadJob.STATUS_RUNNING)
+
+
+def _beat(job, stop):
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            if not _claimed(job).update(heartbeat_at=timezone.now()):
+                return
+    except Exception as e:
+        logger.warning(f"Heartbeat of upload job {job.id} failed: {e}")
+    finally:
+        connections.close_all()
+
+
+def run_job(job):
+    """
+    Process a claimed job, recording per-file progress as it goes. A background
+    thread keeps the job's heartbeat fresh meanwhile, and the outcome is only
+    saved if the job was not requeued and claimed by another worker.
+    """
+    handlers = {
+        UploadJob.KIND_SINGLE: _run_single,
+        UploadJob.KIND_BATCH: _run_batch,
+        UploadJob.KIND_EXAM: _run_exam,
+        UploadJob.KIND_DIRECT: _run_direct,
+    }
+    job_files = list(job.files.filter(status=UploadJobFile.STATUS_PENDING))
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_beat, args=(job, stop), name=f"upload-job-{job.id}", daemon=True)
+    heartbeat.start()
+    try:
+        try:
+            job.result = handlers[job.kind](job, job_files)
+            job.status = UploadJob.STATUS_DONE
+        except Exception as e:
+            logger.error(f"Upload job {job.id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            job.status = UploadJob.STATUS_FAILED
+            _discard_pending_files(job.files.all(), str(e))
+    finally:
+        stop.set()
+        heartbeat.join()
+    job.finished_at = timezone.now()
+    if not _claimed(job).update(result=job.result, status=job.status, error=job.error, finished_at=job.finished_at):
+        logger.warning(f"Upload job {job.id} was requeued while this worker ran it; not recording its outcome")
+    return job
+
+
+def _as_upload(job_file):
+    return open_staged(job_file.staged_name, job_file.original_filename, job_file.content_type, job_file.size)
+
+
+def _finish_file(job_file, result=None, error=None):
+    job_file.status = UploadJobFile.STATUS_FAILED if error else UploadJobFile.STATUS_DONE
+    job_file.result = result or {}
+    job_file.error = error or ""
+    discard_staged(job_file.staged_name)
+    job_file.staged_name = ""
+    job_file.save(update_fields=['status', 'result', 'error', 'staged_name'])
+
+
+def _discard_pending_files(job_files, error):
+    """Fail the still-pending files among job_files and delete their staged copies"""
+    pending = job_files.filter(status=UploadJobFile.STATUS_PENDING)
+    for staged_name in pending.exclude(staged_name="").values_list('staged_name', flat=True):
+        discard_staged(staged_name)
+    pending.update(status=UploadJobFile.STATUS_FAILED, error=error, staged_name="")
+
+
+def _run_single(job, job_files):
+    for job_file in job_files:
+        if job_file.field_name != 'pdf':
+            continue
+        unit_pdf = process_single_pdf(_as_upload(job_file), job.payload['unitCode'])
+        _finish_file(job_file, {'id': unit_pdf.id, 'url': unit_pdf.pdfDownloadLink})
+    return {'message': 'PDF uploaded successfully'}
+
+
+def _run_batch(job, job_files):
+    job_files = [job_file for job_file in job_files if job_file.field_name == 'files']
+    results = upload_pdfs_concurrently([_as_upload(job_file) for job_file in job_files])
+    save_uploaded_pdfs(results)
+    for job_file, result in zip(job_files, results):
+        _finish_file(job_file, result.as_dict(), result.error)
+    return batch_upload_response(results)
+
+
+def _run_exam(job, job_files):
+    try:
+        bucket = open_exam_bucket()
+    except ExamStorageError as e:
+        raise RuntimeError(str(e))
+
+    files_by_key = {}
+    job_file_for_upload = {}
+    for job_file in job_files:
+        upload = _as_upload(job_file)
+        files_by_key.setdefault(job_file.field_name, []).append(upload)
+        job_file_for_upload[id(upload)] = job_file
+
+    def on_file(f, detail, errors):
+        failures = [error['error'] for error in errors if 'error' in error]
+        _finish_file(job_file_for_upload[id(f)], {'uploaded': detail, 'errors': errors}, "; ".join(failures) or None)
+
+    uploaded_file_details, errors = process_exam_uploads(
+        bucket, files_by_key, job.payload.get('metadata', {}), job.uploader, on_file=on_file
+    )
+    for job_file in job_files:
+        if job_file.status == UploadJobFile.STATUS_PENDING:
+            _finish_file(job_file, error='File was not processed (invalid or duplicate file key).')
+    payload, status = exam_upload_response(uploaded_file_details, errors)
+    return dict(payload, http_status=status)
+
+
+def _run_direct(job, job_files):
+    # The file is already in storage; the payload says where and what it is
+    payload, status = complete_upload(job.payload, job.uploader, rewrite=True)
+    return dict(payload, http_status=status)
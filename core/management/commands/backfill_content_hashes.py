@@ -0,0 +1,64 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.models import ExamPaper, UnitPdf
+from core.storage import iter_unit_pdf_bytes, read_exam_paper_into, sha256_of_chunks
+
+
+def _hash_unit_pdf(unit_pdf):
+    return sha256_of_chunks(iter_unit_pdf_bytes(unit_pdf))
+
+
+def _hash_exam_paper(paper):
+    digest = hashlib.sha256()
+    read_exam_paper_into(paper, digest.update)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = "Compute content hashes for stored UnitPdf and ExamPaper rows that do not have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['unitpdf', 'exampaper', 'all'], default='all')
+        parser.add_argument('--batch-size', type=int, default=100, help="Rows hashed and saved per bulk update.")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent downloads.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many rows per model.")
+
+    def handle(self, *args, **options):
+        if options['model'] in ('unitpdf', 'all'):
+            rows = UnitPdf.objects.filter(contentHash__isnull=True).exclude(pdfDownloadLink=None)
+            self._backfill(rows, 'contentHash', _hash_unit_pdf, options)
+        if options['model'] in ('exampaper', 'all'):
+            rows = ExamPaper.objects.filter(content_hash__isnull=True)
+            self._backfill(rows, 'content_hash', _hash_exam_paper, options)
+
+    def _backfill(self, rows, field_name, hash_row, options):
+        model = rows.model
+        pending = list(rows.order_by('pk').values_list('pk', flat=True)[:options['limit']])
+        self.stdout.write(f"Hashing {len(pending)} {model.__name__} row(s)")
+        hashed = failed = 0
+
+        def safe_hash(row):
+            try:
+                return row, hash_row(row)
+            except Exception as e:
+                self.stderr.write(f"Could not hash {model.__name__} {row.pk}: {e}")
+                return row, None
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                batch = list(model.objects.filter(pk__in=pending[start:start + options['batch_size']]))
+                updated = []
+                for row, content_hash in pool.map(safe_hash, batch):
+                    if content_hash is None:
+                        failed += 1
+                        continue
+                    setattr(row, field_name, content_hash)
+                    updated.append(row)
+                model.objects.bulk_update(updated, [field_name])
+                hashed += len(updated)
+                self.stdout.write(f"  {hashed}/{len(pending)} hashed")
+
+        self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {hashed} hashed, {failed} failed"))
@@ -0,0 +1,81 @@
+import re
+import time
+from pathlib import Path
+
+import fitz
+from django.core.management.base import BaseCommand, CommandError
+
+from core.pdf_inspector import TEXT_PAGES, UNIT_CODE_PATTERN, direct_code_extraction, inspect_pdf
+from core.unit_codes import known_unit_codes
+
+
+def _joined_pages_code(data):
+    """The previous approach: join the first TEXT_PAGES pages, then take the first pattern match"""
+    pdfDoc = fitz.open(stream=data, filetype="pdf")
+    try:
+        text = "".join(pdfDoc[page_num].get_text() for page_num in range(min(TEXT_PAGES, pdfDoc.page_count)))
+    finally:
+        pdfDoc.close()
+    match = re.search(UNIT_CODE_PATTERN, text)
+    return f"{match.group(1).upper()}{match.group(2)}" if match else None
+
+
+class _DictCache(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare unit-code detection from PDF text on a folder of sample PDFs: hit rate, agreement "
+        "with the code in the filename (where there is one) and time per file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('folder', type=Path, help="Folder searched recursively for *.pdf files.")
+        parser.add_argument('--limit', type=int, default=None, help="Benchmark at most this many files.")
+        parser.add_argument('--no-known-codes', action='store_true', help="Rank candidates without the catalogued unit codes.")
+
+    def handle(self, *args, **options):
+        folder = options['folder']
+        if not folder.is_dir():
+            raise CommandError(f"{folder} is not a folder")
+        files = sorted(path for path in folder.rglob('*') if path.suffix.lower() == '.pdf')[:options['limit']]
+        if not files:
+            raise CommandError(f"No PDFs found in {folder}")
+        known_codes = None if options['no_known_codes'] else known_unit_codes()
+        corpus = [(path, path.read_bytes()) for path in files]
+        self.stdout.write(f"{len(corpus)} PDF(s), {len(known_codes or ())} known unit code(s)")
+
+        cache = _DictCache()
+        methods = [
+            ("joined first pages", lambda data: _joined_pages_code(data)),
+            ("page by page", lambda data: inspect_pdf(None, data=data, known_codes=known_codes, full_text=False).unit_code),
+            ("page by page, cold cache", lambda data: inspect_pdf(None, data=data, known_codes=known_codes, code_cache=cache, full_text=False).unit_code),
+            ("page by page, warm cache", lambda data: inspect_pdf(None, data=data, known_codes=known_codes, code_cache=cache, full_text=False).unit_code),
+        ]
+        for name, detect in methods:
+            self._report(name, detect, corpus)
+
+    def _report(self, name, detect, corpus):
+        found = labelled = agreed = failed = 0
+        elapsed = 0.0
+        for path, data in corpus:
+            start = time.perf_counter()
+            try:
+                code = detect(data)
+            except Exception:
+                code = None
+                failed += 1
+            elapsed += time.perf_counter() - start
+            found += code is not None
+            expected = direct_code_extraction(path.stem)
+            if expected:
+                labelled += 1
+                agreed += code == expected
+        line = f"{name:<26} hit rate {found / len(corpus):6.1%}  {elapsed / len(corpus) * 1000:7.2f} ms/file"
+        if labelled:
+            line += f"  agrees with filename {agreed}/{labelled} ({agreed / labelled:.1%})"
+        if failed:
+            line += f"  {failed} unreadable"
+        self.stdout.write(line)
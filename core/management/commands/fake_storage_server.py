@@ -0,0 +1,42 @@
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.fake_storage import FakeStorage, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for Cloudinary uploads and the B2 API so signed direct uploads can be tested "
+        "end to end. It accepts the credentials in the current settings; point the app at it with "
+        "CLOUDINARY_UPLOAD_PREFIX and BACKBLAZE_REALM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8899)
+        parser.add_argument('--root', default=None, help="Folder for uploaded files (a temporary folder by default).")
+
+    def handle(self, *args, **options):
+        root = options['root'] or tempfile.mkdtemp(prefix='fake-storage-')
+        base_url = f"http://{options['host']}:{options['port']}"
+        storage = FakeStorage(
+            root,
+            base_url,
+            cloud_name=settings.CLOUDINARY_STORAGE['CLOUD_NAME'],
+            api_key=settings.CLOUDINARY_STORAGE['API_KEY'],
+            api_secret=settings.CLOUDINARY_STORAGE['API_SECRET'],
+            key_id=settings.B2_APPLICATION_KEY_ID,
+            key=settings.B2_APPLICATION_KEY,
+            bucket_name=settings.B2_BUCKET_NAME,
+        )
+        server = make_server(storage, options['host'], options['port'], log=self.stdout.write)
+        self.stdout.write(f"Fake storage on {base_url}, files in {root}")
+        self.stdout.write(f"Start the app with CLOUDINARY_UPLOAD_PREFIX={base_url} BACKBLAZE_REALM={base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
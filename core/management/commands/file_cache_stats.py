@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core.file_proxy import file_cache_stats, reset_file_cache_stats
+
+
+def _mb(num_bytes):
+    return f"{(num_bytes or 0) / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Show hit/miss counts for the /files/ disk cache and how much it holds. Counters live in the "
+        "Django cache, so they are shared between processes only when REDIS_URL is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing them.")
+
+    def handle(self, *args, **options):
+        stats = file_cache_stats()
+        self.stdout.write(
+            f"Hits:   {stats['hit_requests']} request(s), {_mb(stats['hit_bytes'])} served from disk\n"
+            f"Misses: {stats['miss_requests']} request(s), {_mb(stats['miss_bytes'])} fetched from storage\n"
+            f"Hit ratio: {stats['hit_ratio']:.1%}\n"
+            f"Cached: {stats['cached_files']} file(s), {_mb(stats['cached_bytes'])}"
+        )
+        if options['reset']:
+            reset_file_cache_stats()
+            self.stdout.write("Counters reset.")
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.models import PdfThumbnail, UnitPdf
+from core.pdf_inspector import inspect_pdf
+from core.previews import store_thumbnails
+from core.storage import iter_unit_pdf_bytes
+
+
+def _inspect_unit_pdf(unit_pdf):
+    data = b"".join(iter_unit_pdf_bytes(unit_pdf))
+    return inspect_pdf(None, data=data, detect_code=False, full_text=False, thumbnail=True)
+
+
+class Command(BaseCommand):
+    help = "Render first-page previews for stored PDFs that do not have one yet. Run backfill_content_hashes first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Previews rendered per bulk insert.")
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent downloads.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many PDFs.")
+
+    def handle(self, *args, **options):
+        done = set(PdfThumbnail.objects.values_list('content_hash', flat=True))
+        pending = {}
+        for unit_pdf in UnitPdf.objects.exclude(contentHash=None).exclude(pdfDownloadLink=None).only('id', 'contentHash', 'pdfDownloadLink').order_by('id'):
+            if unit_pdf.contentHash not in done:
+                pending.setdefault(unit_pdf.contentHash, unit_pdf)
+        pending = list(pending.values())[:options['limit']]
+        self.stdout.write(f"Rendering previews for {len(pending)} PDF(s)")
+        rendered = failed = 0
+
+        def safe_inspect(unit_pdf):
+            try:
+                return _inspect_unit_pdf(unit_pdf)
+            except Exception as e:
+                self.stderr.write(f"Could not read UnitPdf {unit_pdf.pk}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                inspections = list(pool.map(safe_inspect, pending[start:start + options['batch_size']]))
+                usable = [inspection for inspection in inspections if inspection is not None and inspection.thumbnail]
+                store_thumbnails(usable)
+                rendered += len(usable)
+                failed += len(inspections) - len(usable)
+                self.stdout.write(f"  {rendered}/{len(pending)} rendered")
+
+        self.stdout.write(self.style.SUCCESS(f"{rendered} rendered, {failed} failed"))
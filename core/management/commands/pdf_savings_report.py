@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from core.models import UnitPdf
+
+
+def _mb(num_bytes):
+    return f"{(num_bytes or 0) / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = "Summarize how much storage PDF optimization has saved, overall and for the units that gained most."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help="Number of units to list.")
+
+    def handle(self, *args, **options):
+        totals = UnitPdf.objects.aggregate(files=Count('id'), stored_kb=Sum('pdfSize'), saved=Sum('pdfBytesSaved'))
+        stored = (totals['stored_kb'] or 0) * 1024
+        saved = totals['saved'] or 0
+        original = stored + saved
+        share = saved / original * 100 if original else 0
+        self.stdout.write(
+            f"{totals['files']} PDF(s): {_mb(original)} uploaded, {_mb(stored)} stored, "
+            f"{_mb(saved)} saved ({share:.1f}%)"
+        )
+
+        top_units = (
+            UnitPdf.objects.filter(pdfBytesSaved__gt=0)
+            .values('unit__unitCode', 'unit__unitTitle')
+            .annotate(files=Count('id'), saved=Sum('pdfBytesSaved'))
+            .order_by('-saved')[:options['top']]
+        )
+        for unit in top_units:
+            self.stdout.write(f"  {unit['unit__unitCode']:<10} {_mb(unit['saved']):>10}  {unit['files']} file(s)  {unit['unit__unitTitle']}")
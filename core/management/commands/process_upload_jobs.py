@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued uploads (PDFs and exam papers) in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=5, help="Minutes without a heartbeat after which a running job is assumed abandoned.")
+        parser.add_argument('--max-attempts', type=int, default=3, help="Attempts before an abandoned job is marked failed.")
+        parser.add_argument('--requeue-interval', type=float, default=60.0, help="Seconds between checks for jobs abandoned by other workers.")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_after'])
+        next_requeue = 0
+
+        while True:
+            close_old_connections()
+            # Checked while running, not just at startup, so jobs of a worker that died are picked up by the others
+            if time.monotonic() >= next_requeue:
+                requeued = requeue_stale_jobs(stale_after, options['max_attempts'])
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} abandoned job(s)")
+                next_requeue = time.monotonic() + options['requeue_interval']
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write(f"Processing {job}")
+            run_job(job)
+            self.stdout.write(f"Finished {job}")
@@ -0,0 +1,77 @@
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.core.management.base import BaseCommand
+
+from core.models import ExamPaper, SearchDocument, UnitPdf
+from core.pdf_inspector import inspect_pdf, pdf_text
+from core.search import exam_paper_document, index_documents, unit_pdf_document
+from core.storage import iter_unit_pdf_bytes, read_exam_paper_into
+
+
+def _unit_pdf_text(unit_pdf):
+    return inspect_pdf(None, data=b"".join(iter_unit_pdf_bytes(unit_pdf)), detect_code=False).full_text
+
+
+def _exam_paper_text(paper):
+    if paper.content_type != 'application/pdf' and not paper.original_filename.lower().endswith('.pdf'):
+        return ""
+    # Same page limit as exam_paper_text applies to new uploads
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        read_exam_paper_into(paper, tmp.write)
+        tmp.flush()
+        return pdf_text(tmp.name, settings.EXAM_TEXT_MAX_PAGES)
+
+
+class Command(BaseCommand):
+    help = "Download and index the text of stored UnitPdf and ExamPaper rows that are not searchable yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['unitpdf', 'exampaper', 'all'], default='all')
+        parser.add_argument('--batch-size', type=int, default=50, help="Documents extracted and indexed per bulk insert.")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent downloads.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many rows per model.")
+        parser.add_argument('--optimize', action='store_true', help="Rebuild and merge the SQLite FTS index after indexing.")
+
+    def handle(self, *args, **options):
+        if options['model'] in ('unitpdf', 'all'):
+            rows = UnitPdf.objects.filter(search_document__isnull=True).exclude(pdfDownloadLink=None).select_related('unit')
+            self._index(rows, _unit_pdf_text, unit_pdf_document, options)
+        if options['model'] in ('exampaper', 'all'):
+            rows = ExamPaper.objects.filter(search_document__isnull=True)
+            self._index(rows, _exam_paper_text, exam_paper_document, options)
+        if options['optimize'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO core_searchdocument_fts(core_searchdocument_fts) VALUES('rebuild')")
+                cursor.execute("INSERT INTO core_searchdocument_fts(core_searchdocument_fts) VALUES('optimize')")
+            self.stdout.write(f"Optimized the index of {SearchDocument.objects.count()} document(s)")
+
+    def _index(self, rows, extract_text, make_document, options):
+        model = rows.model
+        pending = list(rows.order_by('pk').values_list('pk', flat=True)[:options['limit']])
+        self.stdout.write(f"Indexing {len(pending)} {model.__name__} row(s)")
+        indexed = failed = 0
+
+        def safe_extract(row):
+            try:
+                return row, extract_text(row)
+            except Exception as e:
+                self.stderr.write(f"Could not read {model.__name__} {row.pk}: {e}")
+                return row, None
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                batch = list(rows.filter(pk__in=pending[start:start + options['batch_size']]))
+                documents = []
+                for row, text in pool.map(safe_extract, batch):
+                    if text is None:
+                        failed += 1
+                        continue
+                    documents.append(make_document(row, text))
+                index_documents(documents)
+                indexed += len(documents)
+                self.stdout.write(f"  {indexed}/{len(pending)} indexed")
+
+        self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {indexed} indexed, {failed} failed"))
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from core.catalog_cache import invalidate, unit_scope
+from core.file_proxy import file_cache, file_key
+from core.ingest import delete_from_cloudinary, pdf_rewrite_options, upload_pdf_to_cloudinary
+from core.models import UnitPdf
+from core.pdf_inspector import inspect_pdf, is_linearized
+from core.previews import forget_rendered_pages
+from core.storage import iter_url_bytes
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-upload stored PDFs as optimized, linearized (fast web view) files and point their UnitPdf rows at the new copies. "
+        "Files that do not shrink or change are left alone. The old copies are deleted from Cloudinary, and this "
+        "machine's cached copies and page renders of them are dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="PDFs downloaded, rewritten and uploaded at once.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many stored files.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without uploading anything.")
+
+    def handle(self, *args, **options):
+        # One entry per stored file; rows that share a file share its replacement
+        stored = {}
+        for link, unit_code, title in UnitPdf.objects.exclude(pdfDownloadLink=None).order_by('id').values_list('pdfDownloadLink', 'unit__unitCode', 'pdfTitle'):
+            stored.setdefault(link, (unit_code, title))
+        pending = list(stored.items())[:options['limit']]
+        self.stdout.write(f"Checking {len(pending)} stored PDF(s)")
+        counts = {'rewritten': 0, 'already': 0, 'failed': 0}
+        options_for_rewrite = pdf_rewrite_options()
+        saved_total = 0
+
+        def rewrite(item):
+            link, (unit_code, title) = item
+            try:
+                data = b"".join(iter_url_bytes(link))
+                # Optimizing can still shrink a linearized file; with it off there is nothing left to do
+                if not options_for_rewrite.optimize and is_linearized(data):
+                    return link, 'already', None, None
+                inspection = inspect_pdf(None, data=data, detect_code=False, full_text=False, rewrite=options_for_rewrite)
+                if inspection.storage_data is None:
+                    return link, 'already', None, None
+                if options['dry_run']:
+                    return link, 'rewritten', None, inspection
+                new_link = upload_pdf_to_cloudinary(inspection.upload_source(title), unit_code)
+                return link, ('rewritten' if new_link else 'failed'), new_link, inspection
+            except Exception as e:
+                self.stderr.write(f"Could not rewrite {link}: {e}")
+                return link, 'failed', None, None
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for link, outcome, new_link, inspection in pool.map(rewrite, pending):
+                counts[outcome] += 1
+                if inspection is not None:
+                    saved_total += inspection.bytes_saved
+                if new_link:
+                    with transaction.atomic():
+                        rows = UnitPdf.objects.filter(pdfDownloadLink=link)
+                        # Loaded before the update: rows without a contentHash are cached under their old link
+                        replaced = list(rows.only('id', 'unit_id', 'contentHash', 'pdfDownloadLink', 'pdfPageCount'))
+                        unit_ids = {unit_pdf.unit_id for unit_pdf in replaced}
+                        rows.update(
+                            pdfDownloadLink=new_link,
+                            pdfSize=inspection.stored_size_kb,
+                            pdfBytesSaved=F('pdfBytesSaved') + inspection.bytes_saved,
+                        )
+                        # update() skips the signals that normally invalidate the catalog
+                        invalidate(*(unit_scope(unit_id) for unit_id in unit_ids))
+                    delete_from_cloudinary(link)
+                    for unit_pdf in replaced:
+                        file_cache().delete(file_key(unit_pdf))
+                        forget_rendered_pages(unit_pdf)
+
+        verb = "would be rewritten" if options['dry_run'] else "rewritten"
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['rewritten']} {verb}, {counts['already']} left as stored, {counts['failed']} failed; "
+            f"{saved_total / 1024 / 1024:.1f} MB saved"
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:58
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_exampaper'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('single', 'Single PDF'), ('batch', 'Batch PDFs'), ('exam', 'Exam papers')], max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Form fields the processing step needs (unit code, exam metadata).')),
+                ('result', models.JSONField(blank=True, default=dict, help_text='Final response body once the job has finished.')),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('claim_id', models.UUIDField(blank=True, editable=False, null=True)),
+                ('uploader', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadJobFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field_name', models.CharField(help_text='Form field the file was submitted under.', max_length=100)),
+                ('original_filename', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('size', models.BigIntegerField(help_text='File size in bytes.')),
+                ('staged_name', models.CharField(blank=True, default='', help_text='Where core.upload_staging keeps the file until it is processed.', max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='core.uploadjob')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
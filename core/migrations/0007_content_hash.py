@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exampaper',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file contents, used to detect re-uploads.', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='unitpdf',
+            name='contentHash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file contents', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unitpdf',
+            index=models.Index(fields=['unit', 'id'], name='unitpdf_unit_id_idx'),
+        ),
+    ]
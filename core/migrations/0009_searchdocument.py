@@ -0,0 +1,92 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The search index is backend specific and not expressible as a Django field,
+# so it is created with raw SQL for the two databases the project runs on.
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        title, unit_code, body,
+        content='core_searchdocument', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    # Title and unit code matches outrank matches in the body
+    "INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rank) VALUES('rank', 'bm25(10.0, 10.0, 1.0)')",
+    """
+    CREATE TRIGGER core_searchdocument_fts_ai AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, title, unit_code, body) VALUES (new.id, new.title, new.unit_code, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_fts_ad AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, unit_code, body) VALUES ('delete', old.id, old.title, old.unit_code, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER core_searchdocument_fts_au AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, unit_code, body) VALUES ('delete', old.id, old.title, old.unit_code, old.body);
+        INSERT INTO core_searchdocument_fts(rowid, title, unit_code, body) VALUES (new.id, new.title, new.unit_code, new.body);
+    END
+    """,
+]
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS core_searchdocument_fts_au",
+    "DROP TRIGGER IF EXISTS core_searchdocument_fts_ad",
+    "DROP TRIGGER IF EXISTS core_searchdocument_fts_ai",
+    "DROP TABLE IF EXISTS core_searchdocument_fts",
+]
+
+POSTGRES_FORWARDS = [
+    """
+    ALTER TABLE core_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(unit_code, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX core_searchdocument_vector_idx ON core_searchdocument USING GIN (search_vector)",
+]
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS core_searchdocument_vector_idx",
+    "ALTER TABLE core_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_search_index = _run({'sqlite': SQLITE_FORWARDS, 'postgresql': POSTGRES_FORWARDS})
+drop_search_index = _run({'sqlite': SQLITE_BACKWARDS, 'postgresql': POSTGRES_BACKWARDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_unitpdf_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit_code', models.CharField(db_index=True, max_length=50)),
+                ('title', models.CharField(blank=True, default='', max_length=1000)),
+                ('body', models.TextField(blank=True, default='')),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+                ('exam_paper', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.exampaper')),
+                ('unit_pdf', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.unitpdf')),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('exam_paper__isnull', True), ('unit_pdf__isnull', False)), models.Q(('exam_paper__isnull', False), ('unit_pdf__isnull', True)), _connector='OR'), name='searchdocument_one_source')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
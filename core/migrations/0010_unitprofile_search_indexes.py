@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# Trigram indexes serve both the prefix (LIKE 'X%') and substring (LIKE '%X%')
+# matches of /api/units/search/. The expressions must match the ones the view
+# filters on. SQLite cannot use an index for LIKE on an expression, and the
+# development catalog is small enough to scan.
+POSTGRES_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE INDEX IF NOT EXISTS unitprofile_code_key_trgm_idx ON core_unitprofile USING GIN ((UPPER(REPLACE("unitCode", ' ', ''))) gin_trgm_ops)""",
+    """CREATE INDEX IF NOT EXISTS unitprofile_title_key_trgm_idx ON core_unitprofile USING GIN ((UPPER("unitTitle")) gin_trgm_ops)""",
+]
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS unitprofile_title_key_trgm_idx",
+    "DROP INDEX IF EXISTS unitprofile_code_key_trgm_idx",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(POSTGRES_FORWARDS), _run(POSTGRES_BACKWARDS)),
+    ]
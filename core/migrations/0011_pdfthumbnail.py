@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_unitprofile_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfThumbnail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the PDF the preview was rendered from.', max_length=64, unique=True)),
+                ('image', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
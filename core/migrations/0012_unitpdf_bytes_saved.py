@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_pdfthumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unitpdf',
+            name='pdfBytesSaved',
+            field=models.BigIntegerField(default=0, help_text='Bytes the stored copy saves against the uploaded file'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_unitpdf_bytes_saved'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='kind',
+            field=models.CharField(choices=[('single', 'Single PDF'), ('batch', 'Batch PDFs'), ('exam', 'Exam papers'), ('direct', 'Direct-to-storage upload')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_uploadjob_direct_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unitpdf',
+            name='downloadCount',
+            field=models.PositiveIntegerField(default=0, help_text='Downloads, written in batches by core.counters'),
+        ),
+        migrations.AddField(
+            model_name='unitpdf',
+            name='viewCount',
+            field=models.PositiveIntegerField(default=0, help_text='Reader opens, written in batches by core.counters'),
+        ),
+    ]
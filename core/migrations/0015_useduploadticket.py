@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_unitpdf_view_download_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsedUploadTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=32, unique=True)),
+                ('used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -17,6 +17,16 @@ class UnitPdf(models.Model):
     pdfSize = models.IntegerField(help_text="Size in KB",blank=True)
     pdfDate = models.DateField(auto_now_add=True)
     uploadedBy = models.CharField(max_length=100, blank=True, null=True,default="Anonymous")
+    contentHash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text="SHA-256 of the file contents")
+    pdfBytesSaved = models.BigIntegerField(default=0, help_text="Bytes the stored copy saves against the uploaded file")
+    viewCount = models.PositiveIntegerField(default=0, help_text="Reader opens, written in batches by core.counters")
+    downloadCount = models.PositiveIntegerField(default=0, help_text="Downloads, written in batches by core.counters")
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a unit's PDFs: WHERE unit_id = ? AND id > ? ORDER BY id
+            models.Index(fields=["unit", "id"], name="unitpdf_unit_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.pdfTitle} ({self.unit.unitCode})"
@@ -72,6 +82,13 @@ class ExamPaper(models.Model):
         null=True,
         help_text="File size in bytes."
     )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        db_index=True, # Looked up on every upload to skip re-uploading known files
+        help_text="SHA-256 of the file contents, used to detect re-uploads."
+    )
 
 
     # --- B2 Storage Information ---
@@ -102,3 +119,150 @@ class ExamPaper(models.Model):
         auto_now_add=True, # Automatically set when the record is first created
         help_text="Timestamp when the paper was uploaded."
     )
+
+
+import uuid
+class UploadJob(models.Model):
+    """
+    A queued upload request. The web process stores the submitted files and
+    returns immediately; `manage.py process_upload_jobs` does the parsing,
+    storage upload and DB writes.
+    """
+    KIND_SINGLE = 'single'
+    KIND_BATCH = 'batch'
+    KIND_EXAM = 'exam'
+    KIND_DIRECT = 'direct'
+    KIND_CHOICES = [
+        (KIND_SINGLE, 'Single PDF'),
+        (KIND_BATCH, 'Batch PDFs'),
+        (KIND_EXAM, 'Exam papers'),
+        (KIND_DIRECT, 'Direct-to-storage upload'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    payload = models.JSONField(default=dict, blank=True, help_text="Form fields the processing step needs (unit code, exam metadata).")
+    result = models.JSONField(default=dict, blank=True, help_text="Final response body once the job has finished.")
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_jobs',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by the worker while the job runs; jobs whose heartbeat stops are requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Changes on every claim, so a worker whose job was requeued and claimed again cannot record its results
+    claim_id = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.id} ({self.status})"
+
+
+class UploadJobFile(models.Model):
+    """
+    One file of an UploadJob. The bytes are staged in the B2 bucket (or on
+    disk, see UPLOAD_STAGING) so any worker dyno can pick the job up, and are
+    deleted once the file is processed.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job = models.ForeignKey(UploadJob, on_delete=models.CASCADE, related_name='files')
+    field_name = models.CharField(max_length=100, help_text="Form field the file was submitted under.")
+    original_filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True, null=True)
+    size = models.BigIntegerField(help_text="File size in bytes.")
+    staged_name = models.CharField(max_length=255, blank=True, default="", help_text="Where core.upload_staging keeps the file until it is processed.")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.status})"
+
+
+class UsedUploadTicket(models.Model):
+    """
+    A direct-upload ticket that has been finalized. Tickets are signed, not
+    stored, so this is what stops one from being finalized twice; rows older
+    than DIRECT_UPLOAD_TTL are pruned since the signature has expired by then.
+    """
+    ticket_id = models.CharField(max_length=32, unique=True)
+    used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload ticket {self.ticket_id}"
+
+
+class PdfThumbnail(models.Model):
+    """
+    WebP preview of a PDF's first page, shared by every UnitPdf with the same
+    content. This table is the durable copy; requests are served from the
+    preview disk cache in front of it.
+    """
+    content_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the PDF the preview was rendered from.")
+    image = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Thumbnail {self.content_hash[:12]}"
+
+
+class SearchDocument(models.Model):
+    """
+    Extracted text of one UnitPdf or ExamPaper, indexed for full-text search.
+    The index itself lives outside the ORM (an FTS5 table on SQLite, a
+    generated tsvector column with a GIN index on Postgres; see migration
+    0009) and is kept in step with this table by the database.
+    """
+    unit_pdf = models.OneToOneField(UnitPdf, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    exam_paper = models.OneToOneField(ExamPaper, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    unit_code = models.CharField(max_length=50, db_index=True)
+    title = models.CharField(max_length=1000, blank=True, default="")
+    body = models.TextField(blank=True, default="")
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(unit_pdf__isnull=False, exam_paper__isnull=True) | models.Q(unit_pdf__isnull=True, exam_paper__isnull=False),
+                name='searchdocument_one_source',
+            ),
+        ]
+
+    @property
+    def kind(self):
+        return 'pdf' if self.unit_pdf_id else 'exam'
+
+    def __str__(self):
+        return f"{self.title} ({self.unit_code})"
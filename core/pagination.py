@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+
+
+class PageParamError(ValueError):
+    """Raised for malformed cursor, limit or fields query parameters"""
+
+
+@dataclass
+class PageParams:
+    """Keyset pagination and column selection requested through the query string"""
+    fields: tuple
+    cursor: int = None
+    limit: int = None
+
+    @property
+    def paginated(self):
+        return self.cursor is not None or self.limit is not None
+
+    @property
+    def variant(self):
+        """Stable cache-key fragment for this combination of parameters"""
+        return f"{self.cursor}:{self.limit}:{','.join(self.fields)}"
+
+
+def parse_page_params(request, allowed_fields):
+    """
+    Read ?cursor=, ?limit= and ?fields= from the request. 'id' is always
+    returned because the cursor is the last id of the previous page.
+    """
+    fields = allowed_fields
+    if request.GET.get("fields"):
+        requested = [name.strip() for name in request.GET["fields"].split(",") if name.strip()]
+        unknown = set(requested) - set(allowed_fields)
+        if unknown:
+            raise PageParamError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+        fields = tuple(name for name in allowed_fields if name == "id" or name in requested)
+
+    params = PageParams(fields=tuple(fields))
+    try:
+        if request.GET.get("cursor"):
+            params.cursor = int(request.GET["cursor"])
+        if request.GET.get("limit"):
+            params.limit = int(request.GET["limit"])
+    except ValueError:
+        raise PageParamError("cursor and limit must be integers")
+    if params.limit is not None and params.limit < 1:
+        raise PageParamError("limit must be positive")
+    if params.paginated:
+        params.limit = min(params.limit or settings.CATALOG_PAGE_SIZE, settings.CATALOG_PAGE_SIZE_MAX)
+    return params
+
+
+async def akeyset_page(queryset, params):
+    """
+    Rows after params.cursor in id order, fetched with the async ORM. The
+    queryset should be filtered on the leading columns of an index ending in
+    id, so each page is one index range scan. Returns the full list when
+    pagination was not requested, else {'results': [...], 'next_cursor': id or None}.
+    """
+    rows = queryset.order_by("id").values(*params.fields)
+    if not params.paginated:
+        return [row async for row in rows]
+    if params.cursor is not None:
+        rows = rows.filter(id__gt=params.cursor)
+    page = [row async for row in rows[:params.limit + 1]]
+    has_more = len(page) > params.limit
+    page = page[:params.limit]
+    return {
+        "results": page,
+        "next_cursor": page[-1]["id"] if has_more else None,
+    }
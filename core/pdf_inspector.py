@@ -0,0 +1,318 @@
+import hashlib
+import io
+import os
+import re
+from dataclasses import dataclass, field
+
+import fitz
+from PIL import Image
+
+UNIT_CODE_PATTERN = r'([A-Za-z]{3,4})\s*[_-]?\s*(\d{3})'
+# Stricter form for page text, where codes sit among other words and numbers:
+# no letter directly before and no fourth digit after (rules out "year 2020", ISBNs).
+TEXT_UNIT_CODE_PATTERN = re.compile(r'(?<![A-Za-z])([A-Za-z]{3,4})\s*[_-]?\s*(\d{3})(?!\d)')
+TEXT_PAGES = 3
+# A code this close to the top of a page is treated as its heading
+HEADER_CHARS = 400
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_QUALITY = 70
+
+
+@dataclass
+class PdfRewrite:
+    """How an uploaded PDF is rewritten before it is stored"""
+    linearize: bool = True
+    optimize: bool = False
+    # Images shown at more than image_dpi_threshold are resampled to image_dpi_target as JPEG
+    image_dpi_threshold: int = 200
+    image_dpi_target: int = 150
+    image_quality: int = 75
+
+
+@dataclass
+class UnitCodeCandidate:
+    code: str
+    page: int
+    offset: int
+    count: int = 1
+    known: bool = False
+
+    @property
+    def score(self):
+        """Higher is better: known codes first, then earlier pages and positions, then repetition"""
+        return (100 if self.known else 0) - 10 * self.page - min(self.offset / 200, 5) + 2 * (self.count - 1)
+
+
+@dataclass
+class PdfInspection:
+    """Everything the upload paths need to know about a PDF, from one parse"""
+    page_count: int = None
+    full_text: str = None  # every page, for the search index
+    unit_code: str = None
+    unit_code_candidates: list = field(default_factory=list, repr=False)
+    thumbnail: bytes = field(default=None, repr=False)  # WebP of page 1
+    size: int = 0
+    content_hash: str = None  # always of the file as uploaded, so re-uploads are recognised
+    # Rewritten file to store instead of the original (e.g. linearized); None to store the original
+    storage_data: bytes = field(default=None, repr=False)
+
+    @property
+    def size_kb(self):
+        return self.size // 1024
+
+    @property
+    def bytes_saved(self):
+        """How much smaller the stored file is than the upload"""
+        return max(0, self.size - len(self.storage_data)) if self.storage_data is not None else 0
+
+    @property
+    def stored_size_kb(self):
+        """Size of the file that is actually stored and downloaded"""
+        return (len(self.storage_data) if self.storage_data is not None else self.size) // 1024
+
+    def upload_source(self, original):
+        """What to hand the storage uploader: the rewritten bytes as (filename, data), or the original"""
+        if self.storage_data is None:
+            return original
+        if isinstance(original, (str, os.PathLike)):
+            name = os.path.basename(original)
+        else:
+            name = getattr(original, "name", None) or "document.pdf"
+        return (name, self.storage_data)
+
+
+def direct_code_extraction(fileName):
+    """Extract unit code from filename"""
+    if not fileName:
+        return None
+    match = re.search(UNIT_CODE_PATTERN, fileName)
+    return f"{match.group(1).upper()}{match.group(2)}" if match else None
+
+
+def read_pdf_bytes(pdf):
+    """Read an uploaded file or a path into bytes, leaving uploads rewound for the next reader"""
+    if isinstance(pdf, (str, os.PathLike)):
+        with open(pdf, "rb") as fh:
+            return fh.read()
+    pdf.seek(0)
+    data = pdf.read()
+    pdf.seek(0)
+    return data
+
+
+def pdf_text(pdf, max_pages=None):
+    """
+    Text of the first max_pages pages (all when None) of a PDF path or uploaded
+    file. Files Django spooled to disk are opened from their path rather than
+    read into memory. Returns "" for anything that does not parse.
+    """
+    try:
+        if hasattr(pdf, "temporary_file_path"):
+            pdfDoc = fitz.open(pdf.temporary_file_path(), filetype="pdf")
+        elif isinstance(pdf, (str, os.PathLike)):
+            pdfDoc = fitz.open(pdf, filetype="pdf")
+        else:
+            pdfDoc = fitz.open(stream=read_pdf_bytes(pdf), filetype="pdf")
+    except Exception:
+        return ""
+    try:
+        page_count = pdfDoc.page_count if max_pages is None else min(max_pages, pdfDoc.page_count)
+        return "\n".join(pdfDoc[page_num].get_text() for page_num in range(page_count))
+    except Exception:
+        return ""
+    finally:
+        pdfDoc.close()
+
+
+def detect_unit_code(pages, known_codes=None, max_pages=TEXT_PAGES):
+    """
+    Find the unit code in an iterable of page texts, reading only as far as
+    needed. Stops at the first page with a confident candidate (a code from
+    known_codes, or any code in a page heading when no known codes are given);
+    otherwise ranks everything seen in the first max_pages pages.
+    Returns (best code or None, candidates best first).
+    """
+    candidates = {}
+    for page_num, page_text in enumerate(pages):
+        if page_num >= max_pages:
+            break
+        for match in TEXT_UNIT_CODE_PATTERN.finditer(page_text):
+            code = f"{match.group(1).upper()}{match.group(2)}"
+            if code in candidates:
+                candidates[code].count += 1
+                continue
+            candidates[code] = UnitCodeCandidate(code, page_num, match.start(), known=bool(known_codes) and code in known_codes)
+        confident = any(
+            candidate.page == page_num and (candidate.known if known_codes else candidate.offset < HEADER_CHARS)
+            for candidate in candidates.values()
+        )
+        if confident:
+            break
+    ranked = sorted(candidates.values(), key=lambda candidate: candidate.score, reverse=True)
+    return (ranked[0].code if ranked else None), ranked
+
+
+def is_linearized(data):
+    """True when the file already starts with a linearization dictionary ("fast web view")"""
+    return b"/Linearized" in data[:1024]
+
+
+def first_page_end(data):
+    """
+    End offset of the first-page section of a linearized file (/E in its
+    linearization dictionary), read from the file's first bytes; None otherwise
+    """
+    match = re.search(rb"/Linearized\b(.{0,512}?)>>", data[:1024], re.S)
+    if match is None:
+        return None
+    end = re.search(rb"/E\s+(\d+)", match.group(1))
+    return int(end.group(1)) if end else None
+
+
+def _downsample_images(pdfDoc, rewrite):
+    """Re-encode images drawn at more than rewrite.image_dpi_threshold, where that makes them smaller"""
+    # xref -> (page showing it, pixel size, largest size it is drawn at in inches)
+    placements = {}
+    for page in pdfDoc:
+        for info in page.get_image_info(xrefs=True):
+            xref = info["xref"]
+            bbox = fitz.Rect(info["bbox"])
+            if not xref or bbox.is_empty:
+                continue
+            drawn = (abs(bbox.width) / 72, abs(bbox.height) / 72)
+            if xref in placements:
+                previous = placements[xref][2]
+                drawn = (max(drawn[0], previous[0]), max(drawn[1], previous[1]))
+                placements[xref] = (placements[xref][0], placements[xref][1], drawn)
+            else:
+                placements[xref] = (page.number, (info["width"], info["height"]), drawn)
+
+    for xref, (page_num, (width, height), (width_in, height_in)) in placements.items():
+        dpi = min(width / width_in, height / height_in)
+        if dpi <= rewrite.image_dpi_threshold:
+            continue
+        # Leave transparency and 1-bit scans (already compact as CCITT/JBIG2) alone
+        if pdfDoc.xref_get_key(xref, "SMask")[0] != "null" or pdfDoc.xref_get_key(xref, "BitsPerComponent")[1] == "1":
+            continue
+        pix = fitz.Pixmap(pdfDoc, xref)
+        if pix.alpha:
+            continue
+        if pix.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        image = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+        scale = rewrite.image_dpi_target / dpi
+        image = image.resize((max(1, round(pix.width * scale)), max(1, round(pix.height * scale))), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=rewrite.image_quality, optimize=True)
+        if out.tell() < len(pdfDoc.xref_stream_raw(xref)):
+            pdfDoc[page_num].replace_image(xref, stream=out.getvalue())
+
+
+def rewrite_pdf(pdfDoc, data, rewrite):
+    """
+    Bytes to store in place of data, or None to store data as uploaded.
+    The optimized file (images downsampled, unused objects dropped, streams
+    deflated) is kept only if it is smaller than the upload; otherwise the
+    upload is just linearized. pdfDoc may be modified.
+    """
+    needs_linearizing = rewrite.linearize and not is_linearized(data)
+    if rewrite.optimize:
+        try:
+            if rewrite.image_dpi_threshold:
+                _downsample_images(pdfDoc, rewrite)
+            optimized = pdfDoc.tobytes(garbage=3, deflate=True, deflate_images=True, deflate_fonts=True, linear=rewrite.linearize)
+            if len(optimized) < len(data):
+                return optimized
+        except Exception:
+            pass
+        if not needs_linearizing:
+            return None
+        # pdfDoc now holds the rejected changes; linearize a fresh copy of the upload
+        with fitz.open(stream=data, filetype="pdf") as original:
+            return original.tobytes(linear=True)
+    return pdfDoc.tobytes(linear=True) if needs_linearizing else None
+
+
+def _webp(pix, quality):
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    out = io.BytesIO()
+    image.save(out, format="WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def render_thumbnail(page, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    """Render a page to WebP bytes, scaled to width pixels"""
+    zoom = width / page.rect.width if page.rect.width else 1
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    return _webp(pix, quality)
+
+
+def render_page(page, dpi, dark=False, quality=THUMBNAIL_QUALITY):
+    """Render a page to WebP bytes at dpi; dark inverts the colours for the reader's dark mode"""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    if dark:
+        pix.invert_irect()
+    return _webp(pix, quality)
+
+
+class _LazyPages:
+    """Page texts of an open document, extracted on first use and kept for later readers"""
+
+    def __init__(self, pdfDoc):
+        self.pdfDoc = pdfDoc
+        self.texts = []
+
+    def __iter__(self):
+        for page_num in range(self.pdfDoc.page_count):
+            if page_num == len(self.texts):
+                self.texts.append(self.pdfDoc[page_num].get_text())
+            yield self.texts[page_num]
+
+
+def inspect_pdf(pdf, data=None, known_codes=None, code_cache=None, detect_code=True, full_text=True, thumbnail=False, rewrite=None):
+    """
+    Parse a PDF once and return its page count, text, unit code, size in bytes and SHA-256.
+
+    known_codes (a set of catalogued unit codes) ranks those codes above other
+    matches. code_cache, any object with get(content_hash) and
+    set(content_hash, code), skips detection for files seen before. With
+    full_text=False only the pages needed to find the code are read.
+    thumbnail=True also renders page 1 as a small WebP. A PdfRewrite puts
+    the file to store (linearized for fast web view, optionally optimized)
+    into storage_data.
+    """
+    if data is None:
+        data = read_pdf_bytes(pdf)
+    inspection = PdfInspection(size=len(data), content_hash=hashlib.sha256(data).hexdigest())
+    try:
+        pdfDoc = fitz.open(stream=data, filetype="pdf")
+    except Exception:
+        return inspection
+    try:
+        try:
+            inspection.page_count = pdfDoc.page_count
+            pages = _LazyPages(pdfDoc)
+            cached_code = code_cache.get(inspection.content_hash) if (detect_code and code_cache is not None) else None
+            if cached_code is not None:
+                # "" records that an earlier parse found no code
+                inspection.unit_code = cached_code or None
+            elif detect_code:
+                inspection.unit_code, inspection.unit_code_candidates = detect_unit_code(pages, known_codes)
+                if code_cache is not None:
+                    code_cache.set(inspection.content_hash, inspection.unit_code or "")
+            if full_text:
+                inspection.full_text = "\n".join(pages)
+            if thumbnail and pdfDoc.page_count:
+                inspection.thumbnail = render_thumbnail(pdfDoc[0])
+        except Exception:
+            pass
+        # Runs last because optimizing modifies the open document
+        if rewrite is not None and not pdfDoc.is_encrypted:
+            try:
+                inspection.storage_data = rewrite_pdf(pdfDoc, data, rewrite)
+            except Exception:
+                # Store the file as uploaded rather than fail the upload
+                inspection.storage_data = None
+    finally:
+        pdfDoc.close()
+    return inspection
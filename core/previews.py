@@ -0,0 +1,118 @@
+import logging
+
+import fitz
+from django.conf import settings
+
+from .disk_cache import DiskLRUCache
+from .file_proxy import document_key, file_cache, file_key, first_page_bytes, source_pdf_path
+from .models import PdfThumbnail
+from .pdf_inspector import render_page
+
+logger = logging.getLogger(__name__)
+
+_preview_cache = None
+
+
+def preview_cache():
+    """The process-wide disk cache that previews and rendered pages are served from"""
+    global _preview_cache
+    if _preview_cache is None:
+        _preview_cache = DiskLRUCache(settings.PREVIEW_CACHE_DIR, settings.PREVIEW_CACHE_MAX_BYTES)
+    return _preview_cache
+
+
+def thumbnail_key(content_hash):
+    return f"thumbnail:{content_hash}"
+
+
+def store_thumbnails(inspections):
+    """Save the page-1 previews rendered during inspection; content that already has one is skipped"""
+    thumbnails = {
+        inspection.content_hash: PdfThumbnail(content_hash=inspection.content_hash, image=inspection.thumbnail)
+        for inspection in inspections
+        if inspection is not None and inspection.thumbnail
+    }
+    PdfThumbnail.objects.bulk_create(thumbnails.values(), ignore_conflicts=True)
+
+
+def thumbnail_bytes(content_hash):
+    """WebP preview for a content hash from the disk cache, falling back to the database"""
+    cache = preview_cache()
+    data = cache.get(thumbnail_key(content_hash))
+    if data is None:
+        image = PdfThumbnail.objects.filter(content_hash=content_hash).values_list("image", flat=True).first()
+        if image is None:
+            return None
+        data = bytes(image)
+        cache.set(thumbnail_key(content_hash), data)
+    return data
+
+
+def page_render_dpi(requested=None):
+    """Clamp a requested DPI to the allowed range and round it to PAGE_RENDER_DPI_STEP, so few variants get cached"""
+    dpi = settings.PAGE_RENDER_DPI if requested is None else requested
+    step = settings.PAGE_RENDER_DPI_STEP
+    dpi = step * round(dpi / step)
+    return max(settings.PAGE_RENDER_DPI_MIN, min(dpi, settings.PAGE_RENDER_DPI_MAX))
+
+
+def page_key(unit_pdf, page_num, dpi, dark):
+    return f"page:{document_key(unit_pdf)}:{page_num}:{dpi}:{'dark' if dark else 'light'}"
+
+
+def forget_rendered_pages(unit_pdf):
+    """Drop every cached render of a PDF's pages, e.g. after its stored file is replaced"""
+    cache = preview_cache()
+    dpis = {page_render_dpi(dpi) for dpi in range(settings.PAGE_RENDER_DPI_MIN, settings.PAGE_RENDER_DPI_MAX + 1)}
+    for page_num in range(1, (unit_pdf.pdfPageCount or 0) + 1):
+        for dpi in dpis:
+            for dark in (False, True):
+                cache.delete(page_key(unit_pdf, page_num, dpi, dark))
+
+
+def _render_first_page_from_range(unit_pdf, dpi, dark):
+    """Page 1 rendered from a range fetch of a linearized source, or None to fall back to the whole file"""
+    try:
+        data = first_page_bytes(unit_pdf)
+        if data is None:
+            return None
+        pdfDoc = fitz.open(stream=data, filetype="pdf")
+        try:
+            if pdfDoc.page_count < 1:
+                return None
+            return render_page(pdfDoc[0], dpi, dark, settings.PAGE_RENDER_QUALITY)
+        finally:
+            pdfDoc.close()
+    except Exception as e:
+        logger.info(f"Rendering page 1 of PDF {unit_pdf.id} from a range fetch failed, using the whole file: {e}")
+        return None
+
+
+def rendered_page(unit_pdf, page_num, dpi, dark=False):
+    """
+    WebP render of a 1-based page from the disk cache, rendering it on a miss;
+    None past the last page. Concurrent misses for the same page wait for one
+    render. Page 1 of a linearized file that is not in the file cache yet is
+    rendered from just its first-page section.
+    """
+    cache = preview_cache()
+    key = page_key(unit_pdf, page_num, dpi, dark)
+    data = cache.get(key)
+    if data is not None:
+        return data
+    with cache.filling(key):
+        data = cache.get(key)
+        if data is not None:
+            return data
+        if page_num == 1 and file_cache().get_path(file_key(unit_pdf)) is None:
+            data = _render_first_page_from_range(unit_pdf, dpi, dark)
+        if data is None:
+            pdfDoc = fitz.open(source_pdf_path(unit_pdf))
+            try:
+                if not 1 <= page_num <= pdfDoc.page_count:
+                    return None
+                data = render_page(pdfDoc[page_num - 1], dpi, dark, settings.PAGE_RENDER_QUALITY)
+            finally:
+                pdfDoc.close()
+        cache.set(key, data)
+    return data
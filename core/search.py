@@ -0,0 +1,185 @@
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import SearchDocument
+
+# Long documents are truncated before indexing; Postgres caps a tsvector at 1 MB
+# and the first few hundred pages are plenty to find a set of notes by topic.
+BODY_MAX_CHARS = 500_000
+
+KIND_PDF = 'pdf'
+KIND_EXAM = 'exam'
+
+# Private-use characters mark highlighted terms until the snippet is HTML-escaped
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+_SNIPPET_WORDS = 24
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchQueryError(ValueError):
+    """Raised for a search query with nothing searchable in it"""
+
+
+def _clean_body(text):
+    # NUL bytes from odd PDFs are rejected by Postgres text columns
+    return (text or "").replace("\x00", "")[:BODY_MAX_CHARS]
+
+
+def unit_pdf_document(unit_pdf, text):
+    return SearchDocument(unit_pdf=unit_pdf, unit_code=unit_pdf.unit.unitCode, title=unit_pdf.pdfTitle, body=_clean_body(text))
+
+
+def exam_paper_document(paper, text):
+    return SearchDocument(exam_paper=paper, unit_code=paper.unit_code, title=paper.title or paper.original_filename, body=_clean_body(text))
+
+
+def index_documents(documents):
+    """Write SearchDocuments in bulk; the database updates the full-text index as they land"""
+    return SearchDocument.objects.bulk_create(documents, batch_size=100)
+
+
+def _terms(query):
+    terms = _WORD.findall(query)
+    if not terms:
+        raise SearchQueryError("Search query must contain at least one word")
+    return terms
+
+
+def _highlight(snippet):
+    """HTML-escape extracted text, then turn the match markers into <mark> tags"""
+    return html.escape(snippet or "").replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _sqlite_ranked(query, unit_code, kind, limit):
+    # Quote each term so user input is never parsed as FTS5 syntax; the last
+    # one is a prefix so results appear while a word is still being typed.
+    terms = [f'"{term}"' for term in _terms(query)]
+    terms[-1] += "*"
+    match = " ".join(terms)
+
+    filters, params = [], [match]
+    if unit_code:
+        filters.append("d.unit_code = %s")
+        params.append(unit_code)
+    if kind == KIND_PDF:
+        filters.append("d.unit_pdf_id IS NOT NULL")
+    elif kind == KIND_EXAM:
+        filters.append("d.exam_paper_id IS NOT NULL")
+    where = "".join(f" AND {condition}" for condition in filters)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT f.rowid, f.rank FROM core_searchdocument_fts f"
+            " JOIN core_searchdocument d ON d.id = f.rowid"
+            f" WHERE core_searchdocument_fts MATCH %s{where}"
+            " ORDER BY f.rank LIMIT %s",
+            params + [limit],
+        )
+        ranked = [(doc_id, -rank) for doc_id, rank in cursor.fetchall()]
+        if not ranked:
+            return [], {}
+        # snippet() is costly, so it only runs for the page of results being returned
+        ids = [doc_id for doc_id, _ in ranked]
+        cursor.execute(
+            "SELECT rowid, snippet(core_searchdocument_fts, 2, %s, %s, '…', %s) FROM core_searchdocument_fts"
+            f" WHERE core_searchdocument_fts MATCH %s AND rowid IN ({', '.join(['%s'] * len(ids))})",
+            [_MARK_START, _MARK_END, _SNIPPET_WORDS, match] + ids,
+        )
+        return ranked, dict(cursor.fetchall())
+
+
+def _postgres_ranked(query, unit_code, kind, limit):
+    _terms(query)
+    filters, params = [], [query]
+    if unit_code:
+        filters.append("d.unit_code = %s")
+        params.append(unit_code)
+    if kind == KIND_PDF:
+        filters.append("d.unit_pdf_id IS NOT NULL")
+    elif kind == KIND_EXAM:
+        filters.append("d.exam_paper_id IS NOT NULL")
+    where = "".join(f" AND {condition}" for condition in filters)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "WITH q AS (SELECT websearch_to_tsquery('english', %s) AS query)"
+            " SELECT d.id, ts_rank_cd(d.search_vector, q.query) AS score"
+            " FROM core_searchdocument d, q"
+            f" WHERE d.search_vector @@ q.query{where}"
+            " ORDER BY score DESC, d.id LIMIT %s",
+            params + [limit],
+        )
+        ranked = cursor.fetchall()
+        if not ranked:
+            return [], {}
+        # ts_headline re-parses the document, so it only runs for the returned page
+        cursor.execute(
+            "SELECT id, ts_headline('english', body, websearch_to_tsquery('english', %s), %s)"
+            " FROM core_searchdocument WHERE id = ANY(%s)",
+            [
+                query,
+                f"StartSel=\"{_MARK_START}\", StopSel=\"{_MARK_END}\", MaxWords={_SNIPPET_WORDS}, MinWords=8, MaxFragments=2, FragmentDelimiter=\" … \"",
+                [doc_id for doc_id, _ in ranked],
+            ],
+        )
+        return ranked, dict(cursor.fetchall())
+
+
+def _fallback_ranked(query, unit_code, kind, limit):
+    """Unranked substring search for databases without a full-text index"""
+    condition = Q()
+    for term in _terms(query):
+        condition &= Q(title__icontains=term) | Q(unit_code__icontains=term) | Q(body__icontains=term)
+    documents = SearchDocument.objects.filter(condition)
+    if unit_code:
+        documents = documents.filter(unit_code=unit_code)
+    if kind == KIND_PDF:
+        documents = documents.filter(unit_pdf__isnull=False)
+    elif kind == KIND_EXAM:
+        documents = documents.filter(exam_paper__isnull=False)
+    return [(doc_id, 0.0) for doc_id in documents.order_by('-id').values_list('id', flat=True)[:limit]], {}
+
+
+def search_documents(query, unit_code=None, kind=None, limit=20):
+    """
+    Best matches for query across UnitPdf and ExamPaper text, as result dicts
+    ordered by relevance. Snippets are HTML-escaped with matches in <mark>.
+    """
+    if connection.vendor == 'sqlite':
+        ranked, snippets = _sqlite_ranked(query, unit_code, kind, limit)
+    elif connection.vendor == 'postgresql':
+        ranked, snippets = _postgres_ranked(query, unit_code, kind, limit)
+    else:
+        ranked, snippets = _fallback_ranked(query, unit_code, kind, limit)
+
+    documents = (
+        SearchDocument.objects.select_related('unit_pdf__unit', 'exam_paper')
+        .defer('body')
+        .in_bulk([doc_id for doc_id, _ in ranked])
+    )
+    results = []
+    for doc_id, score in ranked:
+        document = documents.get(doc_id)
+        if document is None:
+            continue
+        result = {
+            'kind': document.kind,
+            'id': document.unit_pdf_id or document.exam_paper_id,
+            'unitCode': document.unit_code,
+            'title': document.title,
+            'snippet': _highlight(snippets.get(doc_id)),
+            'score': round(score, 4),
+        }
+        if document.unit_pdf_id:
+            result['unitId'] = document.unit_pdf.unit_id
+            result['pdfDownloadLink'] = document.unit_pdf.pdfDownloadLink
+            result['pdfPageCount'] = document.unit_pdf.pdfPageCount
+        else:
+            result['year'] = document.exam_paper.year
+            result['semester'] = document.exam_paper.semester
+        results.append(result)
+    return results
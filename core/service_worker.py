@@ -0,0 +1,60 @@
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.templatetags.static import static
+
+# Everything the home, units and reader pages need to open offline
+SHELL_STATIC = (
+    "css/home.css", "css/units.css", "css/pdf-reader.css",
+    "js/slider.js", "js/units.js", "js/pdf-reader.js",
+    "manifest.json",
+)
+# Literal paths: core.urls is also mounted under /api/, which reverse() would prefer
+SHELL_PAGES = ("/", "/units/", "/reader/")
+# The reader's pdf.js build; must match templates/core/pdf-reader.html and js/pdf-reader.js
+SHELL_CDN = (
+    "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/pdf.min.js",
+    "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.9.359/pdf.worker.min.js",
+)
+
+
+def _shell_files():
+    """(path relative to its folder, path) for every static file and project template"""
+    folders = [*settings.STATICFILES_DIRS, *(folder for template in settings.TEMPLATES for folder in template["DIRS"])]
+    for folder in map(Path, folders):
+        for path in sorted(folder.rglob("*")):
+            if path.is_file():
+                yield path.relative_to(folder), path
+
+
+@lru_cache(maxsize=None)
+def cache_version():
+    """
+    SW_CACHE_VERSION when set, otherwise a digest of the static files and
+    templates, so any deploy that changes the app shell invalidates old caches.
+    """
+    if settings.SW_CACHE_VERSION:
+        return settings.SW_CACHE_VERSION
+    digest = hashlib.sha256()
+    for name, path in _shell_files():
+        digest.update(str(name).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def precache_urls():
+    return [*SHELL_PAGES, *(static(path) for path in SHELL_STATIC)]
+
+
+def service_worker_context():
+    return {
+        "cache_version": cache_version(),
+        "precache_urls": json.dumps(precache_urls()),
+        "cdn_urls": json.dumps(SHELL_CDN),
+        "static_url": settings.STATIC_URL,
+        "pdf_cache_max_bytes": settings.SW_PDF_CACHE_MAX_BYTES,
+        "api_revalidate_after": settings.SW_API_REVALIDATE_AFTER,
+    }
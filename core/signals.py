@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog_cache import invalidate, unit_scope, units_scope
+from .models import UnitPdf, UnitProfile
+
+
+@receiver([post_save, post_delete], sender=UnitProfile)
+def invalidate_unit_catalog(sender, instance, **kwargs):
+    invalidate(units_scope(), unit_scope(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UnitPdf)
+def invalidate_unit_pdfs(sender, instance, **kwargs):
+    invalidate(unit_scope(instance.unit_id))
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+
+import requests
+from django.conf import settings
+
+from .b2 import get_b2_client
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+
+def sha256_of_chunks(chunks):
+    """SHA-256 hex digest of an iterable of byte chunks, without holding them all in memory"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_uploaded_file(f):
+    """SHA-256 of a Django UploadedFile, read chunk by chunk; leaves the file rewound"""
+    f.seek(0)
+    content_hash = sha256_of_chunks(f.chunks())
+    f.seek(0)
+    return content_hash
+
+
+def iter_url_bytes(url, timeout=60):
+    """Stream the body of a stored object's public URL"""
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        yield from response.iter_content(DOWNLOAD_CHUNK_SIZE)
+
+
+def open_url(url, range_header=None, timeout=60):
+    """
+    Streaming GET of a stored object's public URL, optionally for a byte range.
+    Bodies are requested uncompressed so Content-Length counts the bytes read.
+    Error statuses other than 416 are raised; the caller closes the response.
+    """
+    headers = {"Accept-Encoding": "identity"}
+    if range_header:
+        headers["Range"] = range_header
+    response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+    if response.status_code >= 400 and response.status_code != 416:
+        response.close()
+        response.raise_for_status()
+    return response
+
+
+def iter_response(response):
+    """The body of an open streaming response in chunks, closing it when done or abandoned"""
+    try:
+        yield from response.iter_content(DOWNLOAD_CHUNK_SIZE)
+    finally:
+        response.close()
+
+
+def read_url_range(url, start, end, timeout=30):
+    """
+    Bytes start..end (inclusive) of a stored object's public URL, or None when the
+    server does not answer with that range
+    """
+    response = requests.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=timeout)
+    with response:
+        if response.status_code != 206:
+            return None
+        data = response.content
+    return data if len(data) == end - start + 1 else None
+
+
+def iter_unit_pdf_bytes(unit_pdf):
+    """Stream a UnitPdf's stored file from Cloudinary"""
+    return iter_url_bytes(unit_pdf.pdfDownloadLink)
+
+
+class _ChunkSink:
+    """File-like object that hands every write to a callback"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, data):
+        self.callback(data)
+        return len(data)
+
+
+def read_b2_file_into(file_name, callback):
+    """Download a file from the exam-paper bucket, passing each chunk to callback as it arrives"""
+    bucket = get_b2_client().get_bucket(settings.B2_BUCKET_NAME)
+    downloaded = bucket.download_file_by_name(file_name)
+    downloaded.save(_ChunkSink(callback), allow_seeking=False)
+
+
+def read_exam_paper_into(paper, callback):
+    """Download an ExamPaper from B2, passing each chunk to callback as it arrives"""
+    read_b2_file_into(paper.b2_file_path, callback)
@@ -0,0 +1,121 @@
+import asyncio
+import sys
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised for a Range header that selects none of the file's bytes"""
+
+
+def parse_byte_range(header, size):
+    """
+    Inclusive (start, end) for a single 'bytes=' range of a size-byte file, or None
+    when the whole file should be sent: no header, several ranges or a malformed one.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        if end == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - end), size - 1
+    if end is not None and start > end:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def single_range(header):
+    """
+    header if it asks for exactly one byte range, to pass on to a source whose
+    file size is not known yet; None when the whole file should be sent
+    """
+    try:
+        return header if parse_byte_range(header, sys.maxsize) else None
+    except RangeNotSatisfiable:
+        return header
+
+
+class FileRange:
+    """
+    length bytes of an open file starting at start. It keeps the file's fileno(),
+    so a WSGI server's file wrapper can sendfile() the range without copying it.
+    The ASGI deployment in the Procfile never takes that path (see file_response).
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def iter_file(f, chunk_size=FILE_CHUNK_SIZE):
+    """Read an open binary file in chunks, closing it when done or abandoned"""
+    try:
+        while chunk := f.read(chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _aiter_in_thread(chunks):
+    iterator = iter(chunks)
+    done = object()
+    try:
+        while (chunk := await asyncio.to_thread(next, iterator, done)) is not done:
+            yield chunk
+    finally:
+        if hasattr(iterator, "close"):
+            await asyncio.to_thread(iterator.close)
+
+
+def streaming_content(request, chunks):
+    """
+    chunks in the form the server can stream without buffering. Under ASGI Django
+    reads a sync iterator into a list before sending it, so there each chunk is
+    pulled in a worker thread through an async iterator instead.
+    """
+    if isinstance(request, ASGIRequest):
+        return _aiter_in_thread(chunks)
+    return chunks
+
+
+def file_response(request, f, start, length, content_type):
+    """
+    Response with length bytes of the open file f from start. WSGI servers get a
+    FileResponse they can sendfile(); under ASGI, which is how the Procfile runs
+    the app, uvicorn has no zero-copy send and the bytes are read and streamed
+    from a thread.
+    """
+    body = FileRange(f, start, length)
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(streaming_content(request, iter_file(body)), content_type=content_type)
+    else:
+        response = FileResponse(body, content_type=content_type)
+    response["Content-Length"] = str(length)
+    return response
@@ -1,3 +1,366 @@
-from django.test import TestCase
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+import cloudinary
+import fitz
+import requests
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import counters
+from .direct_uploads import TICKET_SALT, DirectUploadError, complete_upload, finalize_upload, sign_upload
+from .fake_storage import FakeStorage, make_server
+from .file_proxy import SourceFetch, file_cache, file_key
+from .models import ExamPaper, UnitPdf, UnitProfile
+from .pagination import PageParams, akeyset_page
+from .pdf_inspector import HEADER_CHARS, detect_unit_code, direct_code_extraction
+from .streaming import RangeNotSatisfiable, parse_byte_range, single_range
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.unit = UnitProfile.objects.create(unitCode="SCH 210", unitTitle="Organic Chemistry")
+        self.pdfs = [
+            UnitPdf.objects.create(unit=self.unit, pdfTitle=f"notes {i}", pdfSize=1, viewCount=i)
+            for i in range(5)
+        ]
+
+    async def test_cursor_round_trip(self):
+        ids, cursor = [], None
+        while True:
+            page = await akeyset_page(UnitPdf.objects.filter(unit=self.unit), PageParams(fields=("id",), cursor=cursor, limit=2))
+            ids.extend(row["id"] for row in page["results"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(ids, [pdf.id for pdf in self.pdfs])
+
+    async def test_unpaginated_returns_list(self):
+        rows = await akeyset_page(UnitPdf.objects.filter(unit=self.unit), PageParams(fields=("id", "pdfTitle")))
+        self.assertEqual([row["pdfTitle"] for row in rows], [f"notes {i}" for i in range(5)])
+
+    def test_view_pages_through_unit_pdfs(self):
+        url = f"/api/unit/{self.unit.id}/pdfs/"
+        first = self.client.get(url, {"limit": 3, "fields": "pdfTitle"}).json()
+        self.assertEqual([row["pdfTitle"] for row in first["results"]], ["notes 0", "notes 1", "notes 2"])
+        self.assertEqual(set(first["results"][0]), {"id", "pdfTitle"})
+        second = self.client.get(url, {"limit": 3, "cursor": first["next_cursor"]}).json()
+        self.assertEqual([row["id"] for row in second["results"]], [pdf.id for pdf in self.pdfs[3:]])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_popular_order_rejects_cursor(self):
+        url = f"/api/unit/{self.unit.id}/pdfs/"
+        response = self.client.get(url, {"order": "popular", "cursor": self.pdfs[0].id})
+        self.assertEqual(response.status_code, 400)
+        top = self.client.get(url, {"order": "popular", "limit": 2}).json()
+        self.assertEqual([row["id"] for row in top["results"]], [self.pdfs[4].id, self.pdfs[3].id])
+        self.assertIsNone(top["next_cursor"])
+
+    def test_bad_parameters(self):
+        url = f"/api/unit/{self.unit.id}/pdfs/"
+        for params in ({"cursor": "x"}, {"limit": 0}, {"fields": "secret"}, {"order": "newest"}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+
+class DetectUnitCodeTests(SimpleTestCase):
+    def test_filename_codes(self):
+        self.assertEqual(direct_code_extraction("sch_210 organic.pdf"), "SCH210")
+        self.assertEqual(direct_code_extraction("SMA-101 notes.pdf"), "SMA101")
+        self.assertIsNone(direct_code_extraction("notes.pdf"))
+
+    def test_known_code_outranks_earlier_unknown_one(self):
+        pages = ["Printed by ABC 123 for the library", "Unit SCH 210 Organic Chemistry"]
+        code, ranked = detect_unit_code(pages, known_codes={"SCH210"})
+        self.assertEqual(code, "SCH210")
+        self.assertEqual([candidate.code for candidate in ranked], ["SCH210", "ABC123"])
+
+    def test_heading_code_stops_reading(self):
+        def pages():
+            yield "SCH 210 Organic Chemistry"
+            raise AssertionError("read past a confident first page")
+        self.assertEqual(detect_unit_code(pages())[0], "SCH210")
+
+    def test_earlier_and_repeated_codes_rank_higher(self):
+        body = " " * HEADER_CHARS
+        pages = [body + "see SMA 101", body + "SCH 210 and SCH 210 again, also SCH 210"]
+        code, ranked = detect_unit_code(pages)
+        self.assertEqual([candidate.code for candidate in ranked], ["SMA101", "SCH210"])
+        self.assertEqual(ranked[1].count, 3)
+
+    def test_years_and_long_numbers_are_not_codes(self):
+        self.assertEqual(detect_unit_code(["Year 2020 ISBN 9781234 edition"]), (None, []))
+
+    def test_only_first_pages_are_read(self):
+        self.assertEqual(detect_unit_code(["intro", "more", "still nothing", "SCH 210"], max_pages=3)[0], None)
+
+
+def make_pdf(text="SCH 210 Organic chemistry notes"):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), text, fontsize=14)
+    return doc.tobytes()
+
+
+class DirectUploadTests(TestCase):
+    """Signing, uploading and finalizing against core.fake_storage instead of real accounts"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(root.cleanup)
+        cls.storage = FakeStorage(root.name, "http://127.0.0.1", "demo", "k1", "s1", "kid", "kk", "exams")
+        server = make_server(cls.storage, "127.0.0.1", 0, log=lambda message: None)
+        cls.storage.base_url = f"http://127.0.0.1:{server.server_port}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(server.server_close)
+        cls.addClassCleanup(server.shutdown)
+
+    def setUp(self):
+        base_url = self.storage.base_url
+        self.enterContext(mock.patch.multiple(
+            cloudinary.config(), cloud_name="demo", api_key="k1", api_secret="s1", upload_prefix=base_url, create=True,
+        ))
+        self.enterContext(mock.patch("core.b2._client", None))
+        self.enterContext(override_settings(
+            B2_APPLICATION_KEY_ID="kid", B2_APPLICATION_KEY="kk", B2_BUCKET_NAME="exams", B2_REALM=base_url,
+            DIRECT_UPLOADS_ENABLED=True, UPLOAD_JOBS_ENABLED=False,
+        ))
+        self.pdf = make_pdf()
+
+    def upload_pdf(self, signed, name="notes.pdf"):
+        response = requests.post(signed["uploadUrl"], data=signed["fields"], files={"file": (name, self.pdf, "application/pdf")})
+        response.raise_for_status()
+        return response.json()
+
+    def upload_exam(self, signed, file_name=None):
+        return requests.post(signed["uploadUrl"], data=self.pdf, headers={
+            "Authorization": signed["authorizationToken"],
+            "X-Bz-File-Name": quote(file_name or signed["fileName"]),
+            "Content-Type": signed["contentType"],
+            "X-Bz-Content-Sha1": hashlib.sha1(self.pdf).hexdigest(),
+        })
+
+    def test_pdf_ticket_is_single_use(self):
+        signed = sign_upload("pdf", "notes.pdf", len(self.pdf), unit_code="SCH 210")
+        self.assertTrue(signed["fields"]["public_id"].startswith("kuStudyHub/SCH_210/"))
+        upload = self.upload_pdf(signed)
+        payload = finalize_upload(signed["ticket"], upload)
+        with self.assertRaisesMessage(DirectUploadError, "already been finalized"):
+            finalize_upload(signed["ticket"], upload)
+
+        body, status = complete_upload(payload)
+        self.assertEqual(status, 201, body)
+        pdf = UnitPdf.objects.get()
+        self.assertEqual(pdf.unit.unitCode, "SCH 210")
+        # Stored as sent: only the upload worker rewrites direct uploads
+        self.assertEqual(pdf.pdfDownloadLink, upload["secure_url"])
+
+    def test_signature_covers_the_public_id(self):
+        signed = sign_upload("pdf", "notes.pdf", len(self.pdf))
+        signed["fields"]["public_id"] = "kuStudyHub/direct/other"
+        with self.assertRaises(requests.HTTPError):
+            self.upload_pdf(signed)
+
+    def test_ticket_for_another_upload_is_rejected(self):
+        first = sign_upload("pdf", "notes.pdf", len(self.pdf))
+        second = sign_upload("pdf", "notes.pdf", len(self.pdf))
+        with self.assertRaisesMessage(DirectUploadError, "not the one the ticket was issued for"):
+            finalize_upload(first["ticket"], self.upload_pdf(second))
+
+    def test_forged_tickets_are_rejected(self):
+        signed = sign_upload("pdf", "notes.pdf", len(self.pdf))
+        upload = self.upload_pdf(signed)
+        ticket = signing.loads(signed["ticket"], salt=TICKET_SALT)
+        for forged in ("", signed["ticket"] + "x", signing.dumps(ticket, salt="other")):
+            with self.assertRaisesMessage(DirectUploadError, "Invalid upload ticket"):
+                finalize_upload(forged, upload)
+
+    def test_sign_rejects_bad_requests(self):
+        for kind, filename, size, unit_code in (
+            ("video", "a.pdf", 10, None),
+            ("pdf", "a.txt", 10, None),
+            ("pdf", "a.pdf", 0, None),
+            ("exam", "a.pdf", 10, None),
+        ):
+            with self.assertRaises(DirectUploadError):
+                sign_upload(kind, filename, size, unit_code=unit_code)
+        with override_settings(DIRECT_UPLOADS_ENABLED=False), self.assertRaises(DirectUploadError):
+            sign_upload("pdf", "a.pdf", 10)
+
+    def test_exam_token_writes_one_name_once(self):
+        metadata = {"originalCode": "SMA 191", "title": "Calculus", "year": "1", "semester": "2"}
+        signed = sign_upload("exam", "paper.pdf", len(self.pdf), unit_code="SMA 191", metadata=metadata)
+        self.assertEqual(self.upload_exam(signed, file_name="uploads/SMA_191/other.pdf").status_code, 401)
+        upload = self.upload_exam(signed).json()
+        payload = finalize_upload(signed["ticket"], upload)
+        with self.assertRaisesMessage(DirectUploadError, "already been finalized"):
+            finalize_upload(signed["ticket"], upload)
+        # Finalizing deletes the one-file key, so its token is dead
+        self.assertEqual(self.upload_exam(signed).status_code, 401)
+
+        body, status = complete_upload(payload)
+        self.assertEqual(status, 201, body)
+        paper = ExamPaper.objects.get()
+        self.assertEqual((paper.unit_code, paper.year, paper.semester), ("SMA 191", 1, 2))
+        self.assertEqual(paper.b2_file_path, signed["fileName"])
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_whole_file(self):
+        for header in (None, "", "items=0-1", "bytes=0-1,4-5", "bytes=a-b", "bytes=-", "bytes=5-2"):
+            self.assertIsNone(parse_byte_range(header, 100), header)
+
+    def test_ranges(self):
+        self.assertEqual(parse_byte_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_byte_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=90-500", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=-500", 100), (0, 99))
+        self.assertEqual(parse_byte_range("bytes=99-99", 100), (99, 99))
+
+    def test_unsatisfiable(self):
+        for header, size in (("bytes=100-", 100), ("bytes=100-200", 100), ("bytes=-0", 100), ("bytes=-5", 0), ("bytes=0-", 0)):
+            with self.assertRaises(RangeNotSatisfiable, msg=header):
+                parse_byte_range(header, size)
+
+    def test_single_range_for_an_unknown_size(self):
+        self.assertEqual(single_range("bytes=65536-131071"), "bytes=65536-131071")
+        self.assertEqual(single_range("bytes=-0"), "bytes=-0")
+        self.assertIsNone(single_range("bytes=0-1,4-5"))
+        self.assertIsNone(single_range(None))
+
+
+class PdfFileTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(FILE_CACHE_DIR=cache_dir.name))
+        self.enterContext(mock.patch("core.file_proxy._file_cache", None))
+        self.count = self.enterContext(mock.patch("core.views.count"))
+        unit = UnitProfile.objects.create(unitCode="SCH 210", unitTitle="Organic Chemistry")
+        self.pdf = UnitPdf.objects.create(
+            unit=unit, pdfTitle="notes", pdfSize=1, contentHash="ab" * 32,
+            pdfDownloadLink="https://res.cloudinary.com/demo/image/upload/v1/kuStudyHub/SCH_210/notes.pdf",
+        )
+        self.data = bytes(range(256)) * 4
+        self.url = f"/files/{self.pdf.id}"
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def cache_file(self):
+        file_cache().set(file_key(self.pdf), self.data)
+
+    def test_ranges_from_the_cached_file(self):
+        self.cache_file()
+        response, body = self.get()
+        self.assertEqual((response.status_code, response["X-Cache"], body), (200, "HIT", self.data))
+        self.assertEqual(response["Content-Length"], str(len(self.data)))
+        etag = response["ETag"]
+
+        response, body = self.get(Range="bytes=10-19", If_Range=etag)
+        self.assertEqual((response.status_code, body), (206, self.data[10:20]))
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.data)}")
+        # Only the plain GET that opens the file is counted
+        self.count.assert_called_once()
+
+    def test_if_range_for_other_bytes_gets_the_whole_file(self):
+        self.cache_file()
+        response, body = self.get(Range="bytes=10-19", If_Range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_unsatisfiable_range(self):
+        self.cache_file()
+        response, _ = self.get(Range=f"bytes={len(self.data)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+    def test_matching_etag_is_not_modified(self):
+        self.cache_file()
+        etag = self.get()[0]["ETag"]
+        self.assertEqual(self.get(If_None_Match=etag)[0].status_code, 304)
+        self.count.assert_called_once()
+
+    def test_etag_follows_the_stored_file(self):
+        self.cache_file()
+        etag = self.get()[0]["ETag"]
+        UnitPdf.objects.filter(id=self.pdf.id).update(pdfDownloadLink=self.pdf.pdfDownloadLink.replace("notes", "notes_linearized"))
+        with mock.patch("core.views.stream_into_cache", return_value=SourceFetch(200, iter([self.data]), len(self.data))):
+            response, _ = self.get(If_None_Match=etag, Range="bytes=0-9", If_Range=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_miss_passes_the_range_to_the_source(self):
+        etag = f'"{"0" * 32}"'
+        fetch = SourceFetch(206, iter([self.data[:10]]), 10, f"bytes 0-9/{len(self.data)}")
+        with mock.patch("core.views.stream_into_cache", return_value=fetch) as stream:
+            response, body = self.get(Range="bytes=0-9")
+        self.assertEqual(stream.call_args.args[1], "bytes=0-9")
+        self.assertEqual((response.status_code, response["X-Cache"], body), (206, "MISS", self.data[:10]))
+        self.assertEqual(response["Content-Range"], f"bytes 0-9/{len(self.data)}")
+        self.assertEqual(response["Content-Length"], "10")
+
+        with mock.patch("core.views.stream_into_cache", return_value=SourceFetch(200, iter([self.data]), len(self.data))) as stream:
+            self.get(Range="bytes=0-9", If_Range=etag)
+        self.assertIsNone(stream.call_args.args[1])
+
+    def test_source_416_is_relayed(self):
+        fetch = SourceFetch(416, iter([]), content_range=f"bytes */{len(self.data)}")
+        with mock.patch("core.views.stream_into_cache", return_value=fetch):
+            response, _ = self.get(Range="bytes=5000-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+
+class CounterFlushTests(TestCase):
+    def setUp(self):
+        # Counts stay in memory until flushed here; no background flusher thread
+        self.enterContext(mock.patch("core.counters._flusher", mock.Mock()))
+        self.enterContext(mock.patch.object(counters, "_pending", Counter()))
+        unit = UnitProfile.objects.create(unitCode="SCH 210", unitTitle="Organic Chemistry")
+        self.pdfs = [UnitPdf.objects.create(unit=unit, pdfTitle=f"notes {i}", pdfSize=1) for i in range(5)]
+
+    def totals(self):
+        return list(UnitPdf.objects.order_by("id").values_list("viewCount", "downloadCount"))
+
+    def test_one_update_per_batch(self):
+        for i, pdf in enumerate(self.pdfs):
+            counters.count(pdf.id, counters.VIEW, i + 1)
+        counters.count(self.pdfs[0].id, counters.DOWNLOAD)
+        counters.count(self.pdfs[0].id, counters.VIEW)
+        with mock.patch("core.counters.FLUSH_BATCH_SIZE", 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counters.flush(), 5)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(self.totals(), [(2, 1), (2, 0), (3, 0), (4, 0), (5, 0)])
+        self.assertEqual(counters.flush(), 0)
+
+    def test_counts_from_failed_batches_are_kept(self):
+        for pdf in self.pdfs:
+            counters.count(pdf.id, counters.VIEW)
+        update = QuerySet.update
+        calls = []
+
+        def fail_second_batch(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return update(queryset, **kwargs)
+
+        with mock.patch("core.counters.FLUSH_BATCH_SIZE", 2), mock.patch.object(QuerySet, "update", fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                counters.flush()
+        self.assertEqual(self.totals(), [(1, 0), (1, 0), (0, 0), (0, 0), (0, 0)])
+        # A count recorded meanwhile adds to the requeued ones
+        counters.count(self.pdfs[4].id, counters.VIEW)
+        self.assertEqual(counters.flush(), 3)
+        self.assertEqual(self.totals(), [(1, 0), (1, 0), (1, 0), (1, 0), (2, 0)])
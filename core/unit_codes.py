@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalog_cache import scope_version, units_scope
+from .models import UnitProfile
+
+DETECTED_CODE_KEY = "unitcode:detected:{content_hash}"
+KNOWN_CODES_KEY = "unitcode:known:{version}"
+
+
+def normalize_unit_code(code):
+    return code.replace(" ", "").upper()
+
+
+class UnitCodeCache:
+    """Unit codes detected in PDF text, keyed by content hash, in the shared Django cache"""
+
+    def get(self, content_hash):
+        return cache.get(DETECTED_CODE_KEY.format(content_hash=content_hash))
+
+    def set(self, content_hash, code):
+        cache.set(DETECTED_CODE_KEY.format(content_hash=content_hash), code, settings.UNIT_CODE_CACHE_TIMEOUT)
+
+
+def known_unit_codes():
+    """Normalized codes of every catalogued unit, rebuilt whenever the unit list changes"""
+    key = KNOWN_CODES_KEY.format(version=scope_version(units_scope()))
+    codes = cache.get(key)
+    if codes is None:
+        codes = frozenset(normalize_unit_code(code) for code in UnitProfile.objects.values_list("unitCode", flat=True))
+        cache.set(key, codes, settings.CATALOG_CACHE_TIMEOUT)
+    return codes
@@ -0,0 +1,76 @@
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+
+from b2sdk.v2.exception import B2Error
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+from .b2 import get_b2_client, upload_file_to_b2
+from .storage import read_b2_file_into
+
+logger = logging.getLogger(__name__)
+
+STAGING_B2 = 'b2'
+STAGING_DISK = 'disk'
+
+
+def _staged_name(job_id, index, filename):
+    safe = re.sub(r'[^A-Za-z0-9._-]+', '_', filename or '')[:100] or 'upload'
+    return f"{job_id}/{index}-{safe}"
+
+
+def _bucket():
+    return get_b2_client().get_bucket(settings.B2_BUCKET_NAME)
+
+
+def stage_upload(f, job_id, index):
+    """
+    Put an uploaded file where the upload worker can read it back: under
+    UPLOAD_STAGING_FOLDER in the B2 bucket, or in UPLOAD_STAGING_DIR when
+    UPLOAD_STAGING is 'disk' (only when the web and worker processes share a
+    filesystem). Returns the name to store on the job row.
+    """
+    name = _staged_name(job_id, index, f.name)
+    if settings.UPLOAD_STAGING == STAGING_DISK:
+        path = Path(settings.UPLOAD_STAGING_DIR) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as out:
+            for chunk in f.chunks():
+                out.write(chunk)
+        return name
+    f.seek(0)
+    upload_file_to_b2(_bucket(), f, f"{settings.UPLOAD_STAGING_FOLDER.strip('/')}/{name}", 'application/octet-stream')
+    return name
+
+
+def open_staged(name, filename, content_type, size):
+    """A staged file as an UploadedFile backed by a local temporary file, so it is never held in memory"""
+    upload = TemporaryUploadedFile(filename, content_type, size, None)
+    if settings.UPLOAD_STAGING == STAGING_DISK:
+        with open(Path(settings.UPLOAD_STAGING_DIR) / name, 'rb') as staged:
+            shutil.copyfileobj(staged, upload.file)
+    else:
+        read_b2_file_into(f"{settings.UPLOAD_STAGING_FOLDER.strip('/')}/{name}", upload.write)
+    upload.seek(0)
+    return upload
+
+
+def discard_staged(name):
+    """Delete a staged file once its job no longer needs it; failures are only logged"""
+    try:
+        if settings.UPLOAD_STAGING == STAGING_DISK:
+            path = Path(settings.UPLOAD_STAGING_DIR) / name
+            path.unlink(missing_ok=True)
+            try:
+                os.rmdir(path.parent)
+            except OSError:
+                pass  # other files of the job are still staged
+            return
+        bucket = _bucket()
+        file_name = f"{settings.UPLOAD_STAGING_FOLDER.strip('/')}/{name}"
+        bucket.delete_file_version(bucket.get_file_info_by_name(file_name).id_, file_name)
+    except (OSError, B2Error) as e:
+        logger.warning(f"Could not delete staged upload {name}: {e}")
@@ -3,7 +3,13 @@ from core import views
 urlpatterns=[
     path('api/units/',views.get_units,name='get_units'),
     path('api/unit/<int:unit_id>/pdfs/',views.get_pdfs_by_unit,name='get_pdfs_by_unit'),
-    path('api/unit/<int:unit_id>/',views.fetch_unit_code,name='fetch_unit_code'),
+    path('api/units/search/',views.search_units,name='search_units'),
+    path('api/unit/<int:unit_id>/',views.get_unit,name='get_unit'),
+    path('api/unit/<int:unit_id>/bundle.zip',views.unit_bundle,name='unit_bundle'),
+    path('api/search/',views.search,name='search'),
+    path('api/pdf/<int:pdf_id>/preview/',views.pdf_preview,name='pdf_preview'),
+    path('api/pdf/<int:pdf_id>/page/<int:page_num>/',views.pdf_page,name='pdf_page'),
+    path('files/<int:pdf_id>',views.pdf_file,name='pdf_file'),
     path('',views.render_home,name='home'),
     path('upload/',views.render_upload_pdf,name='upload_pdf'),
     path('units/',views.render_units,name='units'),
@@ -13,6 +19,9 @@ urlpatterns=[
     path('reader/',views.render_reader,name='pdf_reader'),
     path('examuploader/',views.render_examuploader,name="examsuploader"),
     path('api/exam_papers/',views.upload_exam_papers_view,name='upload_exam_paper'),
+    path('api/upload_jobs/<uuid:job_id>/',views.upload_job_status,name='upload_job_status'),
+    path('api/uploads/sign/',views.sign_direct_upload,name='sign_direct_upload'),
+    path('api/uploads/finalize/',views.finalize_direct_upload,name='finalize_direct_upload'),
 
     
     
@@ -1,32 +1,306 @@
 from django.shortcuts import render
 from core.models import UnitProfile, UnitPdf
 from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
-from datetime import date
+from django.shortcuts import aget_object_or_404, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
-import fitz
-import os
-import re
-import cloudinary.uploader
 from django.conf import settings
-import logging
+import asyncio
+import hashlib
 import json
-import uuid
-from django.http import JsonResponse, HttpResponseBadRequest
+import logging
+import os
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header
 from django.views.decorators.http import require_POST
-from b2sdk.v2 import B2Api, InMemoryAccountInfo # Import base B2Error from the v2 API module
-from b2sdk.v2.exception import NonExistentBucket,B2Error
 logger = logging.getLogger(__name__)
-from .models import UnitProfile, UnitPdf, ExamPaper
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+from django.utils.datastructures import MultiValueDict
+from django.db import connections
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Replace, Upper
+from .models import UnitProfile, UnitPdf, UploadJob, UploadJobFile
+from .ingest import (
+    EXAM_METADATA_KEY_PREFIX, ExamStorageError, batch_upload_response, exam_upload_response,
+    open_exam_bucket, process_exam_uploads, process_single_pdf, save_uploaded_pdfs, upload_pdfs_concurrently,
+)
+from .direct_uploads import DirectUploadError, complete_upload, finalize_upload, sign_upload
+from .jobs import enqueue_upload_job
+from .pagination import PageParamError, akeyset_page, parse_page_params
+from .catalog_cache import acached_json_response, json_body, unit_scope, units_scope
+from .search import KIND_EXAM, KIND_PDF, SearchQueryError, search_documents
+from .previews import page_key, page_render_dpi, rendered_page, thumbnail_bytes
+from .service_worker import service_worker_context
+from .bundles import bundle_cache, bundle_key, iter_bundle
+from .streaming import RangeNotSatisfiable, file_response, iter_file, parse_byte_range, single_range, streaming_content
+from .counters import DOWNLOAD, VIEW, count
+from .file_proxy import HIT, MISS, document_key, file_cache, file_key, record_request, stream_into_cache
+
+UNIT_FIELDS = ("id", "unitCode", "unitTitle")
+# Matches the expression indexed by migration 0010 on Postgres
+UNIT_CODE_KEY = Upper(Replace("unitCode", Value(" "), Value("")))
+UNIT_PDF_FIELDS = ('id','pdfTitle','pdfDownloadLink','pdfPageCount','pdfSize','pdfDate','uploadedBy','viewCount','downloadCount')
+# ?order=popular on a unit's PDF list: most opened and downloaded first
+POPULARITY = F('viewCount') + F('downloadCount')
+
+async def _in_thread(func, *args):
+    """
+    Run slow storage or CPU work in a pool thread rather than on the single thread
+    that sync_to_async and sync views share, so it cannot queue other requests
+    behind it. Any DB connection it opened is closed, as no request cycle will.
+    """
+    def run():
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+    return await asyncio.to_thread(run)
+
+async def get_units(request):
+    try:
+        params = parse_page_params(request, UNIT_FIELDS)
+    except PageParamError as error:
+        return JsonResponse({"message": str(error)}, status=400)
+
+    async def build():
+        return json_body(await akeyset_page(UnitProfile.objects.all(), params))
+    return await acached_json_response(request, units_scope(), build, variant=params.variant)
+
+async def get_unit(request, unit_id):
+    async def build():
+        unit = await aget_object_or_404(UnitProfile.objects.annotate(pdfCount=Count("pdfs")), id=unit_id)
+        return json_body({"id": unit.id, "unitCode": unit.unitCode, "unitTitle": unit.unitTitle, "pdfCount": unit.pdfCount})
+    return await acached_json_response(request, unit_scope(unit_id), build, variant="detail")
+
+async def search_units(request):
+    """Typeahead over unit codes and titles: ?q=, optional ?limit=. Prefix matches come first."""
+    query = " ".join(request.GET.get("q", "").split())[:100]
+    if not query:
+        return JsonResponse({"message": "q is required"}, status=400)
+    try:
+        limit = min(int(request.GET.get("limit", settings.UNIT_SEARCH_LIMIT)), settings.UNIT_SEARCH_LIMIT)
+    except ValueError:
+        return JsonResponse({"message": "limit must be an integer"}, status=400)
+    if limit < 1:
+        return JsonResponse({"message": "limit must be positive"}, status=400)
+    # Codes are compared without spaces so "sma191" finds "SMA 191"
+    code_query = query.replace(" ", "").upper()
+    title_query = query.upper()
+
+    async def build():
+        units = (
+            UnitProfile.objects.annotate(code_key=UNIT_CODE_KEY, title_key=Upper("unitTitle"))
+            .filter(Q(code_key__contains=code_query) | Q(title_key__contains=title_query))
+            .annotate(rank=Case(
+                When(code_key__startswith=code_query, then=Value(0)),
+                When(title_key__startswith=title_query, then=Value(1)),
+                default=Value(2),
+            ))
+            .order_by("rank", "unitCode")
+            .values(*UNIT_FIELDS)[:limit]
+        )
+        return json_body([unit async for unit in units])
+    query_key = hashlib.sha256(title_query.encode()).hexdigest()[:32]
+    return await acached_json_response(request, units_scope(), build, variant=f"search:{limit}:{query_key}")
 
-def get_units(request):
-    units = UnitProfile.objects.all().values("id","unitCode","unitTitle")
-    return JsonResponse(list(units),safe=False)
+async def get_pdfs_by_unit(request,unit_id):
+    """A unit's PDFs in upload order, or with ?order=popular most viewed and downloaded first"""
+    try:
+        params = parse_page_params(request, UNIT_PDF_FIELDS)
+    except PageParamError as error:
+        return JsonResponse({"message": str(error)}, status=400)
+    order = request.GET.get("order") or "id"
+    if order not in ("id", "popular"):
+        return JsonResponse({"message": "order must be 'id' or 'popular'"}, status=400)
+    if order == "popular" and params.cursor is not None:
+        return JsonResponse({"message": "cursor is not supported with order=popular; use limit for the top PDFs"}, status=400)
+
+    async def build():
+        unit=await aget_object_or_404(UnitProfile,id=unit_id)
+        unit_pdfs = UnitPdf.objects.filter(unit=unit)
+        if order == "id":
+            return json_body(await akeyset_page(unit_pdfs, params))
+        # Counts reach the database in periodic batches and this list is cached
+        # per unit, so the ranking trails live activity by a few minutes
+        rows = unit_pdfs.order_by(POPULARITY.desc(), "id").values(*params.fields)
+        if not params.paginated:
+            return json_body([row async for row in rows])
+        return json_body({"results": [row async for row in rows[:params.limit]], "next_cursor": None})
+    return await acached_json_response(request, unit_scope(unit_id), build, variant=f"{order}:{params.variant}")
+
+async def unit_bundle(request, unit_id):
+    """
+    Every PDF of a unit as one ZIP. A new bundle is streamed while its sources
+    download and cached once complete; later requests are served from the cache.
+    """
+    unit = await aget_object_or_404(UnitProfile.objects.only("unitCode"), id=unit_id)
+    unit_pdfs = [
+        unit_pdf async for unit_pdf in UnitPdf.objects.filter(unit=unit).exclude(pdfDownloadLink=None)
+        .only("id", "pdfTitle", "pdfDownloadLink", "pdfDate").order_by("id")
+    ]
+    if not unit_pdfs:
+        raise Http404("This unit has no PDFs")
+    key = bundle_key(unit_id, unit_pdfs)
+    etag = f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cached = None
+        path = bundle_cache().get_path(key)
+        if path is not None:
+            try:
+                cached = open(path, "rb")
+            except FileNotFoundError:
+                pass
+        if cached is not None:
+            response = StreamingHttpResponse(streaming_content(request, iter_file(cached)), content_type="application/zip")
+            response["Content-Length"] = str(os.fstat(cached.fileno()).st_size)
+        else:
+            response = StreamingHttpResponse(streaming_content(request, iter_bundle(unit_pdfs, key)), content_type="application/zip")
+        response["Content-Disposition"] = content_disposition_header(True, f"{unit.unitCode}.zip")
+        response["X-Bundle-Cache"] = "hit" if cached is not None else "miss"
+        # Revalidations answered with 304 are not new downloads
+        for unit_pdf in unit_pdfs:
+            count(unit_pdf.id, DOWNLOAD)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_BROWSER_MAX_AGE, must_revalidate=True)
+    return response
+
+async def search(request):
+    """Ranked full-text search over PDF and exam paper contents: ?q=, optional ?unit=, ?kind=pdf|exam, ?limit="""
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"message": "q is required"}, status=400)
+    kind = request.GET.get("kind") or None
+    if kind not in (None, KIND_PDF, KIND_EXAM):
+        return JsonResponse({"message": "kind must be 'pdf' or 'exam'"}, status=400)
+    try:
+        limit = min(int(request.GET.get("limit", settings.SEARCH_PAGE_SIZE)), settings.SEARCH_PAGE_SIZE_MAX)
+    except ValueError:
+        return JsonResponse({"message": "limit must be an integer"}, status=400)
+    if limit < 1:
+        return JsonResponse({"message": "limit must be positive"}, status=400)
 
-def get_pdfs_by_unit(request,unit_id):
-    unit=get_object_or_404(UnitProfile,id=unit_id)
-    pdfs=UnitPdf.objects.filter(unit=unit).values('id','pdfTitle','pdfDownloadLink','pdfPageCount','pdfSize','pdfDate','uploadedBy')
-    return JsonResponse(list(pdfs),safe=False)
+    try:
+        results = await _in_thread(lambda: search_documents(query, unit_code=request.GET.get("unit") or None, kind=kind, limit=limit))
+    except SearchQueryError as error:
+        return JsonResponse({"message": str(error)}, status=400)
+    return JsonResponse({"query": query, "results": results})
+
+def pdf_preview(request, pdf_id):
+    """WebP thumbnail of a PDF's first page. A PDF's content never changes, so browsers may keep it for a year."""
+    content_hash = get_object_or_404(UnitPdf.objects.values_list("contentHash", flat=True), id=pdf_id)
+    etag = f'"{content_hash}"'
+    response = get_conditional_response(request, etag=etag) if content_hash else None
+    if response is None:
+        data = thumbnail_bytes(content_hash) if content_hash else None
+        if data is None:
+            raise Http404("No preview for this PDF")
+        response = HttpResponse(data, content_type="image/webp")
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.PREVIEW_MAX_AGE, immutable=True)
+    return response
+
+async def pdf_page(request, pdf_id, page_num):
+    """
+    One page of a PDF rendered to WebP on the server, for readers on phones too slow
+    to run pdf.js: ?dpi= picks the resolution and ?dark=1 inverts it for dark mode.
+    """
+    unit_pdf = await aget_object_or_404(UnitPdf.objects.only("contentHash", "pdfDownloadLink", "pdfPageCount"), id=pdf_id)
+    try:
+        dpi = page_render_dpi(int(request.GET["dpi"]) if "dpi" in request.GET else None)
+    except ValueError:
+        return JsonResponse({"message": "dpi must be an integer"}, status=400)
+    dark = request.GET.get("dark", "").lower() in ("1", "true")
+    if page_num < 1 or (unit_pdf.pdfPageCount and page_num > unit_pdf.pdfPageCount):
+        raise Http404("No such page")
+    etag = f'"{hashlib.sha256(page_key(unit_pdf, page_num, dpi, dark).encode()).hexdigest()[:32]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            data = await _in_thread(rendered_page, unit_pdf, page_num, dpi, dark)
+        except Exception as e:
+            logger.error(f"Could not render page {page_num} of PDF {pdf_id}: {e}")
+            return JsonResponse({"message": "Could not render this page"}, status=502)
+        if data is None:
+            raise Http404("No such page")
+        response = HttpResponse(data, content_type="image/webp")
+        if page_num == 1 and not dark:
+            # The image reader opens on page 1 in light mode; later pages and dark re-renders are the same read
+            count(pdf_id, VIEW)
+    response["ETag"] = etag
+    if unit_pdf.pdfPageCount:
+        response["X-Page-Count"] = str(unit_pdf.pdfPageCount)
+    patch_cache_control(response, public=True, max_age=settings.PREVIEW_MAX_AGE, immutable=True)
+    return response
+
+async def pdf_file(request, pdf_id):
+    """
+    A PDF's stored file through the local disk cache, so repeat reads are not paid
+    for at Cloudinary. Single Range requests are honoured: on hits from the cached
+    file, on misses by passing the range on to the source while the cache fills in
+    the background. Whole-file misses stream from the source into the cache.
+    ?download=1 sends it as an attachment.
+    """
+    unit_pdf = await aget_object_or_404(
+        UnitPdf.objects.exclude(pdfDownloadLink=None).only("pdfTitle", "pdfDownloadLink", "contentHash"), id=pdf_id
+    )
+    download = request.GET.get("download") == "1"
+    etag = f'"{document_key(unit_pdf)[:32]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cached = None
+        path = file_cache().get_path(file_key(unit_pdf))
+        if path is not None:
+            try:
+                cached = open(path, "rb")
+            except FileNotFoundError:
+                pass
+        if cached is not None:
+            size = os.fstat(cached.fileno()).st_size
+            byte_range = None
+            # If-Range: a client holding another version gets the whole file rather than a mismatched range
+            if request.headers.get("If-Range", etag) == etag:
+                try:
+                    byte_range = parse_byte_range(request.headers.get("Range"), size)
+                except RangeNotSatisfiable:
+                    cached.close()
+                    response = HttpResponse(status=416)
+                    response["Content-Range"] = f"bytes */{size}"
+                    return response
+            start, end = byte_range or (0, size - 1)
+            response = file_response(request, cached, start, end - start + 1, "application/pdf")
+            if byte_range:
+                response.status_code = 206
+                response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            await _in_thread(record_request, HIT, end - start + 1)
+        else:
+            range_header = request.headers.get("Range") if request.headers.get("If-Range", etag) == etag else None
+            try:
+                fetch = await _in_thread(stream_into_cache, unit_pdf, single_range(range_header))
+            except Exception as e:
+                logger.error(f"Could not fetch PDF {pdf_id} from storage: {e}")
+                return JsonResponse({"message": "Could not fetch this PDF"}, status=502)
+            if fetch.status == 416:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = fetch.content_range or "bytes */*"
+                return response
+            response = StreamingHttpResponse(streaming_content(request, fetch.chunks), content_type="application/pdf", status=fetch.status)
+            if fetch.length is not None:
+                response["Content-Length"] = str(fetch.length)
+            if fetch.status == 206:
+                response["Content-Range"] = fetch.content_range
+                await _in_thread(record_request, MISS, fetch.length or 0)
+        title = unit_pdf.pdfTitle if unit_pdf.pdfTitle.lower().endswith(".pdf") else f"{unit_pdf.pdfTitle}.pdf"
+        response["Content-Disposition"] = content_disposition_header(download, title)
+        response["Accept-Ranges"] = "bytes"
+        response["X-Cache"] = "HIT" if cached is not None else "MISS"
+        if "Range" not in request.headers:
+            # pdf.js opens a file with one plain GET and then fetches ranges; count only the first
+            count(pdf_id, DOWNLOAD if download else VIEW)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.PREVIEW_MAX_AGE, immutable=True)
+    return response
 
 def render_home(request):
     return render(request, 'core/home.html')
@@ -37,38 +311,41 @@ def render_upload_pdf(request):
 def render_units(request):
     return render(request, 'core/units.html')
 
-def fetch_unit_code(unit_id):
-    unit = get_object_or_404(UnitProfile, id=unit_id)
-    return unit.unitCode
+
+# The upload views are async so that, under ASGI, slow request bodies and storage
+# calls do not hold a worker. Storage and PDF work runs in _in_thread; only short
+# ORM writes go through sync_to_async or the async ORM.
+
+async def _upload_data(request):
+    """request.POST and request.FILES, parsed off the event loop since large files are spooled to disk"""
+    await asyncio.to_thread(lambda: request.FILES)
+    return request.POST, request.FILES
+
+
+async def _uploader(request):
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
 
 @csrf_exempt
-def single_upload_pdf(request):
+async def single_upload_pdf(request):
     if request.method == 'POST':
-        pdf_file = request.FILES.get("pdf")
+        post, files = await _upload_data(request)
+        pdf_file = files.get("pdf")
         
         if not pdf_file:
             return JsonResponse({"message": "No PDF file provided"}, status=400)
 
         try:
-            unit_code = request.POST.get("unitCode")
+            unit_code = post.get("unitCode")
             if not unit_code:
                 return JsonResponse({"message": "Unit code is required"}, status=400)
 
-            # Upload file and get download link
-            DownloadLink = upload_pdf_to_cloudinary(pdf_file, unit_code)
-            if not UnitProfile.objects.filter(unitCode=unit_code).exists():
-                unit = UnitProfile.objects.create(unitCode=unit_code)
-
-            # Save to database
-            unit_pdf = UnitPdf.objects.create(
-                unit=UnitProfile.objects.get(unitCode=unit_code),
-                pdfTitle=pdf_file.name,
-                pdfDownloadLink=DownloadLink,
-                pdfSize=pdf_file.size,
-                pdfPageCount=extract_pdf_page_count(pdf_file),
-                pdfDate=date.today()
-            )
-        
+            if settings.UPLOAD_JOBS_ENABLED:
+                job = await _in_thread(lambda: enqueue_upload_job(UploadJob.KIND_SINGLE, files, payload={"unitCode": unit_code}))
+                return job_accepted_response(request, job)
+
+            await _in_thread(process_single_pdf, pdf_file, unit_code)
 
             return JsonResponse({"message": "PDF uploaded successfully"}, status=201)
 
@@ -79,74 +356,18 @@ def single_upload_pdf(request):
 
 
 
-UNIT_CODE_PATTERN = r'([A-Za-z]{3,4})\s*[_-]?\s*(\d{3})'
-
-def direct_code_extraction(fileName):
-    """Extract unit code from filename"""
-    match = re.search(UNIT_CODE_PATTERN, fileName)
-    return f"{match.group(1).upper()}{match.group(2)}" if match else None
-
-def extract_text_inside_pdf(pdf):
-    """Extracts text from the first 3 pages of a PDF"""
-    try:
-        pdfDoc = fitz.open(stream=pdf.read(), filetype="pdf")
-        text = "".join([pdfDoc[page_num].get_text() for page_num in range(min(3, len(pdfDoc)))])
-        pdfDoc.close()
-        return text
-    except Exception as e:
-        return None
-
-def extract_unit_code_from_pdf(pdf):
-    """Extract unit code from PDF text"""
-    return direct_code_extraction(extract_text_inside_pdf(pdf))
-
-def upload_pdf_to_cloudinary(pdf, folder_name):
-    """Upload PDF directly to Cloudinary"""
-    try:
-        response = cloudinary.uploader.upload(
-            pdf,
-            folder=f"kuStudyHub/{folder_name}",
-            resource_type="auto",
-        )
-        return response["secure_url"]
-    except Exception as e:
-        print(f"Cloudinary upload failed: {e}")
-        return None
-
-def extract_pdf_page_count(pdf):
-    """Extract number of pages in a PDF"""
-    try:
-        pdfDoc = fitz.open(stream=pdf.read(), filetype="pdf")
-        return pdfDoc.page_count
-    except Exception as e:
-        return None
-
 @csrf_exempt
-def multipleFileUploads(request):
-    if request.method == 'POST' and request.FILES.getlist('files'):
-        uploaded_files = request.FILES.getlist('files')
-
-        file_urls = []
-        for file in uploaded_files:
-            unit_Code = direct_code_extraction(file.name) or extract_unit_code_from_pdf(file)
-
-            if unit_Code:
-                cloudinary_url = upload_pdf_to_cloudinary(file, unit_Code)
-
-                if cloudinary_url:
-                    unit, _ = UnitProfile.objects.get_or_create(unitCode=unit_Code, defaults={"unitTitle": unit_Code})
-                    UnitPdf.objects.create(
-                        unit=unit,
-                        pdfTitle=file.name,
-                        pdfDownloadLink=cloudinary_url,
-                        pdfSize=file.size // 1024,
-                        pdfPageCount=extract_pdf_page_count(file),
-                        pdfDate=date.today()
-                    )
-
-                    file_urls.append(cloudinary_url)
+async def multipleFileUploads(request):
+    if request.method == 'POST':
+        _, files = await _upload_data(request)
+        if files.getlist('files'):
+            if settings.UPLOAD_JOBS_ENABLED:
+                job = await _in_thread(enqueue_upload_job, UploadJob.KIND_BATCH, files)
+                return job_accepted_response(request, job)
 
-        return JsonResponse({'message': 'Files processed and uploaded!', 'files': file_urls})
+            results = await _in_thread(upload_pdfs_concurrently, files.getlist('files'))
+            await sync_to_async(save_uploaded_pdfs)(results)
+            return JsonResponse(batch_upload_response(results))
 
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
@@ -154,215 +375,125 @@ def multipleFileUploads(request):
 
 @require_POST
 @csrf_exempt
-def upload_exam_papers_view(request):
+async def upload_exam_papers_view(request):
     """
     Handles POST requests to upload exam paper files, grouped by unit code,
     to Backblaze B2 storage. Expects files under keys like 'files_UNITCODE'
     and optional metadata under 'metadata_UNITCODE'.
     """
-    uploaded_file_details = []
-    errors = []
-    processed_unit_codes = set()
-
-    b2_key_id = getattr(settings, 'B2_APPLICATION_KEY_ID', None)
-    b2_key = getattr(settings, 'B2_APPLICATION_KEY', None)
-    b2_bucket_name = getattr(settings, 'B2_BUCKET_NAME', None)
-    b2_base_folder = getattr(settings, 'B2_UPLOAD_FOLDER', 'uploads/')
+    uploader_user = await _uploader(request)
+    post, files = await _upload_data(request)
 
-    if not all([b2_key_id, b2_key, b2_bucket_name]):
-        logger.error("B2 configuration missing in Django settings (B2_APPLICATION_KEY_ID, B2_APPLICATION_KEY, B2_BUCKET_NAME).")
-        return JsonResponse({'status': 'error', 'message': 'Server configuration error: Storage not configured.'}, status=500)
+    if settings.UPLOAD_JOBS_ENABLED:
+        if not files:
+            logger.warning("Upload request received with no files.")
+            return HttpResponseBadRequest("No files were submitted in the request.")
+        metadata = {key: value for key, value in post.items() if key.startswith(EXAM_METADATA_KEY_PREFIX)}
+        job = await _in_thread(lambda: enqueue_upload_job(UploadJob.KIND_EXAM, files, payload={'metadata': metadata}, uploader=uploader_user))
+        return job_accepted_response(request, job)
 
     try:
-        logger.info("Initializing B2 API.")
-        info = InMemoryAccountInfo()
-        b2_api = B2Api(info)
-        b2_api.authorize_account("production", b2_key_id, b2_key)
-        logger.info(f"Attempting to get B2 bucket: {b2_bucket_name}")
-        bucket = b2_api.get_bucket_by_name(b2_bucket_name)
-        logger.info(f"Successfully accessed B2 bucket: {b2_bucket_name}")
-    except NonExistentBucket:
-         logger.error(f"B2 Bucket '{b2_bucket_name}' not found.", exc_info=True)
-         return JsonResponse({'status': 'error', 'message': f"Server configuration error: B2 Bucket '{b2_bucket_name}' not found."}, status=500)
-    except B2Error as e:
-        logger.error(f"B2 API Error during initialization or bucket access: {e}", exc_info=True)
-        return JsonResponse({'status': 'error', 'message': 'Error connecting to storage service.'}, status=500)
-    except Exception as e:
-        logger.error(f"Unexpected error during B2 initialization: {e}", exc_info=True)
-        return JsonResponse({'status': 'error', 'message': 'An unexpected server error occurred during storage initialization.'}, status=500)
-
-    if not request.FILES:
+        bucket = await asyncio.to_thread(open_exam_bucket)
+    except ExamStorageError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    if not files:
         logger.warning("Upload request received with no files.")
         return HttpResponseBadRequest("No files were submitted in the request.")
 
-    file_key_prefix = "files_"
-    metadata_key_prefix = "metadata_"
-
-    for file_key in request.FILES.keys():
-        if not file_key.startswith(file_key_prefix):
-            logger.warning(f"Skipping unexpected file key in request: {file_key}")
-            continue
-
-        sanitized_unit_code = file_key[len(file_key_prefix):]
-
-        if not sanitized_unit_code:
-             logger.warning(f"Could not extract unit code from file key: {file_key}")
-             errors.append({'key': file_key, 'error': 'Invalid file key format.'})
-             continue
-
-        if sanitized_unit_code in processed_unit_codes:
-             continue
-        processed_unit_codes.add(sanitized_unit_code)
-
-        files_for_unit = request.FILES.getlist(file_key)
-        if not files_for_unit:
-            logger.warning(f"No files found for key {file_key}, though key exists.")
-            continue
+    files_by_key = {file_key: files.getlist(file_key) for file_key in files.keys()}
+    uploaded_file_details, errors = await _in_thread(process_exam_uploads, bucket, files_by_key, post, uploader_user)
+    payload, status = exam_upload_response(uploaded_file_details, errors)
+    return JsonResponse(payload, status=status)
 
-        metadata_key = f"{metadata_key_prefix}{sanitized_unit_code}"
-        metadata_str = request.POST.get(metadata_key)
-        metadata = {}
-        original_code = sanitized_unit_code
 
-        if metadata_str:
-            try:
-                metadata = json.loads(metadata_str)
-                original_code = metadata.get('originalCode', sanitized_unit_code)
-                logger.info(f"Parsed metadata for {sanitized_unit_code}: {metadata}")
-            except json.JSONDecodeError:
-                logger.warning(f"Could not decode JSON metadata for key {metadata_key}. String was: '{metadata_str}'")
-                errors.append({'unit_code': sanitized_unit_code, 'error': 'Invalid metadata format received.'})
-            except Exception as e:
-                 logger.error(f"Error processing metadata for {metadata_key}: {e}", exc_info=True)
-                 errors.append({'unit_code': sanitized_unit_code, 'error': f'Error processing metadata: {e}'})
-
-        for f in files_for_unit:
-            try:
-                f.seek(0)
-                file_data = f.read()
-                original_filename = f.name
-                content_type = f.content_type or 'application/octet-stream'
-
-                unique_suffix = f"{uuid.uuid4()}_{original_filename}"
-                b2_object_name_parts = [b2_base_folder.strip('/'), sanitized_unit_code, unique_suffix]
-                b2_object_name = "/".join(part for part in b2_object_name_parts if part)
+def _json_body(request):
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError:
+        raise DirectUploadError("Request body must be JSON")
+    if not isinstance(body, dict):
+        raise DirectUploadError("Request body must be a JSON object")
+    return body
 
-                logger.info(f"Uploading file '{original_filename}' for unit '{original_code}' to B2 path: {b2_object_name}")
 
-                uploaded_b2_file_info = bucket.upload_bytes(
-                    data_bytes=file_data,
-                    file_name=b2_object_name,
-                    content_type=content_type
-                )
+@require_POST
+@csrf_exempt
+async def sign_direct_upload(request):
+    """
+    Signed parameters for uploading one file straight to storage. Expects JSON with
+    kind ('pdf' or 'exam'), filename, size, and for exam papers unitCode and metadata.
+    """
+    try:
+        body = _json_body(request)
+        signed = await asyncio.to_thread(
+            sign_upload,
+            body.get('kind'), body.get('filename'), body.get('size'),
+            unit_code=(body.get('unitCode') or '').strip() or None, metadata=body.get('metadata'),
+        )
+    except DirectUploadError as e:
+        return JsonResponse({'message': str(e)}, status=400)
+    return JsonResponse(signed)
 
-                try:
-                    paper_title = metadata.get('title', None)
-
-                    paper_year_str = metadata.get('year', None)
-                    paper_year = None
-                    if paper_year_str:
-                        try:
-                            paper_year = int(paper_year_str)
-                        except (ValueError, TypeError):
-                            logger.warning(f"Could not convert year '{paper_year_str}' to integer for unit {original_code}. Saving as NULL.")
-                            errors.append({'unit_code': original_code, 'filename': f.name, 'warning': f'Invalid year value received: {paper_year_str}'})
-
-
-                    paper_semester_str = metadata.get('semester', None)
-                    paper_semester = None
-                    if paper_semester_str:
-                        try:
-                            paper_semester = int(paper_semester_str)
-                            if paper_semester not in [choice[0] for choice in ExamPaper.SEMESTER_CHOICES]:
-                                logger.warning(f"Invalid semester value '{paper_semester}' received for unit {original_code}. Saving as NULL.")
-                                errors.append({'unit_code': original_code, 'filename': f.name, 'warning': f'Invalid semester value received: {paper_semester_str}'})
-                                paper_semester = None
-                        except (ValueError, TypeError):
-                            logger.warning(f"Could not convert semester '{paper_semester_str}' to integer for unit {original_code}. Saving as NULL.")
-                            errors.append({'unit_code': original_code, 'filename': f.name, 'warning': f'Invalid semester value received: {paper_semester_str}'})
-
-                    uploader_user = None
-                    if request.user.is_authenticated:
-                        uploader_user = request.user
-
-                    paper_record = ExamPaper.objects.create(
-                        unit_code=original_code,
-                        title=paper_title,
-                        year=paper_year,
-                        semester=paper_semester,
-                        original_filename=original_filename,
-                        content_type=content_type,
-                        size=f.size,
-                        b2_file_path=b2_object_name,
-                        b2_file_id=uploaded_b2_file_info.id_,
-                        uploader=uploader_user
-                    )
-                    logger.info(f"Successfully saved DB record for {b2_object_name} with ID {paper_record.id}")
-
-                    upload_detail = {
-                        'db_id': paper_record.id,
-                        'unit_identifier': original_code,
-                        'sanitized_code': sanitized_unit_code,
-                        'original_filename': original_filename,
-                        'b2_object_name': b2_object_name,
-                        'b2_file_id': uploaded_b2_file_info.id_,
-                        'size': f.size,
-                        'content_type': content_type,
-                        'metadata': metadata
-                    }
-                    uploaded_file_details.append(upload_detail)
-
-                except Exception as db_exc:
-                    logger.error(f"Database Error saving record for B2 file {b2_object_name} (Unit: {original_code}, File: {original_filename}): {db_exc}", exc_info=True)
-                    errors.append({
-                        'unit_code': original_code,
-                        'filename': original_filename,
-                        'error': f'Database saving error: {db_exc}'
-                    })
-
-            except B2Error as e:
-                logger.error(f"B2 Upload Error for {sanitized_unit_code}/{f.name}: {e}", exc_info=True)
-                errors.append({
-                    'unit_code': original_code,
-                    'filename': f.name,
-                    'error': f'Storage upload error: {e}'
-                })
-            except Exception as e:
-                logger.error(f"General Error processing file {sanitized_unit_code}/{f.name}: {e}", exc_info=True)
-                errors.append({
-                    'unit_code': original_code,
-                    'filename': f.name,
-                    'error': f'Server processing error: {e}'
-                })
-
-    if errors and not uploaded_file_details:
-        logger.error(f"Upload request failed. Errors: {errors}")
-        return JsonResponse({
-            'status': 'error',
-            'message': 'File upload failed for all items.',
-            'errors': errors
-        }, status=400)
-    elif errors:
-        logger.warning(f"Upload partially succeeded. Uploaded: {len(uploaded_file_details)}, Errors: {errors}")
-        return JsonResponse({
-            'status': 'partial_success',
-            'message': f'Successfully uploaded {len(uploaded_file_details)} file(s), but some errors occurred.',
-            'uploaded': uploaded_file_details,
-            'errors': errors
-        }, status=207)
-    else:
-        logger.info(f"Successfully uploaded {len(uploaded_file_details)} file(s).")
-        return JsonResponse({
-            'status': 'success',
-            'message': f'Successfully uploaded {len(uploaded_file_details)} file(s).',
-            'uploaded': uploaded_file_details
-        }, status=201)
 
+@require_POST
+@csrf_exempt
+async def finalize_direct_upload(request):
+    """Record a file the browser uploaded with sign_direct_upload's parameters. Expects JSON {ticket, upload}."""
+    uploader_user = await _uploader(request)
+    try:
+        body = _json_body(request)
+        payload = await _in_thread(finalize_upload, body.get('ticket'), body.get('upload'))
+    except DirectUploadError as e:
+        return JsonResponse({'message': str(e)}, status=400)
+
+    if settings.UPLOAD_JOBS_ENABLED:
+        job = await sync_to_async(enqueue_upload_job)(UploadJob.KIND_DIRECT, MultiValueDict(), payload=payload, uploader=uploader_user)
+        return job_accepted_response(request, job)
+    result, status = await _in_thread(complete_upload, payload, uploader_user)
+    return JsonResponse(result, status=status)
+
+
+async def upload_job_status(request, job_id):
+    """Reports the progress of a queued upload and, once finished, its result"""
+    job = await aget_object_or_404(UploadJob, id=job_id)
+    files = [f async for f in job.files.values('id', 'original_filename', 'status', 'result', 'error')]
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'total': len(files),
+        'processed': sum(1 for f in files if f['status'] != UploadJobFile.STATUS_PENDING),
+        'files': files,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    })
+
+
+def job_accepted_response(request, job):
+    status_url = request.build_absolute_uri(reverse('upload_job_status', args=[job.id]))
+    response = JsonResponse({
+        'status': 'queued',
+        'message': 'Upload received and queued for processing.',
+        'job_id': job.id,
+        'status_url': status_url,
+    }, status=202)
+    response['Location'] = status_url
+    return response
 
 
 def render_search_console_verifier(request):
     return render(request, 'core/googlefd298c7641c3b2af.html')
 
+def service_worker(request):
+    """The service worker script, rendered with this deploy's cache version and app shell"""
+    response = render(request, 'sw.js', service_worker_context(), content_type="application/javascript")
+    # Browsers must re-check the worker on every visit or a deploy would never reach them
+    patch_cache_control(response, no_cache=True)
+    return response
+
 def render_reader(request):
     return render(request, 'core/pdf-reader.html')
 
@@ -0,0 +1,121 @@
+// Uploads files straight to Cloudinary (notes) or B2 (exam papers) with parameters
+// signed by /api/uploads/sign/, then records them through /api/uploads/finalize/,
+// so file bytes never pass through the web server.
+(function () {
+    async function postJson(url, body) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body)
+        });
+        let data = {};
+        try {
+            data = await response.json();
+        } catch (e) {
+            data = { message: `${response.status} ${response.statusText}` };
+        }
+        return { ok: response.ok, status: response.status, data };
+    }
+
+    // Finalized uploads may be queued for the worker; wait for its result
+    async function waitForJob(statusUrl) {
+        while (true) {
+            const job = await (await fetch(statusUrl)).json();
+            if (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                continue;
+            }
+            if (job.status === 'failed') throw new Error(job.error || 'Upload failed');
+            if (job.result.http_status >= 400) throw new Error(job.result.message || 'Upload failed');
+            return job.result;
+        }
+    }
+
+    async function sha1Hex(file) {
+        const digest = await crypto.subtle.digest('SHA-1', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function sendToStorage(signed, file) {
+        let response;
+        if (signed.provider === 'cloudinary') {
+            const form = new FormData();
+            Object.entries(signed.fields).forEach(([name, value]) => form.append(name, value));
+            form.append('file', file);
+            response = await fetch(signed.uploadUrl, { method: 'POST', body: form });
+        } else {
+            response = await fetch(signed.uploadUrl, {
+                method: 'POST',
+                headers: {
+                    'Authorization': signed.authorizationToken,
+                    'X-Bz-File-Name': signed.fileName.split('/').map(encodeURIComponent).join('/'),
+                    'Content-Type': signed.contentType,
+                    'X-Bz-Content-Sha1': await sha1Hex(file)
+                },
+                body: file
+            });
+        }
+        const data = await response.json();
+        if (!response.ok) throw new Error((data.error && data.error.message) || data.message || 'Storage upload failed');
+        return data;
+    }
+
+    /**
+     * Upload one file. options: { kind: 'pdf' | 'exam', unitCode, metadata }.
+     * Errors thrown before anything was stored carry signFailed = true.
+     */
+    async function directUpload(file, options) {
+        const sign = await postJson('/api/uploads/sign/', {
+            kind: options.kind,
+            filename: file.name,
+            size: file.size,
+            unitCode: options.unitCode || '',
+            metadata: options.metadata || {}
+        });
+        if (!sign.ok) {
+            const error = new Error(sign.data.message || 'Could not start the upload');
+            error.signFailed = true;
+            throw error;
+        }
+        const upload = await sendToStorage(sign.data, file);
+        const finalized = await postJson('/api/uploads/finalize/', { ticket: sign.data.ticket, upload });
+        if (finalized.status === 202) return waitForJob(finalized.data.status_url);
+        if (!finalized.ok) throw new Error(finalized.data.message || 'Upload failed');
+        return finalized.data;
+    }
+
+    /**
+     * Upload [{ file, kind, unitCode, metadata }] with a few files in flight, reporting
+     * onProgress(done, total). Resolves to [{ ok, result | error }] in input order.
+     * The first file goes alone, so when direct uploads are unavailable the call
+     * rejects (with signFailed) before anything is stored and callers can fall back.
+     */
+    async function directUploadMany(items, onProgress, concurrency = 3) {
+        const results = new Array(items.length);
+        let next = 0;
+        let done = 0;
+
+        async function run(index) {
+            try {
+                results[index] = { ok: true, result: await directUpload(items[index].file, items[index]) };
+            } catch (error) {
+                if (index === 0 && error.signFailed) throw error;
+                results[index] = { ok: false, error: error.message };
+            }
+            done++;
+            if (onProgress) onProgress(done, items.length);
+        }
+
+        if (items.length === 0) return results;
+        await run(next++);
+        const workers = Array.from({ length: Math.min(concurrency, items.length - 1) }, async () => {
+            while (next < items.length) await run(next++);
+        });
+        await Promise.all(workers);
+        return results;
+    }
+
+    window.directUpload = directUpload;
+    window.directUploadMany = directUploadMany;
+    window.waitForUploadJob = waitForJob;
+})();
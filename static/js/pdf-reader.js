@@ -4,7 +4,21 @@ function getQueryParam(name) {
 }
 
 const url = getQueryParam('filelink');
+const pdfId = getQueryParam('pdf');
+const pageCount = parseInt(getQueryParam('pages'), 10) || 0;
 let isDarkMode = false; // Track dark mode state
+let imagePages = false; // True while pages are server-rendered images rather than pdf.js canvases
+
+// Pixels across the viewer for an A4-width page, converted to the DPI the server should render at
+function pageDpi() {
+    const viewer = document.querySelector('#pdf-viewer');
+    const width = (viewer ? viewer.clientWidth : window.innerWidth) * (window.devicePixelRatio || 1);
+    return Math.round(width / 8.27);
+}
+
+function pageImageUrl(num) {
+    return `/api/pdf/${pdfId}/page/${num}/?dpi=${pageDpi()}${isDarkMode ? '&dark=1' : ''}`;
+}
 
 function applyDarkMode(canvas, ctx) {
     const imageData = ctx.getImageData(0, 0, canvas.width, canvas.height);
@@ -34,6 +48,15 @@ function toggleDarkMode() {
         darkModeBtnIcon.classList.add('fa-moon');
     }
 
+    if (imagePages) {
+        // The server renders inverted pages; swap each image for its other-mode render
+        document.querySelectorAll('img.pdf-page').forEach(img => {
+            img.src = pageImageUrl(Number(img.dataset.page));
+            img.classList.toggle('dark-mode', isDarkMode);
+        });
+        return;
+    }
+
     // Re-render visible pages with or without inversion
     document.querySelectorAll('.pdf-page').forEach(canvas => {
         const ctx = canvas.getContext('2d');
@@ -50,10 +73,34 @@ function toggleDarkMode() {
 }
 
 
-if (!url) {
-    console.error("No file link provided in URL");
-    document.querySelector('#pdf-viewer').innerHTML = "<p>Error: No PDF file specified.</p>";
-} else {
+// Show the PDF as page images rendered and cached by the server. The browser only
+// fetches images near the viewport (loading="lazy"), so nothing is parsed on the phone.
+function loadPageImages() {
+    const pdfViewer = document.querySelector('#pdf-viewer');
+    imagePages = true;
+    for (let num = 1; num <= pageCount; num++) {
+        const img = document.createElement('img');
+        img.className = 'pdf-page pdf-page-image';
+        img.dataset.page = num;
+        img.alt = `Page ${num}`;
+        img.loading = num === 1 ? 'eager' : 'lazy';
+        img.src = pageImageUrl(num);
+        pdfViewer.appendChild(img);
+    }
+    const firstPage = pdfViewer.querySelector('img.pdf-page');
+    firstPage.addEventListener('load', () => {
+        const loader = document.querySelector('.loader');
+        if (loader) loader.style.display = 'none';
+    }, { once: true });
+    firstPage.addEventListener('error', () => {
+        // The server could not render this file; fall back to rendering it here
+        pdfViewer.querySelectorAll('img.pdf-page').forEach(img => img.remove());
+        imagePages = false;
+        loadWithPdfJs();
+    }, { once: true });
+}
+
+function loadWithPdfJs() {
     let pdfDoc = null,
         pageNum = 1,
         pagesRendering = new Set(),
@@ -108,8 +155,14 @@ if (!url) {
         }
     };
 
-    // Load the PDF
-    pdfjsLib.getDocument(url).promise.then(pdfDoc_ => {
+    // Load the PDF. Stored PDFs are linearized, so with auto-fetch off pdf.js
+    // requests only the byte ranges of the pages it renders instead of the whole file.
+    pdfjsLib.getDocument({
+        url: url,
+        disableAutoFetch: true,
+        disableStream: true,
+        rangeChunkSize: 65536
+    }).promise.then(pdfDoc_ => {
         pdfDoc = pdfDoc_;
         renderPage(pageNum);
         const loader = document.querySelector('.loader');
@@ -131,8 +184,17 @@ if (!url) {
             }
         }
     });
+}
 
+if (pdfId && pageCount) {
+    loadPageImages();
+} else if (url) {
+    loadWithPdfJs();
+} else {
+    console.error("No file link provided in URL");
+    document.querySelector('#pdf-viewer').innerHTML = "<p>Error: No PDF file specified.</p>";
 }
+
 document.addEventListener('DOMContentLoaded', () => {
     const darkModeBtn = document.getElementById('darkModeButton');
     darkModeBtn.addEventListener('click', toggleDarkMode);
@@ -24,24 +24,8 @@ document.addEventListener('DOMContentLoaded', () => {
         .then(response => response.json())
         .then(data => {
             units = data;
-            notesGrid.innerHTML = '';
             loader.style.display = 'none';
-            data.forEach(unit => {
-                const noteCard = document.createElement('div');
-                noteCard.className = 'note-card';
-                noteCard.id = unit.id; 
-                noteCard.innerHTML = `
-                    <div class="pdf-icon">PDF</div>
-                    <div class="note-info">
-                        <div class="course-code"> ${unit.unitCode}</div>
-                        <h3> ${unit.unitTitle}</h3>
-                        <a href="/units/?unitId=${unit.id}"> 
-                            <button class="view-pdf-btn">VIEW FILES</button>
-                        </a>
-                    </div>
-                `;
-                notesGrid.appendChild(noteCard); // Append the card to the grid
-            });
+            renderUnitCards(data);
         })
         .catch(error => {
             console.error('Error:', error);
@@ -82,16 +66,9 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     //Search Functionality
-    searchInput.addEventListener('input', () => {
-        const searchValue = searchInput.value.toLowerCase().replace(/\s+/g, ''); // Remove spaces
-        const filteredUnits = units.filter(unit => {
-            const unitCodeNoSpaces = unit.unitCode.toLowerCase().replace(/\s+/g, ''); // Remove spaces from unitCode
-            const unitTitleNoSpaces = unit.unitTitle.toLowerCase().replace(/\s+/g, ''); // Remove spaces from unitTitle
-            return unitCodeNoSpaces.includes(searchValue) || unitTitleNoSpaces.includes(searchValue);
-        });
-    
+    function renderUnitCards(unitsToShow) {
         notesGrid.innerHTML = '';
-        filteredUnits.forEach(unit => {
+        unitsToShow.forEach(unit => {
             const noteCard = document.createElement('div');
             noteCard.className = 'note-card';
             noteCard.id = unit.id;
@@ -107,5 +84,32 @@ document.addEventListener('DOMContentLoaded', () => {
             `;
             notesGrid.appendChild(noteCard);
         });
+    }
+
+    // Matching happens on the server; wait for a pause in typing and drop
+    // responses to queries that have since been replaced.
+    let searchTimer;
+    let searchController;
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(async () => {
+            const searchValue = searchInput.value.trim();
+            if (searchController) {
+                searchController.abort();
+            }
+            if (!searchValue) {
+                renderUnitCards(units);
+                return;
+            }
+            searchController = new AbortController();
+            try {
+                const response = await fetch(`/api/units/search/?q=${encodeURIComponent(searchValue)}`, { signal: searchController.signal });
+                renderUnitCards(await response.json());
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error('Search failed:', error);
+                }
+            }
+        }, 200);
     });
-});    
\ No newline at end of file
+});
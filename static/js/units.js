@@ -4,6 +4,21 @@ document.addEventListener('DOMContentLoaded', async function() {
     const urlParams = new URLSearchParams(window.location.search);
     const unitId = urlParams.get('unitId');
 
+    // Server-rendered page images spare weak phones from parsing PDFs in the browser,
+    // but every page costs the server a render, so only low-end devices, data-saver
+    // connections and readers who opt in (?images=1, remembered) get them.
+    function prefersPageImages() {
+        if (urlParams.get('images') !== null) {
+            localStorage.setItem('readerImages', urlParams.get('images') === '1' ? '1' : '0');
+        }
+        const choice = localStorage.getItem('readerImages');
+        if (choice !== null) return choice === '1';
+        const connection = navigator.connection || {};
+        return Boolean(connection.saveData)
+            || (navigator.deviceMemory !== undefined && navigator.deviceMemory <= 2)
+            || (navigator.hardwareConcurrency !== undefined && navigator.hardwareConcurrency <= 2);
+    }
+
     function comingSoon() {
         const messagearea = document.getElementById('comingSoon');
         if (messagearea) {
@@ -15,38 +30,47 @@ document.addEventListener('DOMContentLoaded', async function() {
     
     if (unitId) {
         try {
-            const unitDetailsRes = await fetch('/api/units/');
-            const unitDetails = await unitDetailsRes.json();
-    
-            const unitIdNum = parseInt(unitId, 10);
-    
-            const unit = unitDetails.find(u => u.id === unitIdNum);
-    
-            if (!unit) {
+            const unitRes = await fetch(`/api/unit/${encodeURIComponent(unitId)}/`);
+            if (unitRes.status === 404) {
                 unitsList.innerHTML = '<p>Unit not found.</p>';
                 return;
             }
+            const unit = await unitRes.json();
     
             const unitCode = unit.unitCode;
     
-            const pdfsRes = await fetch(`/api/unit/${unitId}/pdfs/`);
+            // Most read and downloaded notes first
+            const pdfsRes = await fetch(`/api/unit/${unitId}/pdfs/?order=popular`);
             const pdfs = await pdfsRes.json();
     
-            unitsList.innerHTML = pdfs.map(pdf => `
+            const bundleCard = pdfs.length > 1 ? `
+                <div class="unit-card">
+                    <div class="unit-info">
+                        <div class="unit-code">${unitCode}</div>
+                        <div class="unit-title">All ${pdfs.length} files</div>
+                    </div>
+                    <div class="unit-actions">
+                        <a class="download-btn" href="/api/unit/${unitId}/bundle.zip" download>
+                            <i class="fas fa-file-archive"></i> Download all (ZIP)
+                        </a>
+                    </div>
+                </div>` : '';
+            unitsList.innerHTML = bundleCard + pdfs.map(pdf => `
                 <div class="unit-card">
                     <div class="unit-info">
+                        <img class="pdf-thumb" src="/api/pdf/${pdf.id}/preview/" alt="" loading="lazy" width="120"
+                             onerror="this.remove()">
                         <div class="unit-code">${unitCode}</div>  
                         <div class="unit-title">${pdf.pdfTitle}</div>
                     </div>
                     <div class="unit-actions">
-                        <button class="read-btn" filelink="${pdf.pdfDownloadLink}" 
+                        <button class="read-btn" filelink="/files/${pdf.id}" data-pdf-id="${pdf.id}" data-pages="${pdf.pdfPageCount || ''}"
                                 data-filename="${pdf.pdfTitle.replace(/\s+/g, '_')}.pdf">
                             <i class="fas fa-book"></i> Read
                         </button>
-                        <button class="download-btn" data-url="${pdf.pdfDownloadLink}" 
-                                data-filename="${pdf.pdfTitle.replace(/\s+/g, '_')}.pdf">
+                        <a class="download-btn" href="/files/${pdf.id}?download=1" download>
                             <i class="fas fa-download"></i> Download
-                        </button>
+                        </a>
                     </div>
                 </div>
             `).join('');
@@ -54,7 +78,8 @@ document.addEventListener('DOMContentLoaded', async function() {
                 button.addEventListener('click', () => {
                     console.log('Read button clicked');
                     const link = button.getAttribute('filelink'); 
-                    window.location.href = `/reader?filelink=${encodeURIComponent(link)}`;
+                    const pages = button.dataset.pages && prefersPageImages() ? `&pdf=${button.dataset.pdfId}&pages=${button.dataset.pages}` : '';
+                    window.location.href = `/reader/?filelink=${encodeURIComponent(link)}${pages}`;
                 });
             });
         } catch (error) {
@@ -92,36 +117,16 @@ document.addEventListener('DOMContentLoaded', async function() {
     });
     
 
-    document.addEventListener('click', async function(e) {
-        if (e.target.closest('.download-btn')) {
-            const button = e.target.closest('.download-btn');
-            const fileUrl = button.getAttribute('data-url');
-            const fileName = button.getAttribute('data-filename');
+    // Downloads are plain links (served by /files/ with Content-Disposition), so the browser streams them to disk
+    document.addEventListener('click', function(e) {
+        const link = e.target.closest('a.download-btn');
+        if (link) {
             const message = document.createElement('p');
             message.textContent = '📥 Download Started...';
             message.style.color = 'green';
             message.style.fontWeight = 'bold';
-            button.parentNode.appendChild(message);
+            link.parentNode.appendChild(message);
             setTimeout(() => message.remove(), 3000);
-
-
-            try {
-                const response = await fetch(fileUrl);
-                const blob = await response.blob();
-
-                // Create a download link
-                const link = document.createElement('a');
-                link.href = URL.createObjectURL(blob);
-                link.download = fileName; // Forces the correct filename
-                document.body.appendChild(link);
-                link.click();
-                document.body.removeChild(link);
-
-                // Free up memory
-                URL.revokeObjectURL(link.href);
-            } catch (error) {
-                console.error("Download failed:", error);
-            }
         }
     });
 
@@ -20,6 +20,25 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
+        const items = Array.from(files).map(file => ({ file, kind: 'pdf' }));
+        directUploadMany(items, (done, total) => {
+            fileList.innerHTML = `<p>Uploaded ${done} of ${total} file(s)...</p>`;
+        })
+        .then(results => {
+            loader.style.display = "none";
+            const failed = results.filter(r => !r.ok);
+            const uploaded = results.length - failed.length;
+            fileList.innerHTML = `<p style="color: green;">${uploaded} of ${results.length} file(s) uploaded</p>` +
+                failed.map(r => `<p style="color: red;">${r.error}</p>`).join('');
+        })
+        .catch(error => {
+            // Direct uploads are off or unreachable; send the files through the server instead
+            console.warn(`Direct upload unavailable (${error.message}); using /api/batchUpload/`);
+            uploadThroughServer(files);
+        });
+    })
+
+    function uploadThroughServer(files) {
         let formData = new FormData();
         for (let i = 0; i < files.length; i++) {
             formData.append("files", files[i]); // Append each file
@@ -31,6 +50,10 @@ document.addEventListener('DOMContentLoaded', () => {
         })
         .then(response => response.json())
         .then(data => {
+            if (data.status_url) {
+                pollUploadJob(data.status_url);
+                return;
+            }
             loader.style.display="none"
             // console.log(data);
             fileList.innerHTML=`<p style="color: green;">${data.message}</p>`
@@ -42,7 +65,27 @@ document.addEventListener('DOMContentLoaded', () => {
             //         `<p style="color: red;">Error uploading files</p>`;
             // }
         })
-    })
+    }
+
+    // Batch uploads are processed in the background; poll until the job finishes
+    function pollUploadJob(statusUrl) {
+        fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'queued' || job.status === 'running') {
+                fileList.innerHTML = `<p>Processing ${job.processed} of ${job.total} file(s)...</p>`;
+                setTimeout(() => pollUploadJob(statusUrl), 2000);
+                return;
+            }
+            loader.style.display = "none";
+            if (job.status === 'done') {
+                fileList.innerHTML = `<p style="color: green;">${job.result.message}</p>`;
+            } else {
+                fileList.innerHTML = `<p style="color: red;">Upload failed: ${job.error}</p>`;
+            }
+        })
+        .catch(() => setTimeout(() => pollUploadJob(statusUrl), 5000));
+    }
 
     //Temp Disable Single File Upload
     singleUploadForm.classList.remove('active');
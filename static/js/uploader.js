@@ -249,6 +249,7 @@ document.addEventListener('DOMContentLoaded', () => {
     async function handleUpload() {
         const uploadItems = uploadItemsContainer.querySelectorAll('.upload-item');
         const formData = new FormData();
+        const directItems = []; // Same files, for uploading straight to storage
         let isValid = true;
         let fileCountTotal = 0;
         const unitsProcessed = new Set(); // To check for duplicate unit codes
@@ -326,11 +327,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 const formDataKey = `files_${sanitizedUnitCode}`;
                 console.log(`${unitLabel}: Adding ${files.length} files under key "${formDataKey}"`);
                 
-                for (const file of files) {
-                    formData.append(formDataKey, file);
-                    fileCountTotal++;
-                }
-
                 // Add metadata
                 const titleInput = item.querySelector('.unit-title');
                 let metadata = {
@@ -339,6 +335,12 @@ document.addEventListener('DOMContentLoaded', () => {
                     year: yearValue,
                     semester: semesterValue
                 };
+
+                for (const file of files) {
+                    formData.append(formDataKey, file);
+                    directItems.push({ file, kind: 'exam', unitCode, metadata });
+                    fileCountTotal++;
+                }
                 formData.append(`metadata_${sanitizedUnitCode}`, JSON.stringify(metadata));
             }
         });
@@ -364,32 +366,58 @@ document.addEventListener('DOMContentLoaded', () => {
         progressText.textContent = `Uploading ${fileCountTotal} file(s)... 0%`;
 
         try {
-            // Simulate progress
-            progressBarFill.style.width = '25%';
-
-            // Removed CSRF token check as per request
-            const response = await fetch('/api/exam_papers/', { 
-                method: 'POST',
-                body: formData
-            });
+            let uploadedDirectly = true;
+            try {
+                const results = await directUploadMany(directItems, (done, total) => {
+                    progressBarFill.style.width = `${Math.round(done / total * 100)}%`;
+                    progressText.textContent = `Uploading ${fileCountTotal} file(s)... ${done} of ${total} done`;
+                });
+                const failed = results.filter(r => !r.ok);
+                if (failed.length) {
+                    throw new Error(`${failed.length} of ${results.length} file(s) failed: ${failed.map(r => r.error).join('; ')}`);
+                }
+            } catch (error) {
+                if (!error.signFailed) throw error;
+                // Direct uploads are off or unreachable; send the files through the server instead
+                console.warn(`Direct upload unavailable (${error.message}); using /api/exam_papers/`);
+                uploadedDirectly = false;
+            }
 
-            progressBarFill.style.width = '75%';
+            if (!uploadedDirectly) {
+                // Simulate progress
+                progressBarFill.style.width = '25%';
+
+                // Removed CSRF token check as per request
+                const response = await fetch('/api/exam_papers/', { 
+                    method: 'POST',
+                    body: formData
+                });
+
+                progressBarFill.style.width = '75%';
+
+                if (!response.ok) {
+                    let errorData;
+                    try {
+                        errorData = await response.json();
+                    } catch (e) {
+                        errorData = { message: `Upload failed with status: ${response.status} ${response.statusText}` };
+                    }
+                    throw new Error(errorData.message || 'Unknown upload error');
+                }
 
-            if (!response.ok) {
-                let errorData;
-                try {
-                    errorData = await response.json();
-                } catch (e) {
-                    errorData = { message: `Upload failed with status: ${response.status} ${response.statusText}` };
+                const data = await response.json();
+                if (response.status === 202) {
+                    // Queued for the upload worker; only its result says whether the files were stored
+                    progressText.textContent = `Processing ${fileCountTotal} file(s)...`;
+                    console.log('Upload successful:', await waitForUploadJob(data.status_url));
+                } else {
+                    console.log('Upload successful:', data);
                 }
-                throw new Error(errorData.message || 'Unknown upload error');
             }
 
             // --- Handle Success ---
             progressBarFill.style.width = '100%';
             progressText.textContent = 'Upload Complete!';
-            const data = await response.json();
-            console.log('Upload successful:', data);
 
             // Hide form/progress, show success message
             uploadItemsContainer.style.display = 'none';
@@ -1,7 +1,182 @@
+// Rendered by core.views.service_worker; CACHE_VERSION changes with every deploy that changes the app shell.
+const CACHE_VERSION = '{{ cache_version }}';
+const SHELL_CACHE = `shell-${CACHE_VERSION}`;
+const API_CACHE = `api-${CACHE_VERSION}`;
+// A PDF's content never changes, so opened PDFs and their page images outlive deploys
+const PDF_CACHE = 'pdfs-v1';
+const PDF_CACHE_MAX_BYTES = {{ pdf_cache_max_bytes }};
+// Cached catalog responses younger than this are served without asking the server at all
+const API_REVALIDATE_AFTER_MS = {{ api_revalidate_after }} * 1000;
+const PRECACHE_URLS = {{ precache_urls|safe }};
+// Third-party scripts the reader needs offline; a CDN outage must not block installing the worker
+const CDN_URLS = {{ cdn_urls|safe }};
+const STATIC_URL = '{{ static_url }}';
+
+const CATALOG_API = [/^\/api\/units\/$/, /^\/api\/unit\/\d+\/$/, /^\/api\/unit\/\d+\/pdfs\/$/];
+const PAGE_IMAGE_API = /^\/api\/pdf\/\d+\/(page\/\d+|preview)\/$/;
+const FILE_PROXY = /^\/files\/\d+$/;
+const SIZE_HEADER = 'X-SW-Size';
+const FETCHED_HEADER = 'X-SW-Fetched';
+
 self.addEventListener('install', (event) => {
-    console.log('Service Worker installed');
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS)
+                .then(() => Promise.all(CDN_URLS.map(url => cache.add(url).catch(() => {})))))
+            .then(() => self.skipWaiting())
+    );
 });
 
 self.addEventListener('activate', (event) => {
-    console.log('Service Worker activated');
+    const keep = new Set([SHELL_CACHE, API_CACHE, PDF_CACHE]);
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => !keep.has(name)).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
 });
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (CDN_URLS.includes(url.href)) event.respondWith(cacheFirst(request));
+        else if (url.pathname.toLowerCase().endsWith('.pdf')) event.respondWith(pdfResponse(event, request));
+        return;
+    }
+    // Unit bundles are large one-off downloads; let the browser stream them directly
+    if (url.pathname === '/sw.js' || url.pathname.endsWith('/bundle.zip')) return;
+    if (CATALOG_API.some(pattern => pattern.test(url.pathname))) {
+        event.respondWith(staleWhileRevalidate(event, request));
+    } else if (PAGE_IMAGE_API.test(url.pathname) || (FILE_PROXY.test(url.pathname) && !url.search)) {
+        event.respondWith(pdfResponse(event, request));
+    } else if (url.pathname.startsWith(STATIC_URL) || request.mode === 'navigate') {
+        event.respondWith(cacheFirst(request));
+    }
+});
+
+// App shell: static files and pages come from the precache, ignoring query strings
+// such as ?unitId= that only the page's script reads.
+async function cacheFirst(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(request, { ignoreSearch: true });
+    if (cached) return cached;
+    return fetch(request);
+}
+
+function withHeader(response, name, value, body) {
+    const headers = new Headers(response.headers);
+    headers.set(name, value);
+    return new Response(body, { status: response.status, statusText: response.statusText, headers });
+}
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await caches.open(API_CACHE);
+    const cached = await cache.match(request);
+    const revalidate = fetch(request).then(async response => {
+        if (response.ok) {
+            await cache.put(request, withHeader(response, FETCHED_HEADER, String(Date.now()), await response.clone().blob()));
+        }
+        return response;
+    });
+    if (!cached) return revalidate;
+    const fetchedAt = Number(cached.headers.get(FETCHED_HEADER)) || 0;
+    if (Date.now() - fetchedAt > API_REVALIDATE_AFTER_MS) {
+        event.waitUntil(revalidate.catch(() => {}));
+    }
+    return cached;
+}
+
+// PDFs and rendered pages: served from the cache when present (slicing it for pdf.js
+// range requests), otherwise fetched and handed to the page as it streams in. Only a
+// full response the page reads to the end is cached; pdf.js range loading stays
+// range-only rather than the worker downloading the rest of the file behind it.
+async function pdfResponse(event, request) {
+    const cache = await caches.open(PDF_CACHE);
+    const cached = await cache.match(request.url);
+    const range = request.headers.get('Range');
+    if (cached) return range ? rangeResponse(cached, range) : cached;
+
+    const response = await fetch(request);
+    const length = Number(response.headers.get('Content-Length'));
+    // Files known to be too big are never buffered for the cache
+    if (range || response.status !== 200 || !response.body || length > PDF_CACHE_MAX_BYTES) return response;
+    return cacheWhenRead(event, cache, request.url, response);
+}
+
+// Hands the body to the page chunk by chunk, keeping a copy of what it has read. The
+// copy is cached when the page reaches the end and dropped if it cancels the download.
+function cacheWhenRead(event, cache, key, response) {
+    const reader = response.body.getReader();
+    let chunks = [];
+    let size = 0;
+    let finish;
+    const finished = new Promise(resolve => { finish = resolve; });
+    const body = new ReadableStream({
+        async pull(controller) {
+            let result;
+            try {
+                result = await reader.read();
+            } catch (err) {
+                finish(false);
+                controller.error(err);
+                return;
+            }
+            if (result.done) {
+                finish(true);
+                controller.close();
+                return;
+            }
+            size += result.value.byteLength;
+            if (size <= PDF_CACHE_MAX_BYTES) chunks.push(result.value);
+            else chunks = [];
+            controller.enqueue(result.value);
+        },
+        cancel(reason) {
+            finish(false);
+            return reader.cancel(reason);
+        }
+    });
+    event.waitUntil(finished.then(async complete => {
+        if (!complete || size > PDF_CACHE_MAX_BYTES) return;
+        await cache.put(key, withHeader(response, SIZE_HEADER, String(size), new Blob(chunks)));
+        await trimPdfCache(cache);
+    }).catch(() => {}));
+    return new Response(body, { status: response.status, statusText: response.statusText, headers: response.headers });
+}
+
+async function rangeResponse(cached, range) {
+    const body = await cached.blob();
+    const match = /bytes=(\d*)-(\d*)/.exec(range);
+    if (!match || (!match[1] && !match[2])) return cached;
+    const start = match[1] ? Number(match[1]) : Math.max(0, body.size - Number(match[2]));
+    const end = match[1] && match[2] ? Math.min(Number(match[2]), body.size - 1) : body.size - 1;
+    if (start >= body.size) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${body.size}` } });
+    }
+    return new Response(body.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Content-Type': cached.headers.get('Content-Type') || 'application/pdf',
+            'Content-Length': String(end - start + 1),
+            'Content-Range': `bytes ${start}-${end}/${body.size}`,
+            'Accept-Ranges': 'bytes'
+        }
+    });
+}
+
+// Cache keys come back in insertion order, so the oldest entries are dropped first
+async function trimPdfCache(cache) {
+    const requests = await cache.keys();
+    const sizes = await Promise.all(requests.map(async key => {
+        const response = await cache.match(key);
+        return Number(response && response.headers.get(SIZE_HEADER)) || 0;
+    }));
+    let total = sizes.reduce((sum, size) => sum + size, 0);
+    for (let i = 0; i < requests.length && total > PDF_CACHE_MAX_BYTES; i++) {
+        await cache.delete(requests[i]);
+        total -= sizes[i];
+    }
+}